@@ -0,0 +1,143 @@
+# this file maintains the summary tables behind the analytics endpoints (see models.py): the findings of each
+# vulnerability type per day, and the reports and findings of each contract.
+# upload_report and delete_report apply the counts of a report in their own transaction, so the summary is always
+# consistent with the reports and reading it never scans the results.
+# the summary can be recomputed from the results when needed (e.g. after restoring a backup):
+# python -m analytics rebuild (from the backend folder)
+
+import argparse
+from collections import Counter
+from datetime import date
+from sqlalchemy import case, delete, distinct, func, insert, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+from models import Report, Result, Vulnerability, VulnerabilityStat, ContractStat
+
+# impact of the findings counted as high impact findings of a contract
+HIGH_IMPACT = "High"
+
+# INSERT statements with an "add to the existing row" clause of the supported databases
+UPSERTS = {
+    "mysql": mysql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+# add the counts of each row to the summary row with the same key, creating the rows that do not exist yet
+# a single statement per table, so concurrent workers can update the same rows without losing counts
+def add_counts(db: Session, model, rows: list):
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key]
+    counts = [name for name in rows[0] if name not in keys]
+    # always update the rows in the same order so that concurrent transactions do not deadlock
+    rows = sorted(rows, key=lambda row: tuple(row[key] for key in keys))
+
+    dialect = db.get_bind().dialect.name
+    statement = UPSERTS[dialect](table)
+    if dialect == "mysql":
+        statement = statement.on_duplicate_key_update({name: table.c[name] + statement.inserted[name] for name in counts})
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=keys, set_={name: table.c[name] + statement.excluded[name] for name in counts}
+        )
+    db.execute(statement, rows)
+
+
+# the summary rows of a report: findings of each vulnerability type on its day, and its contract counts
+# findings is a list of (vulnerability_id, impact), one per result of the report
+def report_counts(contract_name: str, day: date, findings: list, sign: int = 1):
+    by_type = Counter(vulnerability_id for vulnerability_id, _ in findings)
+    vulnerability_rows = [
+        {"day": day, "vulnerability_id": vulnerability_id, "findings": sign * count, "reports": sign}
+        for vulnerability_id, count in by_type.items()
+    ]
+    contract_row = {
+        "contract_name": contract_name or "",
+        "reports": sign,
+        "findings": sign * len(findings),
+        "high_impact_findings": sign * sum(1 for _, impact in findings if impact == HIGH_IMPACT),
+    }
+    return vulnerability_rows, contract_row
+
+
+# add an uploaded report to the summary, in the transaction of the upload
+def add_report(db: Session, contract_name: str, day: date, findings: list):
+    vulnerability_rows, contract_row = report_counts(contract_name, day, findings)
+    add_counts(db, VulnerabilityStat, vulnerability_rows)
+    add_counts(db, ContractStat, [contract_row])
+
+
+# remove a report from the summary before deleting it, in the transaction of the deletion
+def remove_report(db: Session, report: Report):
+    findings = (
+        db.query(Result.vulnerability_id, Vulnerability.impact)
+        .join(Vulnerability, Result.vulnerability_id == Vulnerability.vulnerability_id)
+        .filter(Result.report_id == report.report_id)
+        .all()
+    )
+    vulnerability_rows, contract_row = report_counts(report.contract_name, report.submission_date, findings, sign=-1)
+    add_counts(db, VulnerabilityStat, vulnerability_rows)
+    add_counts(db, ContractStat, [contract_row])
+
+    # drop the rows that no longer count any report
+    db.execute(delete(VulnerabilityStat).where(
+        VulnerabilityStat.day == report.submission_date, VulnerabilityStat.reports <= 0
+    ))
+    db.execute(delete(ContractStat).where(
+        ContractStat.contract_name == contract_row["contract_name"], ContractStat.reports <= 0
+    ))
+
+
+# recompute the whole summary from the reports and results, in a single transaction
+def rebuild(db: Session):
+    db.execute(delete(VulnerabilityStat))
+    db.execute(delete(ContractStat))
+
+    db.execute(insert(VulnerabilityStat).from_select(
+        ["day", "vulnerability_id", "findings", "reports"],
+        select(
+            Report.submission_date,
+            Result.vulnerability_id,
+            func.count(Result.result_id),
+            func.count(distinct(Result.report_id)),
+        )
+        .join(Result, Result.report_id == Report.report_id)
+        .where(Result.vulnerability_id.isnot(None))
+        .group_by(Report.submission_date, Result.vulnerability_id),
+    ))
+
+    # reports without any result count as reports of their contract too
+    db.execute(insert(ContractStat).from_select(
+        ["contract_name", "reports", "findings", "high_impact_findings"],
+        select(
+            func.coalesce(Report.contract_name, ""),
+            func.count(distinct(Report.report_id)),
+            func.count(Result.result_id),
+            func.coalesce(func.sum(case((Vulnerability.impact == HIGH_IMPACT, 1), else_=0)), 0),
+        )
+        .outerjoin(Result, Result.report_id == Report.report_id)
+        .outerjoin(Vulnerability, Result.vulnerability_id == Vulnerability.vulnerability_id)
+        .group_by(func.coalesce(Report.contract_name, "")),
+    ))
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of the analytics summary tables.")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute the summary from the results")
+    parser.parse_args()
+
+    import database # not at the top, so that crud.py can use this module without connecting to the database
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+    print("analytics summary rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# micro-benchmarks of the backend, run from the backend folder e.g., python -m benchmarks.bench_detector_catalog
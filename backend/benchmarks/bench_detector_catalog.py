@@ -0,0 +1,78 @@
+# micro-benchmark comparing the per-call wiki lookup (read the file + regexp search for every call)
+# with the parsed detector catalog, for the lookups done by filter_report on a report.
+# usage (from the backend folder): python -m benchmarks.bench_detector_catalog [number_of_vulnerabilities]
+
+import re
+import sys
+import time
+import config
+from detector_catalog import DetectorCatalog
+
+
+# previous implementation of services.find_recommendation, kept here as the baseline
+def legacy_find_recommendation(check_name: str):
+    with open(config.DETECTOR_DOCUMENT_PATH, 'r') as f:
+        file_content = f.read()
+    pattern = re.compile(
+        fr'##\s.*?###\sConfiguration\n\* Check: `{check_name}`.*?###\sRecommendation\n(?P<recommendation>.*?)(?=\n##\s|\Z)',
+        re.DOTALL
+    )
+    match = re.search(pattern, file_content)
+    if match:
+        return match.group('recommendation').strip()
+    return f'Recommendation not found for: {check_name}'
+
+
+# previous implementation of services.find_description, kept here as the baseline
+def legacy_find_description(check_name: str):
+    with open(config.DETECTOR_DOCUMENT_PATH, 'r') as f:
+        file_content = f.read()
+    pattern = re.compile(
+        fr'##\s.*?###\sConfiguration\n\* Check: `{check_name}`.*?###\sDescription\n(?P<description>.*?)(?=\n###\sExploit Scenario:|\n##|$)',
+        re.DOTALL
+    )
+    match = re.search(pattern, file_content)
+    if match:
+        return match.group('description').strip()
+    return f'Description not found for check: {check_name}'
+
+
+# time the lookups of the description and recommendation of every check name, return the elapsed seconds
+def run(lookup_description, lookup_recommendation, check_names):
+    start = time.perf_counter()
+    for check_name in check_names:
+        lookup_description(check_name)
+        lookup_recommendation(check_name)
+    return time.perf_counter() - start
+
+
+def main():
+    number_of_vulnerabilities = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+
+    # a report with the given number of vulnerability types, spread over the whole wiki
+    catalog = DetectorCatalog(config.DETECTOR_DOCUMENT_PATH)
+    documented = [detector["check"] for detector in catalog.all()]
+    check_names = [documented[i % len(documented)] for i in range(number_of_vulnerabilities)]
+
+    # both implementations must return the same text for every documented check
+    # (the legacy regexp stops a description at "####" sub-headings, the catalog keeps them)
+    for check_name in documented:
+        detector = catalog.get(check_name)
+        assert detector["description"].startswith(legacy_find_description(check_name)), check_name
+        assert detector["recommendation"] == legacy_find_recommendation(check_name), check_name
+
+    legacy = run(legacy_find_description, legacy_find_recommendation, check_names)
+
+    # cold: parse the wiki on the first lookup, warm: the catalog is already loaded
+    cold_catalog = DetectorCatalog(config.DETECTOR_DOCUMENT_PATH)
+    cold = run(lambda c: cold_catalog.get(c)["description"], lambda c: cold_catalog.get(c)["recommendation"], check_names)
+    warm = run(lambda c: cold_catalog.get(c)["description"], lambda c: cold_catalog.get(c)["recommendation"], check_names)
+
+    print(f"{number_of_vulnerabilities} vulnerabilities, {2 * number_of_vulnerabilities} lookups")
+    print(f"legacy per-call lookup: {legacy * 1000:10.2f} ms")
+    print(f"catalog (cold, parses): {cold * 1000:10.2f} ms")
+    print(f"catalog (warm):         {warm * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
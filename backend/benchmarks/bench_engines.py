@@ -0,0 +1,56 @@
+# benchmark comparing the latency of a cold analysis with the slither command line (one new process per upload)
+# and of a warm analysis with the Slither API loaded once, as in the analysis workers (see engines.py).
+# usage (from the backend folder): python -m benchmarks.bench_engines [folder_of_sol_files]
+# requires slither-analyzer and solc-select, the compilers of the contracts are installed before timing.
+
+import glob
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import compilers
+import services
+from engines import CliEngine, SlitherApiEngine
+
+REPEAT = 3
+DEFAULT_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..", "test_sol_files")
+
+
+# median latency in milliseconds of analysing a contract, each run in a fresh copy of the contract
+def measure(engine, contract_path: str, solidity_version: str):
+    timings = []
+    for _ in range(REPEAT):
+        with tempfile.TemporaryDirectory() as work_dir:
+            file_path = shutil.copy(contract_path, work_dir)
+            start = time.perf_counter()
+            engine.analyze(file_path, solidity_version, work_dir)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FOLDER
+    contracts = []
+    for contract_path in sorted(glob.glob(os.path.join(folder, "*.sol"))):
+        solidity_version = services.extract_solidity_version([contract_path])
+        compilers.compiler_manager.solc_path(solidity_version) # install the compiler before timing
+        contracts.append((contract_path, solidity_version))
+
+    # loading the API engine is what the warm workers pay once, at startup
+    warm = SlitherApiEngine()
+    start = time.perf_counter()
+    warm.load()
+    print(f"Slither API loaded once per worker in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    cold = CliEngine()
+    print(f"{'contract':24} {'cold cli (ms)':>14} {'warm api (ms)':>14} {'speed-up':>9}")
+    for contract_path, solidity_version in contracts:
+        cold_ms = measure(cold, contract_path, solidity_version)
+        warm_ms = measure(warm, contract_path, solidity_version)
+        print(f"{os.path.basename(contract_path):24} {cold_ms:>14.2f} {warm_ms:>14.2f} {cold_ms / warm_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# benchmark of each stage of the audit pipeline on its own, on synthetic Slither outputs:
+# filtering the JSON report, looking up the detector descriptions/recommendations, storing the report and reading it.
+# usage (from the backend folder): python -m benchmarks.bench_pipeline [--results 1000] [--database-url URL]
+# results are printed and saved as JSON (see benchmarks/stats.py), e.g. to compare two commits.
+
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import crud
+import search
+import services
+from detector_catalog import catalog
+from models import Base
+from benchmarks import stats
+from synthetic import generate_findings, write_json_report
+
+
+# report data as produced by the pipeline from the given findings
+def make_report_data(filtered_report: list):
+    return {
+        "contract_name": "Bench.sol",
+        "submission_date": services.get_current_date(),
+        "submission_time": services.get_current_time(),
+        "number_of_vulnerabilities": None,
+        "vulnerabilities_details": filtered_report,
+    }
+
+
+def run(args, directory: str):
+    summaries = {}
+
+    # (4) filter the JSON report written by Slither
+    json_path = os.path.join(directory, "report.json")
+    write_json_report(generate_findings(args.results, args.detectors, "uploads/Bench.sol", seed=args.seed), json_path)
+    filtered_report = services.filter_report(json_path)
+    summaries["filter_report"] = stats.summarize(stats.time_calls(lambda: services.filter_report(json_path), args.repeat))
+
+    # description and recommendation of every known detector, as looked up for each vulnerability type
+    checks = [detector["check"] for detector in catalog.all()]
+    lookups = []
+    for _ in range(args.repeat):
+        for check in checks:
+            start = time.perf_counter()
+            services.find_description(check)
+            services.find_recommendation(check)
+            lookups.append(time.perf_counter() - start)
+    summaries["find_description"] = stats.summarize(lookups)
+
+    # (5) store the report, then read it back
+    url = args.database_url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    search.create_index(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    report_ids = []
+    uploads = []
+    for _ in range(args.repeat):
+        report_data = make_report_data(filtered_report)
+        start = time.perf_counter()
+        report_ids.append(crud.upload_report(session_factory(), report_data))
+        uploads.append(time.perf_counter() - start)
+    summaries["upload_report"] = stats.summarize(uploads)
+
+    # building the report from its rows, as done once per report to precompute its document
+    builds = []
+    for report_id in report_ids:
+        db = session_factory()
+        try:
+            start = time.perf_counter()
+            crud.build_report(db, report_id)
+            builds.append(time.perf_counter() - start)
+        finally:
+            db.close()
+    summaries["build_report"] = stats.summarize(builds)
+
+    # reading the stored document as GET /reports/{id} does, first from the database then from the memory cache
+    for name in ("get_report_document (db)", "get_report_document (cache)"):
+        if name.endswith("(db)"):
+            crud.report_document_cache.clear()
+        reads = []
+        for report_id in report_ids:
+            start = time.perf_counter()
+            crud.get_report_document(session_factory(), report_id)
+            reads.append(time.perf_counter() - start)
+        summaries[name] = stats.summarize(reads)
+
+    engine.dispose()
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the audit pipeline on synthetic reports.")
+    parser.add_argument("--results", type=int, default=1000, help="number of findings of the synthetic report")
+    parser.add_argument("--detectors", type=int, default=10, help="number of detectors the findings are spread over")
+    parser.add_argument("--repeat", type=int, default=20, help="number of measurements of each stage")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic report")
+    parser.add_argument("--database-url", help="SQLAlchemy URL of the database, a temporary SQLite file by default")
+    parser.add_argument("--output", help="JSON file of the results, in bench_results/ by default")
+    args = parser.parse_args()
+
+    catalog.load() # load the detector wiki before timing
+    with tempfile.TemporaryDirectory() as directory, stats.RssSampler() as rss:
+        summaries = run(args, directory)
+
+    stats.print_summaries(summaries)
+    print(f"peak RSS {rss.peak_mb:.1f} MiB")
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "database_url")}
+    parameters["database"] = (args.database_url or "sqlite").split(":")[0]
+    output = stats.save_results("pipeline", parameters, {"operations": summaries, "peak_rss_mb": rss.peak_mb}, args.output)
+    print(f"results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
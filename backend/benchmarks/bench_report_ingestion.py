@@ -0,0 +1,73 @@
+# benchmark comparing the legacy regexp parsing of Slither's --checklist markdown with the streaming parsing of
+# Slither's JSON output, on a synthetic report with thousands of findings.
+# usage (from the backend folder): python -m benchmarks.bench_report_ingestion [number_of_findings]
+
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import services
+from detector_catalog import catalog
+from synthetic import generate_reports
+
+
+# previous implementation of services.filter_report on the --checklist markdown, kept here as the baseline
+def legacy_filter_report(file_path: str):
+    with open(file_path, "r") as f:
+        md_content = f.read()
+    vulnerability_pattern = re.compile(
+        r"##\s*(?P<vulnerability_type>[\w-]+)\nImpact:\s*(?P<impact>\w+)\nConfidence:\s*(?P<confidence>\w+)(?P<results>[\s\S]+?)(?=\n##|$)"
+    )
+    result_pattern = re.compile(r'- \[ \] ID-(?P<id>\d+)\n(?P<description>.*?)(?=\nuploads/(?P<location>\S+)|$)', re.DOTALL)
+    vulnerabilities = []
+    for match in re.finditer(vulnerability_pattern, md_content):
+        result_dict = match.groupdict()
+        vulnerability_info = {
+            "vulnerability_type": result_dict["vulnerability_type"],
+            "impact": result_dict["impact"],
+            "confidence": result_dict["confidence"],
+            "description": services.find_description(result_dict["vulnerability_type"]),
+            "recommendation": services.find_recommendation(result_dict["vulnerability_type"]),
+            "results": [],
+        }
+        for result_match in re.finditer(result_pattern, result_dict["results"]):
+            result = result_match.groupdict()
+            vulnerability_info["results"].append({"description": result["description"].strip(), "location": result["location"]})
+        vulnerabilities.append(vulnerability_info)
+    return vulnerabilities
+
+
+# run the parser, return the elapsed seconds, the peak traced memory and the number of results found
+def measure(parse, file_path: str):
+    start = time.perf_counter()
+    vulnerabilities = parse(file_path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    parse(file_path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak, sum(len(v["results"]) for v in vulnerabilities)
+
+
+def main():
+    number_of_findings = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    catalog.load() # both parsers use the catalog, load it before timing
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path, md_path = generate_reports(number_of_findings, directory)
+        print(f"{number_of_findings} findings, checklist {os.path.getsize(md_path) // 1024} KiB, json {os.path.getsize(json_path) // 1024} KiB")
+
+        for name, parse, path in (
+            ("legacy checklist regexp", legacy_filter_report, md_path),
+            ("streaming JSON", services.filter_report, json_path),
+        ):
+            elapsed, peak, results = measure(parse, path)
+            print(f"{name:24} {elapsed * 1000:10.2f} ms  peak {peak / 1024 / 1024:7.2f} MiB  {results} results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# latency statistics, memory sampling and JSON results shared by the benchmarks, so that runs can be compared over time.
+
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from datetime import datetime
+import psutil
+
+# folder where the results are saved when no output file is given (relative to the current folder)
+RESULTS_DIR = "bench_results"
+
+
+# percentile of sorted values, interpolated between the two closest ranks
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+# summary of latencies given in seconds: count, mean and p50/p95/p99 in milliseconds
+# with the elapsed wall time of the whole run, the throughput in operations per second is added
+def summarize(timings: list, elapsed: float = None):
+    values = sorted(timing * 1000 for timing in timings)
+    summary = {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) if values else None,
+        "p50_ms": percentile(values, 0.50),
+        "p95_ms": percentile(values, 0.95),
+        "p99_ms": percentile(values, 0.99),
+        "max_ms": values[-1] if values else None,
+    }
+    if elapsed:
+        summary["throughput_per_s"] = len(values) / elapsed
+    return summary
+
+
+# time each call of fn over the given number of repetitions, returns the latencies in seconds
+def time_calls(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+class RssSampler:
+    """
+    Samples the resident memory (RSS) of a process and its children in a background thread, keeping the peak.
+    Use as a context manager around the measured work, then read peak_mb.
+    """
+
+    def __init__(self, pid: int = None, interval: float = 0.05):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    @property
+    def peak_mb(self):
+        return self.peak_bytes / 1024 / 1024
+
+    def sample(self):
+        rss = 0
+        for process in [self.process] + self.process.children(recursive=True):
+            try:
+                rss += process.memory_info().rss
+            except psutil.Error: # the process exited between listing and sampling it
+                pass
+        self.peak_bytes = max(self.peak_bytes, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+# commit of the measured code, to know what a saved run was measuring
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# save the results of a benchmark run as JSON with its parameters and environment, returns the file path
+def save_results(name: str, parameters: dict, results: dict, output: str = None):
+    started = datetime.now()
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{started:%Y%m%d-%H%M%S}.json")
+
+    document = {
+        "benchmark": name,
+        "timestamp": started.isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    return output
+
+
+# print one line per measured operation: latency percentiles and throughput
+def print_summaries(summaries: dict):
+    print(f"{'operation':28} {'count':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'ops/s':>9}")
+    for operation, summary in summaries.items():
+        throughput = summary.get("throughput_per_s")
+        print(
+            f"{operation:28} {summary['count']:>6} {summary['p50_ms']:>10.2f} {summary['p95_ms']:>10.2f} "
+            f"{summary['p99_ms']:>10.2f} " + (f"{throughput:>9.1f}" if throughput is not None else f"{'-':>9}")
+        )
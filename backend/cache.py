@@ -0,0 +1,269 @@
+# this file provides the on-disk caches of the backend.
+# DiskCache stores values as files with a small sqlite index (size, last access, cost, hit/miss counters), so that the
+# cache survives restarts and is shared by every worker process using the same directory.
+# two disk caches are used by the workers: the filtered reports of the analyses, and the compilation artifacts of the
+# contracts so that a new analysis of the same sources (other detectors, new Slither version, retry) skips solc.
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from importlib import metadata
+import config
+
+
+class DiskCache:
+    """
+    Size-bounded LRU cache of bytes values stored on disk.
+    The least recently used entries are evicted once the total size of the values exceeds max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._initialised = False
+
+    # open a connection to the index, sqlite takes care of locking between processes
+    def _connect(self):
+        if not self._initialised:
+            os.makedirs(self.directory, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30, isolation_level=None)
+        if not self._initialised:
+            connection.execute("PRAGMA journal_mode=WAL")
+            # cost is the number of seconds it took to compute the value, saved again by every hit
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, last_access REAL, cost REAL DEFAULT 0)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            # indexes created before entries had a cost
+            if "cost" not in [column[1] for column in connection.execute("PRAGMA table_info(entries)")]:
+                connection.execute("ALTER TABLE entries ADD COLUMN cost REAL DEFAULT 0")
+            self._initialised = True
+        return connection
+
+    # file holding the value of a key, the key is hashed so that any string can be used as a key
+    def _path(self, key: str):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    # increment one of the hit/miss/eviction/saved counters
+    @staticmethod
+    def _count(connection, name: str, amount: float = 1):
+        connection.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+            (name, amount, amount),
+        )
+
+    # get the value of a key, or None on a cache miss
+    def get(self, key: str):
+        connection = self._connect()
+        try:
+            value = None
+            entry = connection.execute("SELECT cost FROM entries WHERE key = ?", (key,)).fetchone()
+            if entry:
+                try:
+                    with open(self._path(key), "rb") as f:
+                        value = f.read()
+                    connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                except FileNotFoundError: # the file was removed behind our back, forget the entry
+                    connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count(connection, "misses" if value is None else "hits")
+            if value is not None:
+                # work not redone thanks to the hit: the bytes of the value and the time it took to compute them
+                self._count(connection, "bytes_saved", len(value))
+                self._count(connection, "seconds_saved", entry[0] or 0)
+            return value
+        finally:
+            connection.close()
+
+    # store the value of a key and evict the least recently used entries if the cache is full
+    # cost is the number of seconds it took to compute the value, reported as saved by the hits (see stats)
+    def set(self, key: str, value: bytes, cost: float = 0):
+        connection = self._connect()
+        try:
+            # write to a temporary file first and rename it, so that readers never see a partially written value
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, self._path(key))
+
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_access, cost) VALUES (?, ?, ?, ?)",
+                (key, len(value), time.time(), cost),
+            )
+            self._evict(connection)
+        finally:
+            connection.close()
+
+    # remove the least recently used entries until the total size is within max_bytes
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in connection.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._count(connection, "evictions")
+
+    # number of entries, total size, hit/miss counters and work saved by the hits of the cache
+    def stats(self):
+        connection = self._connect()
+        try:
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+        finally:
+            connection.close()
+
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+            "bytes_saved": counters.get("bytes_saved", 0),
+            "seconds_saved": counters.get("seconds_saved", 0),
+        }
+
+
+class MemoryLRUCache:
+    """
+    Thread-safe in-process LRU cache bounded by the total size of its values.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (value, size), least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    # get the value of a key and mark it as recently used, or None on a cache miss
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    # store the value of a key and evict the least recently used entries if the cache is full
+    def set(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    # remove a key from the cache e.g., when the cached object is deleted
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    # remove every entry e.g., to measure cold reads
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+
+# version of slither-analyzer installed, part of the analysis cache key as detectors change between versions
+@lru_cache(maxsize=None)
+def get_slither_version():
+    try:
+        return metadata.version("slither-analyzer")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+# cache of the filtered reports (vulnerability lists) of already analysed contracts
+analysis_cache = DiskCache(config.ANALYSIS_CACHE_DIR, config.ANALYSIS_CACHE_MAX_BYTES)
+
+
+# version of the format of the cached vulnerability lists, bumped when filter_report output changes
+ANALYSIS_FORMAT_VERSION = 2
+
+
+# key of an analysis: same sources analysed from the same target with the same compiler, Slither version and detectors
+# always give the same findings, which name the analysed files (e.g., source_file and location)
+# source_hash is the sha256 of the uploaded file, or of every file of a project unit (see projects.hash_unit)
+# the target is the path of the analysed file relative to the source root, as for compilation_cache_key
+# detectors are the check names run by the detector profile of the analysis, None when it runs every detector
+def analysis_cache_key(source_hash: str, target: str, solidity_version: str, detectors: list = None):
+    checks = "all" if detectors is None else hashlib.sha256(",".join(sorted(detectors)).encode()).hexdigest()[:16]
+    return (
+        f"{source_hash}:{target}:solc-{solidity_version}:slither-{get_slither_version()}"
+        f":detectors-{checks}:v{ANALYSIS_FORMAT_VERSION}"
+    )
+
+
+# get the cached vulnerability list of an analysis, or None if the contract has not been analysed yet
+def get_cached_analysis(key: str):
+    if not config.ANALYSIS_CACHE_ENABLED:
+        return None
+    value = analysis_cache.get(key)
+    return json.loads(zlib.decompress(value)) if value is not None else None
+
+
+# store the vulnerability list of an analysis in the cache, duration is the number of seconds the analysis took
+def cache_analysis(key: str, vulnerabilities: list, duration: float = 0):
+    if config.ANALYSIS_CACHE_ENABLED:
+        analysis_cache.set(key, zlib.compress(json.dumps(vulnerabilities).encode()), duration)
+
+
+# version of crytic-compile installed, part of the compilation cache key as the format of its artifacts may change
+@lru_cache(maxsize=None)
+def get_crytic_compile_version():
+    try:
+        return metadata.version("crytic-compile")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+# cache of the compilation artifacts (crytic-compile zip exports with the AST and bytecode of each contract)
+compilation_cache = DiskCache(config.COMPILATION_CACHE_DIR, config.COMPILATION_CACHE_MAX_BYTES)
+
+# caches of the backend by the name the GET /cache/stats endpoint knows them by
+DISK_CACHES = {
+    "analysis": analysis_cache,
+    "compilation": compilation_cache,
+}
+
+
+# key of a compilation: the same sources compiled from the same target with the same compiler give the same artifacts
+# the target is the path of the compiled file relative to the source root (the root file of a project unit)
+def compilation_cache_key(source_hash: str, target: str, solidity_version: str):
+    return f"{source_hash}:{target}:solc-{solidity_version}:crytic-compile-{get_crytic_compile_version()}"
+
+
+# get the cached artifacts of a compilation as the bytes of a crytic-compile zip export, or None
+def get_cached_compilation(key: str):
+    if not config.COMPILATION_CACHE_ENABLED:
+        return None
+    return compilation_cache.get(key)
+
+
+# store the artifacts of a compilation, duration is the number of seconds the compilation took
+def cache_compilation(key: str, artifacts: bytes, duration: float = 0):
+    if config.COMPILATION_CACHE_ENABLED:
+        compilation_cache.set(key, artifacts, duration)
@@ -0,0 +1,292 @@
+# this file manages the Solidity compilers (solc) used by Slither.
+# instead of switching the global compiler with "solc-select use", the binary of the requested version is resolved
+# and passed to Slither with --solc, so that concurrent analyses with different pragmas never interfere.
+# the version of an analysis is resolved from the "pragma solidity" constraints of all its files (npm semver ranges
+# e.g., ^0.8.0, >=0.6.2 <0.9.0, 0.7.x || 0.8.x): the newest installed compiler satisfying every constraint is used,
+# and a compiler is only installed when none of the installed ones does.
+
+import os
+import re
+import subprocess
+import threading
+import time
+from pathlib import Path
+import metrics
+
+try: # file locks to serialise installs between the worker processes, not available on Windows
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try: # folder where solc-select keeps the downloaded compilers
+    from solc_select.constants import ARTIFACTS_DIR
+except ImportError: # same location as solc-select computes it
+    ARTIFACTS_DIR = Path(os.environ.get("VIRTUAL_ENV", Path.home())).joinpath(".solc-select", "artifacts")
+
+# version pragmas of a source, and its comments which may contain pragmas that do not count
+PRAGMA_PATTERN = re.compile(r"\bpragma\s+solidity\s+([^;]+);")
+COMMENT_PATTERN = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+# one comparator of a range e.g., ^0.8.0, >= 0.6, 0.8.x
+COMPARATOR_PATTERN = re.compile(r"\s*(\^|~|>=|<=|>|<|=)?\s*v?(\d+|[xX*])(?:\.(\d+|[xX*]))?(?:\.(\d+|[xX*]))?\s*")
+HYPHEN_RANGE_PATTERN = re.compile(r"\s*(\S+)\s+-\s+(\S+)\s*")
+# seconds to wait for solc-select to list the versions it can install
+LIST_VERSIONS_TIMEOUT = 30
+# seconds before listing the versions again after solc-select could not list them e.g., without network
+LIST_VERSIONS_RETRY = 300
+# the solc releases for Linux known when this file was written, by minor version (first patch, last patch):
+# the candidates to install when solc-select can not list the installable versions
+KNOWN_RELEASES = {(0, 4): (10, 26), (0, 5): (0, 17), (0, 6): (0, 12), (0, 7): (0, 6), (0, 8): (0, 30)}
+KNOWN_VERSIONS = [
+    f"{major}.{minor}.{patch}" for (major, minor), (first, last) in KNOWN_RELEASES.items() for patch in range(first, last + 1)
+]
+
+
+def parse_version(version: str):
+    return tuple(int(part) for part in version.split("."))
+
+
+# the "pragma solidity" constraints of a source, with their whitespace normalised
+def pragma_constraints(source: str):
+    return [" ".join(constraint.split()) for constraint in PRAGMA_PATTERN.findall(COMMENT_PATTERN.sub("", source))]
+
+
+# a possibly partial version (x, 0.8, 0.8.x) as (major, minor, patch) with None for the missing parts
+def _partial_version(parts):
+    numbers = []
+    for part in parts:
+        if part is None or not part.isdigit():
+            break
+        numbers.append(int(part))
+    return tuple(numbers) + (None,) * (3 - len(numbers))
+
+
+# lowest version of a partial version, and the lowest version after it e.g., 0.8 -> (0.8.0, 0.9.0)
+def _bounds(version):
+    major, minor, patch = version
+    lower = (major or 0, minor or 0, patch or 0)
+    if major is None:
+        return lower, None
+    if minor is None:
+        return lower, (major + 1, 0, 0)
+    if patch is None:
+        return lower, (major, minor + 1, 0)
+    return lower, (major, minor, patch + 1)
+
+
+# comparisons (operator, version) equivalent to one comparator, with the operators >=, <, > and <=
+def _comparisons(operator: str, version):
+    lower, upper = _bounds(version)
+    major, minor, patch = version
+    if major is None: # *, x
+        return [(">=", lower)] if operator in ("", "=", ">=", "^", "~", "<=") else [("<", lower)]
+    if operator == "^":
+        if major > 0 or minor is None:
+            upper = (major + 1, 0, 0)
+        elif minor > 0 or patch is None:
+            upper = (0, minor + 1, 0)
+        return [(">=", lower), ("<", upper)]
+    if operator == "~":
+        return [(">=", lower), ("<", (major + 1, 0, 0) if minor is None else (major, minor + 1, 0))]
+    if operator == ">=":
+        return [(">=", lower)]
+    if operator == ">":
+        return [(">=", upper)]
+    if operator == "<":
+        return [("<", lower)]
+    if operator == "<=":
+        return [("<", upper)]
+    return [(">=", lower), ("<", upper)] # exact or partial version
+
+
+# a constraint as a list of alternative ranges (||), each a list of comparisons that must all hold
+# raises ValueError if the constraint is not a valid version range
+def parse_constraint(constraint: str):
+    alternatives = []
+    for alternative in constraint.split("||"):
+        hyphen = HYPHEN_RANGE_PATTERN.fullmatch(alternative)
+        if hyphen:
+            low, high = (_parse_comparators(side) for side in hyphen.groups())
+            if len(low) != 1 or len(high) != 1 or low[0][0] or high[0][0]:
+                raise ValueError(f"Invalid Solidity version range: {constraint}")
+            alternatives.append(_comparisons(">=", low[0][1]) + _comparisons("<=", high[0][1]))
+        else:
+            alternatives.append([
+                comparison for operator, version in _parse_comparators(alternative)
+                for comparison in _comparisons(operator, version)
+            ])
+    return alternatives
+
+
+# (operator, partial version) of each comparator of a range
+def _parse_comparators(text: str):
+    comparators = []
+    position = 0
+    while position < len(text):
+        match = COMPARATOR_PATTERN.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Invalid Solidity version range: {text.strip()}")
+        comparators.append((match.group(1) or "", _partial_version(match.groups()[1:])))
+        position = match.end()
+    if not comparators:
+        raise ValueError("Empty Solidity version range")
+    return comparators
+
+
+_OPERATORS = {
+    ">=": lambda version, bound: version >= bound,
+    ">": lambda version, bound: version > bound,
+    "<": lambda version, bound: version < bound,
+    "<=": lambda version, bound: version <= bound,
+}
+
+
+# whether a version satisfies a parsed constraint
+def satisfies(version: tuple, alternatives: list):
+    return any(all(_OPERATORS[operator](version, bound) for operator, bound in comparisons) for comparisons in alternatives)
+
+
+class CompilerManager:
+    """
+    Registry of the installed solc versions.
+    Installs are done once per version: concurrent requests for a missing version wait for the same install.
+    """
+
+    def __init__(self, artifacts_dir: Path):
+        self.artifacts_dir = Path(artifacts_dir)
+        self._installed = {} # version -> path of the solc binary
+        self._resolved = {} # sorted constraints -> resolved version, for the candidates in _resolved_candidates
+        self._resolved_candidates = None # installed and installable versions the resolutions were made from
+        self._available = None # versions solc-select can install, listed once
+        self._available_failed_at = None # time of the last failed listing, see available_versions
+        self._locks = {} # version -> lock serialising its install within this process
+        self._lock = threading.Lock()
+
+    # path of the solc binary of a version, if it is installed
+    def _find_binary(self, version: str):
+        # solc-select >= 1.0 uses artifacts/solc-x.y.z/solc-x.y.z, older releases artifacts/solc-x.y.z
+        for path in (self.artifacts_dir / f"solc-{version}" / f"solc-{version}", self.artifacts_dir / f"solc-{version}"):
+            if path.is_file():
+                return str(path)
+        return None
+
+    def _version_lock(self, version: str):
+        with self._lock:
+            return self._locks.setdefault(version, threading.Lock())
+
+    # versions already installed on this machine
+    def installed_versions(self):
+        if self.artifacts_dir.is_dir():
+            for entry in self.artifacts_dir.iterdir():
+                version = entry.name[len("solc-"):]
+                if entry.name.startswith("solc-") and version not in self._installed:
+                    binary = self._find_binary(version)
+                    if binary:
+                        self._installed[version] = binary
+        return sorted(self._installed)
+
+    # versions solc-select can install, an empty list if they can not be listed e.g., without network
+    # a failed listing is tried again after LIST_VERSIONS_RETRY seconds, not on every resolution
+    def available_versions(self):
+        if self._available is None:
+            if self._available_failed_at is not None and time.monotonic() - self._available_failed_at < LIST_VERSIONS_RETRY:
+                return []
+            try:
+                listing = subprocess.run(
+                    ["solc-select", "install"], check=True, capture_output=True, text=True, timeout=LIST_VERSIONS_TIMEOUT
+                ).stdout
+            except Exception as e:
+                print(f"Could not list the solc versions: {e}")
+                self._available_failed_at = time.monotonic()
+                return []
+            self._available = re.findall(r"^\s*(\d+\.\d+\.\d+)\s*$", listing, re.MULTILINE)
+        return self._available
+
+    # the newest compiler satisfying every constraint: an installed one if any, else one to install
+    # the resolution of each set of constraints is memoized until a version is installed (e.g., by prewarm or another
+    # worker) or the installable versions change, raises ValueError if no version satisfies them
+    def resolve_version(self, constraints: list):
+        key = tuple(sorted(set(constraints)))
+        installed, available = self.installed_versions(), self.available_versions()
+        with self._lock:
+            if self._resolved_candidates != (installed, available):
+                self._resolved = {}
+                self._resolved_candidates = (installed, available)
+            if key in self._resolved:
+                return self._resolved[key]
+
+        ranges = [parse_constraint(constraint) for constraint in key]
+
+        def newest(versions):
+            matching = [version for version in versions if all(satisfies(parse_version(version), r) for r in ranges)]
+            return max(matching, key=parse_version, default=None)
+
+        # without the list of installable versions, the known releases are the candidates
+        version = newest(installed) or newest(available or KNOWN_VERSIONS)
+        if version is None:
+            raise ValueError(f"No Solidity compiler satisfies {' and '.join(key)}")
+        with self._lock:
+            if self._resolved_candidates == (installed, available):
+                self._resolved[key] = version
+        return version
+
+    # get the path of the solc binary of a version, installing the version first if needed
+    def solc_path(self, version: str):
+        binary = self._installed.get(version) or self._find_binary(version)
+        if binary:
+            self._installed[version] = binary
+            return binary
+
+        # one install at a time per version: within this process with a lock, across processes with a file lock
+        with self._version_lock(version):
+            with self._install_lock(version):
+                # the version may have been installed while waiting for the lock
+                binary = self._find_binary(version)
+                if not binary:
+                    try:
+                        subprocess.run(["solc-select", "install", version], check=True, capture_output=True)
+                        binary = self._find_binary(version)
+                        if not binary:
+                            raise FileNotFoundError(f"solc {version} was not found after installing it")
+                    except Exception:
+                        metrics.inc(metrics.SOLC_INSTALLS, result="failure")
+                        raise
+                    metrics.inc(metrics.SOLC_INSTALLS, result="success")
+
+        self._installed[version] = binary
+        return binary
+
+    # install the given versions ahead of time e.g., at startup, so that the first uploads do not wait for downloads
+    def prewarm(self, versions):
+        for version in versions:
+            try:
+                self.solc_path(version)
+            except Exception as e:
+                print(f"Could not install solc {version}: {e}")
+
+    def _install_lock(self, version: str):
+        return _FileLock(self.artifacts_dir.parent / f".install-{version}.lock")
+
+
+class _FileLock:
+    """Exclusive lock on a file, shared by every process of the machine (no-op where fcntl is not available)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "w")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+# compiler registry shared by the services of this process
+compiler_manager = CompilerManager(ARTIFACTS_DIR)
@@ -0,0 +1,140 @@
+# this file defines the configurable settings of the backend application.
+# every setting can be overridden with an environment variable of the same name (e.g. in docker-compose.yaml)
+
+import os
+
+
+# read a boolean setting e.g., ANALYSIS_CACHE_ENABLED=false
+def _env_bool(name: str, default: bool):
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# folder to store the uploaded files of users and to process them using Slither (backend_uploads volume in docker)
+UPLOADS_DIR = os.environ.get("UPLOADS_DIR", "uploads")
+
+# every analysis runs in its own scratch folder inside this one, removed once its report is ingested
+WORK_DIR = os.environ.get("WORK_DIR", os.path.join(UPLOADS_DIR, "jobs"))
+
+# largest accepted contract upload, 5 MiB by default, and size of the chunks uploads are streamed to disk with
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 5 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 64 * 1024))
+
+# database of the reports, MySQL by default (mysql_db service of docker-compose.yaml)
+MYSQL_HOST = os.environ.get("MYSQL_HOST", "mysql_db")
+MYSQL_USER = os.environ.get("MYSQL_USER", "bong")
+MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD", "bong")
+MYSQL_DB = os.environ.get("MYSQL_DB", "audit")
+# a complete SQLAlchemy URL takes precedence over the MySQL settings e.g., sqlite:///audit.db for tests and benchmarks
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL", f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+)
+# URL of the async engine of the read endpoints, by default DATABASE_URL with the async driver (aiomysql or aiosqlite)
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", "")
+
+# connection pool of each process: connections kept open, extra connections allowed under load, seconds to wait for
+# a free connection, seconds after which a connection is replaced, and whether connections are checked before use
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+
+# number of worker processes that run the analysis pipeline, by default one per CPU core
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 1))
+
+# how the workers run Slither (see engines.py): "api" keeps Slither loaded in each worker, "cli" runs the slither command
+# and "stub" generates deterministic findings without Slither, for the benchmarks
+ANALYSIS_ENGINE = os.environ.get("ANALYSIS_ENGINE", "api")
+
+# findings generated by the "stub" engine, a deterministic stand-in for Slither used by the benchmarks
+STUB_FINDINGS = int(os.environ.get("STUB_FINDINGS", 100))
+STUB_DETECTORS = int(os.environ.get("STUB_DETECTORS", 10))
+STUB_ANALYSIS_MS = int(os.environ.get("STUB_ANALYSIS_MS", 0))
+
+# workers are replaced by fresh ones after this number of jobs or once their memory (RSS) exceeds this number of MiB,
+# so that memory kept by Slither between analyses does not grow forever, 0 disables the limit
+ANALYSIS_WORKER_MAX_JOBS = int(os.environ.get("ANALYSIS_WORKER_MAX_JOBS", 200))
+ANALYSIS_WORKER_MAX_RSS_MB = int(os.environ.get("ANALYSIS_WORKER_MAX_RSS_MB", 1024))
+
+# a worker that stops before loading the engine (e.g., a broken Slither install) is started again after
+# WORKER_RESPAWN_DELAY seconds, doubled for each such worker in a row up to WORKER_RESPAWN_MAX_DELAY seconds
+WORKER_RESPAWN_DELAY = float(os.environ.get("WORKER_RESPAWN_DELAY", 1))
+WORKER_RESPAWN_MAX_DELAY = float(os.environ.get("WORKER_RESPAWN_MAX_DELAY", 60))
+
+# limits of a single analysis, checked every LIMITS_CHECK_INTERVAL seconds by the server: a job running longer than
+# ANALYSIS_TIMEOUT_SECONDS (wall clock) is "timed_out", a job using more CPU time or memory (RSS of the worker and its
+# processes e.g., slither and solc) than the other limits is "killed". The whole process group of the worker is killed
+# and the worker replaced. 0 disables a limit
+ANALYSIS_TIMEOUT_SECONDS = int(os.environ.get("ANALYSIS_TIMEOUT_SECONDS", 600))
+ANALYSIS_MAX_CPU_SECONDS = int(os.environ.get("ANALYSIS_MAX_CPU_SECONDS", 900))
+ANALYSIS_MAX_RSS_MB = int(os.environ.get("ANALYSIS_MAX_RSS_MB", 4096))
+LIMITS_CHECK_INTERVAL = float(os.environ.get("LIMITS_CHECK_INTERVAL", 1))
+
+# admission control: uploads are rejected with 429 (TOO_MANY_REQUESTS) once this number of jobs wait for a worker
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", 200))
+
+# number of finished (done/failed) jobs kept in memory so that clients can still query their status
+MAX_FINISHED_JOBS = int(os.environ.get("MAX_FINISHED_JOBS", 1000))
+
+# the slither wiki file that contains the description and recommendation of each detector (see detector_catalog.py)
+# this file is cloned from Slither github page: https://github.com/crytic/slither/wiki/Detector-Documentation
+DETECTOR_DOCUMENT_PATH = os.environ.get(
+    "DETECTOR_DOCUMENT_PATH", os.path.join(os.path.dirname(__file__), "slither.wiki", "Detector-Documentation.md")
+)
+
+# cache of analysis results keyed by source hash, Solidity version and Slither version (see cache.py)
+ANALYSIS_CACHE_ENABLED = _env_bool("ANALYSIS_CACHE_ENABLED", True)
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", os.path.join(UPLOADS_DIR, "cache", "analysis"))
+# least recently used results are evicted above this total size, 256 MiB by default
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# cache of the compilation artifacts of the analysed contracts (see cache.py), so that re-analysing the same sources
+# loads them instead of running solc again. Least recently used artifacts are evicted above COMPILATION_CACHE_MAX_BYTES
+COMPILATION_CACHE_ENABLED = _env_bool("COMPILATION_CACHE_ENABLED", True)
+COMPILATION_CACHE_DIR = os.environ.get("COMPILATION_CACHE_DIR", os.path.join(UPLOADS_DIR, "cache", "compilation"))
+COMPILATION_CACHE_MAX_BYTES = int(os.environ.get("COMPILATION_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Solidity versions installed in the background at startup, comma separated e.g., "0.8.4,0.8.19"
+SOLC_PREWARM_VERSIONS = [v.strip() for v in os.environ.get("SOLC_PREWARM_VERSIONS", "").split(",") if v.strip()]
+
+# total size of the compressed report documents kept in memory by the GET /reports/{id} cache, 64 MiB by default
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("REPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# seconds clients and proxies may cache the detector documentation served by GET /detectors, 1 hour by default
+DETECTOR_CATALOG_MAX_AGE = int(os.environ.get("DETECTOR_CATALOG_MAX_AGE", 3600))
+
+# limits of the batch/project uploads (see projects.py)
+MAX_PROJECT_FILES = int(os.environ.get("MAX_PROJECT_FILES", 500))
+MAX_PROJECT_BYTES = int(os.environ.get("MAX_PROJECT_BYTES", 50 * 1024 * 1024))
+
+# add a Server-Timing header with the duration of the request and of its database operations to every response,
+# a single request can also ask for it with the "X-Request-Timing: 1" header
+TIMING_HEADER_ENABLED = _env_bool("TIMING_HEADER_ENABLED", False)
+
+# secret enabling the sampling profiler for a single request sent with the "X-Profile: <token>" header,
+# the profiler is disabled when it is empty. Profiles are saved in PROFILES_DIR.
+PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN", "")
+PROFILES_DIR = os.environ.get("PROFILES_DIR", os.path.join(UPLOADS_DIR, "profiles"))
+
+# retention of the files and rows of the backend (see retention.py)
+# the raw Slither output of each analysed report is kept gzip compressed in RAW_OUTPUTS_DIR (GET /reports/{id}/raw),
+# and removed with its report, once older than RAW_OUTPUT_MAX_AGE_DAYS, or oldest first above RAW_OUTPUTS_MAX_BYTES
+RAW_OUTPUTS_ENABLED = _env_bool("RAW_OUTPUTS_ENABLED", True)
+RAW_OUTPUTS_DIR = os.environ.get("RAW_OUTPUTS_DIR", os.path.join(UPLOADS_DIR, "raw"))
+RAW_OUTPUT_MAX_AGE_DAYS = float(os.environ.get("RAW_OUTPUT_MAX_AGE_DAYS", 90))
+RAW_OUTPUTS_MAX_BYTES = int(os.environ.get("RAW_OUTPUTS_MAX_BYTES", 1024 * 1024 * 1024))
+# saved request profiles older than this are removed
+PROFILE_MAX_AGE_DAYS = float(os.environ.get("PROFILE_MAX_AGE_DAYS", 7))
+# scratch folders of jobs left behind e.g., by a crash of the server, are removed once older than this
+WORK_DIR_MAX_AGE_HOURS = float(os.environ.get("WORK_DIR_MAX_AGE_HOURS", 24))
+# reports older than this are deleted with their artifacts, 0 keeps reports forever
+REPORT_MAX_AGE_DAYS = float(os.environ.get("REPORT_MAX_AGE_DAYS", 0))
+# the retention task runs every RETENTION_INTERVAL_SECONDS (0 disables it) and deletes rows by batches of
+# RETENTION_BATCH_SIZE, each in its own short transaction, pausing RETENTION_BATCH_PAUSE seconds between batches
+RETENTION_INTERVAL_SECONDS = float(os.environ.get("RETENTION_INTERVAL_SECONDS", 3600))
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 500))
+RETENTION_BATCH_PAUSE = float(os.environ.get("RETENTION_BATCH_PAUSE", 0.1))
+
+# number of findings fetched from the database per round trip by the streaming exports (see exports.py),
+# each batch is written to the response before the next one is fetched
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
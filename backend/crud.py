@@ -1,14 +1,29 @@
 # this file contains functions that handle the CRUD operations (Create, Read, Update, Delete) for interacting with the database. 
 
+import base64
+import gzip
+import hashlib
+import json
+import re
+import timeit
+from sqlalchemy import distinct, func, insert, literal, select, tuple_
 from sqlalchemy.orm import Session, joinedload
-from models import Report, Vulnerability, Result
+from models import Report, Vulnerability, Result, ReportDocument, VulnerabilityStat, ContractStat
 from fastapi import HTTPException
-from datetime import datetime
+from datetime import datetime, date, time, timedelta
+from detector_catalog import DEFAULT_PROFILE
+import analytics
+import cache
+import config
+import metrics
+import search
 
 # define decorator that provides consistent error handling and cleanup for database operations.
+# the duration of each operation is recorded in the crud_duration_seconds metric (see metrics.py)
 def db_handler(func):
     # wrapper function to handle exceptions
     def wrapper(db: Session, *args, **kwargs):
+        start = timeit.default_timer()
         try:
             return func(db, *args, **kwargs)
         except HTTPException as e: # raise specific HTTPException if exists
@@ -19,11 +34,20 @@ def db_handler(func):
         finally:
             # ensure that the database is closed no matter what
             db.close()
+            metrics.observe_crud(func.__name__, timeit.default_timer() - start)
     return wrapper
 
-# upload the report to the database, this including adding data into all 3 tables: report, vulnerability, and report_vulnerability
+# process-level cache of vulnerability_type -> vulnerability_id, vulnerability rows are shared by all reports
+# and never change once created, so each worker only looks a type up by name once
+vulnerability_ids = {}
+
+# upload the report to the database, this including adding data into all 3 tables: report, vulnerability, and result
+# everything is written in a single transaction with batched inserts, so a failure never leaves a partial report
+# with incremental=True, the report is a new version of the latest report with the same contract name: the findings
+# unchanged since that version are copied by the database and only the new or changed findings are sent to it
+# (see copy_unchanged_results), both versions are kept so that they can be compared with get_report_diff
 @db_handler # use the decorator  defined above for error handling
-def upload_report(db: Session, report_data: dict):
+def upload_report(db: Session, report_data: dict, incremental: bool = False):
     # remove the vuln list to insert only report-related data to the db
     vulnerabilities_data = report_data.pop('vulnerabilities_details', [])
     # convert submission_date and submission_time to datetime object to insert into the db
@@ -38,103 +62,340 @@ def upload_report(db: Session, report_data: dict):
     number_of_vulnerabilities = len(vulnerabilities_data)
     # reassign number_of_vulnerabilities to the report
     report_data['number_of_vulnerabilities'] = number_of_vulnerabilities
+    report_data.setdefault('detector_profile', DEFAULT_PROFILE)
+
+    # the previous version of the contract, which cannot be deleted until the new version is committed
+    previous_report = latest_report(db, report_data['contract_name'], report_data['detector_profile']) if incremental else None
+
+    # add the report, flush to get its report_id without committing
+    report = Report(**report_data)
+    db.add(report)
+    db.flush()
+
+    # get the vuln_id of every vulnerability type, creating the types seen for the first time
+    vuln_ids, new_vuln_ids = resolve_vulnerability_ids(db, vulnerabilities_data)
+
+    # prepare every result of every vulnerability as a row of the Result table
+    result_rows = [
+        {
+            "description": result_data['description'],
+            "location": result_data['location'],
+            "source_file": result_data.get('source_file'),
+            "line_start": result_data.get('line_start'),
+            "line_end": result_data.get('line_end'),
+            "element_name": result_data.get('element_name'),
+            "fingerprint": finding_fingerprint(vuln_data['vulnerability_type'], result_data),
+            "report_id": report.report_id,
+            "vulnerability_id": vuln_ids[vuln_data['vulnerability_type']],
+        }
+        for vuln_data in vulnerabilities_data
+        for result_data in vuln_data.get('results', [])
+    ]
+
+    if previous_report is not None:
+        # only send the findings that are not in the previous version
+        result_rows = copy_unchanged_results(db, previous_report.report_id, report.report_id, result_rows)
+    if result_rows:
+        # insert all results with batched multi-row inserts
+        db.execute(insert(Result), result_rows)
+
+    # add the results to the full-text index
+    search.index_report(db, report.report_id)
+
+    # count the findings of the report in the analytics summary
+    analytics.add_report(db, report.contract_name, submission_date, [
+        (vuln_ids[vuln_data['vulnerability_type']], vuln_data['impact'])
+        for vuln_data in vulnerabilities_data
+        for _ in vuln_data.get('results', [])
+    ])
+
+    # the document returned by GET /reports/{id} is built once here, reports never change after upload
+    report_info = report_summary(report)
+    report_info["vulnerabilities_details"] = [
+        {
+            "vulnerability_type": vuln_data['vulnerability_type'],
+            "impact": vuln_data['impact'],
+            "confidence": vuln_data['confidence'],
+            "description": vuln_data['description'],
+            "recommendation": vuln_data['recommendation'],
+            "results": [result_info(result_data) for result_data in vuln_data.get('results', [])],
+        }
+        for vuln_data in vulnerabilities_data
+    ]
+    etag, content = serialize_report_document(report_info)
+    db.merge(ReportDocument(report_id=report.report_id, etag=etag, content=content))
+
+    # commit everything at once
+    db.commit()
+
+    # only remember the new vulnerability types once they are committed
+    vulnerability_ids.update(new_vuln_ids)
+
+    # return the report id
+    return report.report_id
+
+
+# the most recent report of a contract audited with the same detector profile, locked for share so that it is not
+# deleted while a new version is written from it, or None if the contract was never uploaded with this profile
+def latest_report(db: Session, contract_name: str, detector_profile: str):
+    return (
+        db.query(Report)
+        .filter(Report.contract_name == contract_name, Report.detector_profile == detector_profile)
+        .order_by(Report.submission_date.desc(), Report.submission_time.desc(), Report.report_id.desc())
+        .with_for_update(read=True)
+        .first()
+    )
+
+
+# the columns of a result that a finding of a new version must have unchanged to be copied from the previous version
+RESULT_FIELDS = (
+    "description", "location", "source_file", "line_start", "line_end", "element_name", "fingerprint", "vulnerability_id"
+)
+
+# copy to a new version of a report the findings of the previous version that did not change, with a single
+# INSERT ... SELECT run by the database: the findings of the new version are matched with the stored ones by
+# fingerprint, and a matched finding is copied if none of its columns changed e.g., it did not move
+# returns the rows of the new or changed findings, which are left to insert
+def copy_unchanged_results(db: Session, previous_report_id: int, report_id: int, result_rows: list):
+    stored = {}
+    rows = db.query(Result.result_id, *[getattr(Result, field) for field in RESULT_FIELDS]).filter(
+        Result.report_id == previous_report_id
+    )
+    for row in rows:
+        stored.setdefault(row.fingerprint, []).append(row)
+
+    unchanged_ids, changed_rows = [], []
+    for result_row in result_rows:
+        # a fingerprint can be found several times in a report, each stored finding matches one new finding
+        matches = stored.get(result_row["fingerprint"], [])
+        match = next((row for row in matches if all(getattr(row, f) == result_row[f] for f in RESULT_FIELDS)), None)
+        if match is None:
+            changed_rows.append(result_row)
+            continue
+        matches.remove(match)
+        unchanged_ids.append(match.result_id)
+
+    if unchanged_ids:
+        columns = [getattr(Result, field) for field in RESULT_FIELDS]
+        db.execute(
+            insert(Result).from_select(
+                [*RESULT_FIELDS, "report_id"],
+                select(*columns, literal(report_id)).where(Result.result_id.in_(unchanged_ids)).order_by(Result.result_id),
+            )
+        )
+    return changed_rows
+
+
+# line numbers in the descriptions of findings e.g., "Token.sol#L10-L12" or "Token.sol#10-12"
+LINE_NUMBERS = re.compile(r"#L?\d+(-L?\d+)?")
+
+# stable fingerprint of a finding: it does not depend on line numbers, so a finding keeps its fingerprint when code
+# above it changes in a new version of the contract
+def finding_fingerprint(vulnerability_type: str, result: dict):
+    description = " ".join(LINE_NUMBERS.sub("", result.get("description") or "").split())
+    parts = (vulnerability_type, result.get("source_file") or "", result.get("element_name") or "", description)
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
 
-    report = create_report(db, report_data) # save the report to the database
+# get the vulnerability_id of each vulnerability type of a report, using the process-level cache first, then one
+# query for the unknown types, and creating the types that are not in the database yet (without committing)
+# the types are unique: a type created at the same time by another worker is kept and its id selected instead
+# returns the ids of all types and the ids of the types that are not cached yet
+def resolve_vulnerability_ids(db: Session, vulnerabilities_data: list):
+    vuln_ids = {}
+    new_vuln_ids = {}
+    missing = set()
 
-    # iterate through each vulnerability
     for vuln_data in vulnerabilities_data:
-        # get the vulnerability type from each vuln in the list
-        vulnerability_type = vuln_data.get('vulnerability_type')
-        # query the database to see if the vulnerability already exists in Vulnerability table
-        existing_vuln = db.query(Vulnerability).filter(Vulnerability.vulnerability_type == vulnerability_type).first()
-
-        # if the vulnerability does not exist, create a new one, otherwise skip and get the vuln_id 
-        if existing_vuln:
-            vuln_id = existing_vuln.vulnerability_id
+        vulnerability_type = vuln_data['vulnerability_type']
+        if vulnerability_type in vulnerability_ids:
+            vuln_ids[vulnerability_type] = vulnerability_ids[vulnerability_type]
         else:
-            # copy() is called to ensure that the vuln_data remain the same after calling create_vulnerability
-            new_vuln = create_vulnerability(db, vuln_data.copy()) 
-            vuln_id = new_vuln.vulnerability_id # get the vuln_id from the new vuln
-        
-        # iterate through each result in the vulnerability
-        for result_data in vuln_data.get('results', []):
-            # save each result to the database
-            create_result(db, result_data, report.report_id, vuln_id)
-    
-    # return the report
-    return report.report_id
+            missing.add(vulnerability_type)
 
+    # the retention task deletes the types no result references anymore (see retention.compact): the cached ids are
+    # checked by primary key and share-locked until the results referencing them are committed
+    if vuln_ids:
+        found = {
+            vuln_id for (vuln_id,) in db.query(Vulnerability.vulnerability_id)
+            .filter(Vulnerability.vulnerability_id.in_(vuln_ids.values()))
+            .with_for_update(read=True)
+        }
+        for vulnerability_type, vuln_id in list(vuln_ids.items()):
+            if vuln_id not in found: # deleted since it was cached
+                del vuln_ids[vulnerability_type]
+                vulnerability_ids.pop(vulnerability_type, None)
+                missing.add(vulnerability_type)
 
-# Function to create a new report and save it to the database Report table
-@db_handler # use the decorator  defined above for error handling
-def create_report(db: Session, report_data: dict):
-    #  creates a new Report object using the report_data,
-    report = Report(**report_data)
-    # add the report to the database
-    db.add(report)
-    db.commit() # commit the changes
-    db.refresh(report) # refresh the database with the new report 
-    return report
+    if missing:
+        # query the database once for all the types that are not cached yet
+        existing = db.query(Vulnerability.vulnerability_type, Vulnerability.vulnerability_id).filter(
+            Vulnerability.vulnerability_type.in_(missing)
+        ).with_for_update(read=True)
+        new_vuln_ids.update({vulnerability_type: vuln_id for vulnerability_type, vuln_id in existing})
+
+        # create the vulnerability types that do not exist yet, skipping those inserted by a concurrent upload
+        # (which waits for it to commit), then select the ids of all of them
+        new_vulns = {
+            vuln_data['vulnerability_type']: {
+                "vulnerability_type": vuln_data['vulnerability_type'],
+                "impact": vuln_data['impact'],
+                "confidence": vuln_data['confidence'],
+                "description": vuln_data['description'],
+                "recommendation": vuln_data['recommendation'],
+            }
+            for vuln_data in vulnerabilities_data
+            if vuln_data['vulnerability_type'] in missing and vuln_data['vulnerability_type'] not in new_vuln_ids
+        }
+        if new_vulns:
+            db.execute(
+                insert(Vulnerability).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite"),
+                [new_vulns[vulnerability_type] for vulnerability_type in sorted(new_vulns)],
+            )
+            created = db.query(Vulnerability.vulnerability_type, Vulnerability.vulnerability_id).filter(
+                Vulnerability.vulnerability_type.in_(new_vulns)
+            ).with_for_update(read=True)
+            new_vuln_ids.update({vulnerability_type: vuln_id for vulnerability_type, vuln_id in created})
+
+        vuln_ids.update(new_vuln_ids)
+
+    return vuln_ids, new_vuln_ids
 
-# Function to save a new vulnerability to the database Vulnerability table
-@db_handler # use the decorator  defined above for error handling
-def create_vulnerability(db: Session, vuln_data: dict):
-    # remove the results list to insert vuln related data to the db
-    vuln_data.pop('results') 
-    # create a new Vulnerability object using the vuln_data
-    new_vuln = Vulnerability(**vuln_data)
-    # add the vuln to the database
-    db.add(new_vuln)
-    db.commit() # commit the changes
-    db.refresh(new_vuln) # refresh the database with the new vuln 
-    return new_vuln
 
+# the columns the report list can be sorted by, each followed by the submission date, time and report_id so that
+# every report has a unique position, in the order of the columns of an index of the reports table (see models.py)
+REPORT_SORT_KEYS = {
+    "submission_date": (Report.submission_date, Report.submission_time, Report.report_id),
+    "contract_name": (Report.contract_name, Report.submission_date, Report.submission_time, Report.report_id),
+    "number_of_vulnerabilities": (
+        Report.number_of_vulnerabilities, Report.submission_date, Report.submission_time, Report.report_id
+    ),
+}
 
-# Function to create a new result and save it to the database Result table
+# encode the position of the last report of a page in the given sort as an opaque cursor to get the next page
+def encode_cursor(sort_by: str, order: str, position: tuple):
+    values = [value.isoformat() if isinstance(value, (date, time)) else value for value in position]
+    return base64.urlsafe_b64encode(json.dumps([sort_by, order, values]).encode()).decode()
+
+# decode a cursor returned by get_all_reports back to the position of a report in the given sort
+def decode_cursor(cursor: str, sort_by: str, order: str):
+    try:
+        cursor_sort_by, cursor_order, values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        columns = REPORT_SORT_KEYS[sort_by]
+        if (cursor_sort_by, cursor_order) != (sort_by, order) or len(values) != len(columns):
+            raise ValueError("cursor of another sort")
+        parsers = {Report.submission_date: date.fromisoformat, Report.submission_time: time.fromisoformat}
+        return tuple(parsers.get(column, lambda value: value)(value) for column, value in zip(columns, values))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor. Please start again from the first page.")
+
+# function to retrieves a page of reports from the database, the most recent first by default
+# pages are read with keyset (cursor) pagination on the index of the sort (see REPORT_SORT_KEYS),
+# so getting a page costs the same no matter how many reports exist or how deep the page is
 @db_handler # use the decorator  defined above for error handling
-def create_result(db: Session, result_data: dict, report_id: int, vulnerability_id: int):
-    # creates a new Result object using the result data and the provided IDs
-    result = Result(
-        description=result_data['description'],
-        location=result_data['location'],
-        report_id=report_id,
-        vulnerability_id=vulnerability_id
+def get_all_reports(db: Session, limit: int = 50, cursor: str = None, contract_name: str = None,
+                    date_from: date = None, date_to: date = None, min_vulnerabilities: int = None,
+                    sort_by: str = "submission_date", order: str = "desc"):
+    # query only the columns that are returned instead of loading Report objects
+    query = db.query(
+        Report.report_id,
+        Report.contract_name,
+        Report.submission_date,
+        Report.submission_time,
+        Report.number_of_vulnerabilities,
+        Report.detector_profile,
     )
-    db.add(result)
-    db.commit()
-    db.refresh(result)
 
+    # server-side filters
+    if contract_name:
+        # prefix match, escape the LIKE wildcards typed by the user
+        escaped = contract_name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(Report.contract_name.like(f"{escaped}%", escape="\\"))
+    if date_from:
+        query = query.filter(Report.submission_date >= date_from)
+    if date_to:
+        query = query.filter(Report.submission_date <= date_to)
+    if min_vulnerabilities is not None:
+        query = query.filter(Report.number_of_vulnerabilities >= min_vulnerabilities)
 
-# function to retrieves a list of reports from the database
-@db_handler # use the decorator  defined above for error handling
-def get_all_reports(db: Session):
-    # query the database to get a list of reports
-    reports = db.query(Report).all()
+    # continue after the last report of the previous page
+    sort_key = REPORT_SORT_KEYS[sort_by]
+    if cursor:
+        position = tuple_(*decode_cursor(cursor, sort_by, order))
+        query = query.filter(tuple_(*sort_key) < position if order == "desc" else tuple_(*sort_key) > position)
 
-    # check if there are no reports
-    if not reports:
+    # get one more report than requested to know if there is a next page
+    rows = (
+        query.order_by(*[column.desc() if order == "desc" else column.asc() for column in sort_key])
+        .limit(limit + 1)
+        .all()
+    )
+
+    # check if there are no reports at all
+    filtered = any(value is not None for value in (contract_name, date_from, date_to, min_vulnerabilities))
+    if not rows and not cursor and not filtered:
         raise HTTPException(status_code=404, detail="No reports have been uploaded yet. Please upload a report to view details.")
 
     # initialise the result list with selected information from each report
-    result = []
-    for report in reports:
-        result.append({
-            "report_id": report.report_id,
-            "contract_name": report.contract_name,
+    reports = []
+    for row in rows[:limit]:
+        reports.append({
+            "report_id": row.report_id,
+            "contract_name": row.contract_name,
             # convert the date object to a string with format dd-mm-yyyy
-            "submission_date": report.submission_date.strftime('%d-%m-%Y'), 
+            "submission_date": row.submission_date.strftime('%d-%m-%Y'), 
             # convert the time object to a string with format HH:MM AM/PM
-            "submission_time": report.submission_time.strftime('%I:%M %p'),
-            "number_of_vulnerabilities": report.number_of_vulnerabilities  
+            "submission_time": row.submission_time.strftime('%I:%M %p'),
+            "number_of_vulnerabilities": row.number_of_vulnerabilities,
+            "detector_profile": row.detector_profile,
         })
 
-    # return the result list containing all the reports
-    return result
+    # the cursor of the next page points after the last returned report, None on the last page
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(sort_by, order, tuple(getattr(last, column.key) for column in sort_key))
+
+    # return the page of reports and the cursor of the next page
+    return {"reports": reports, "next_cursor": next_cursor}
+
+
+# the report fields returned by GET /reports/{id}, dates formatted as dd-mm-yyyy and HH:MM AM/PM
+def report_summary(report: Report):
+    return {
+        "report_id": report.report_id,
+        "contract_name": report.contract_name,
+        "submission_date": report.submission_date.strftime('%d-%m-%Y'),
+        "submission_time": report.submission_time.strftime('%I:%M %p'),
+        "number_of_vulnerabilities": report.number_of_vulnerabilities,
+        "detector_profile": report.detector_profile,
+    }
+
+# the result fields returned by GET /reports/{id}, from a Result row or a result of the filtered report
+def result_info(result):
+    get = result.get if isinstance(result, dict) else lambda field: getattr(result, field)
+    return {
+        "description": get("description"),
+        "location": get("location"),
+        "source_file": get("source_file"),
+        "line_start": get("line_start"),
+        "line_end": get("line_end"),
+        "element_name": get("element_name"),
+    }
+
+# serialize a report document to gzip compressed JSON, returns its strong ETag (hash of the JSON) and the content
+def serialize_report_document(report_info: dict):
+    document = json.dumps(report_info, separators=(",", ":")).encode()
+    # mtime=0 so that the same document always gives the same bytes
+    return hashlib.sha256(document).hexdigest(), gzip.compress(document, mtime=0)
 
 
 # Function to retrieve a specific report from a database along with its associated vulnerabilities and results details.
 @db_handler # use the decorator  defined above for error handling
 def get_report(db: Session, report_id: int):
+    return build_report(db, report_id)
+
+def build_report(db: Session, report_id: int):
     # query the database to get a specific report with associated vulnerabilities
     # this is done by joining the Report and Vulnerability tables on the report_id
     report = (
@@ -149,15 +410,9 @@ def get_report(db: Session, report_id: int):
         raise HTTPException(status_code=404, detail="Report not found. Please upload a report to view details.")
 
     # prepare the report data to be returned
-    report_info = {
-        "report_id": report.report_id,
-        "contract_name": report.contract_name,
-        "submission_date": report.submission_date.strftime('%d-%m-%Y'),
-        "submission_time": report.submission_time.strftime('%I:%M %p'),
-        "number_of_vulnerabilities": report.number_of_vulnerabilities,
-        # initialise vuln_details as dict instead of list to use its vuln_id key
-        "vulnerabilities_details": {} 
-    }
+    report_info = report_summary(report)
+    # initialise vuln_details as dict instead of list to use its vuln_id key
+    report_info["vulnerabilities_details"] = {}
 
     # iterate through each vulnerability in the report (this relationship attribute is defined in models.py)
     for result in report.vulnerabilities:
@@ -177,10 +432,7 @@ def get_report(db: Session, report_id: int):
             }
 
         # add each result to the corresponding vulnerability
-        report_info["vulnerabilities_details"][vuln.vulnerability_id]["results"].append({
-            "description": result.description,
-            "location": result.location
-        })
+        report_info["vulnerabilities_details"][vuln.vulnerability_id]["results"].append(result_info(result))
 
     # convert the vulnerabilities_details dictionary to list object
     report_info["vulnerabilities_details"] = list(report_info["vulnerabilities_details"].values())
@@ -188,6 +440,97 @@ def get_report(db: Session, report_id: int):
     return report_info # return the detailed report information
 
 
+# Function to retrieve the summary of a report: its fields and, for each vulnerability type found, its impact,
+# confidence and number of results, without the results and the detector documentation (see GET /detectors)
+# the results are counted by the database in a single grouped query instead of being loaded
+@db_handler # use the decorator  defined above for error handling
+def get_report_summary(db: Session, report_id: int):
+    report = db.query(Report).filter(Report.report_id == report_id).first()
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found. Please upload a report to view details.")
+
+    results = func.count(Result.result_id).label("results")
+    rows = (
+        db.query(
+            Vulnerability.vulnerability_id, Vulnerability.vulnerability_type, Vulnerability.impact,
+            Vulnerability.confidence, results,
+        )
+        .join(Result, Result.vulnerability_id == Vulnerability.vulnerability_id)
+        .filter(Result.report_id == report_id)
+        .group_by(
+            Vulnerability.vulnerability_id, Vulnerability.vulnerability_type, Vulnerability.impact, Vulnerability.confidence
+        )
+        # same order as the vulnerabilities of the full report, by first result
+        .order_by(func.min(Result.result_id))
+        .all()
+    )
+
+    report_info = report_summary(report)
+    report_info["vulnerabilities_details"] = [
+        {
+            "vulnerability_type": row.vulnerability_type,
+            "impact": row.impact,
+            "confidence": row.confidence,
+            "number_of_results": row.results,
+        }
+        for row in rows
+    ]
+    # number of results of each impact level
+    report_info["impacts"] = {}
+    for row in rows:
+        report_info["impacts"][row.impact] = report_info["impacts"].get(row.impact, 0) + row.results
+    return report_info
+
+# Function to retrieve a page of the results of one vulnerability type within a report, in result order
+# returns the results and the next_offset to get the next page, None on the last page
+@db_handler # use the decorator  defined above for error handling
+def get_vulnerability_results(db: Session, report_id: int, vulnerability_type: str, limit: int = 50, offset: int = 0):
+    # only the columns of the results of the page, one more than requested to know if there is a next page
+    rows = (
+        db.query(
+            Result.result_id, Result.description, Result.location, Result.source_file, Result.line_start,
+            Result.line_end, Result.element_name,
+        )
+        .join(Vulnerability, Result.vulnerability_id == Vulnerability.vulnerability_id)
+        .filter(Result.report_id == report_id, Vulnerability.vulnerability_type == vulnerability_type)
+        .order_by(Result.result_id)
+        .limit(limit + 1)
+        .offset(offset)
+        .all()
+    )
+    if not rows and db.query(Report.report_id).filter(Report.report_id == report_id).first() is None:
+        raise HTTPException(status_code=404, detail="Report not found. Please upload a report to view details.")
+
+    return {
+        "results": [{"result_id": row.result_id, **result_info(row)} for row in rows[:limit]],
+        "next_offset": offset + limit if len(rows) > limit else None,
+    }
+
+
+# in-process LRU cache of the most read report documents: report_id -> (etag, gzip compressed JSON)
+report_document_cache = cache.MemoryLRUCache(config.REPORT_CACHE_MAX_BYTES)
+
+# Function to retrieve the precomputed document of a report, returns its ETag and its gzip compressed JSON content
+@db_handler # use the decorator  defined above for error handling
+def get_report_document(db: Session, report_id: int):
+    # serve hot reports from memory without touching the database
+    cached = report_document_cache.get(report_id)
+    metrics.inc(metrics.CACHE_LOOKUPS, cache="report_document", result="hit" if cached else "miss")
+    if cached:
+        return cached
+
+    document = db.query(ReportDocument.etag, ReportDocument.content).filter(ReportDocument.report_id == report_id).first()
+    if document:
+        etag, content = document
+    else:
+        # every report has a document (see upload_report and migrations.backfill_report_documents), in case one is
+        # missing it is built from the results without storing it, so that concurrent reads never write
+        etag, content = serialize_report_document(build_report(db, report_id))
+
+    report_document_cache.set(report_id, (etag, content), len(content))
+    return etag, content
+
+
 # function to delete a specific report from the database by its report_id
 @db_handler # use the defined decorator for error handling
 def delete_report(db: Session, report_id: int):
@@ -198,13 +541,191 @@ def delete_report(db: Session, report_id: int):
     if report is None:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    # delete associated vuln results data from Result table first
+    # remove the findings of the report from the analytics summary and the full-text index while its results still exist
+    analytics.remove_report(db, report)
+    search.remove_report(db, report_id)
+
+    # delete associated vuln results data from Result table and the stored document first
     db.query(Result).filter(Result.report_id == report_id).delete()
+    db.query(ReportDocument).filter(ReportDocument.report_id == report_id).delete()
 
     # then delete the report itself
     db.query(Report).filter(Report.report_id == report_id).delete()
     db.commit() # commit the changes
+
+    # stop serving the cached document of the deleted report
+    report_document_cache.delete(report_id)
     
     # return a success message
     return {"detail": "Report deleted successfully"}
 
+
+# the findings of a report whose fingerprint is not among the findings of another report
+def findings_not_in(db: Session, report_id: int, other_report_id: int):
+    other_fingerprints = db.query(Result.fingerprint).filter(Result.report_id == other_report_id, Result.fingerprint.isnot(None))
+    rows = (
+        db.query(Result, Vulnerability.vulnerability_type, Vulnerability.impact, Vulnerability.confidence)
+        .join(Vulnerability, Result.vulnerability_id == Vulnerability.vulnerability_id)
+        .filter(Result.report_id == report_id, Result.fingerprint.notin_(other_fingerprints))
+        .order_by(Result.result_id)
+    )
+    return [
+        {
+            "vulnerability_type": vulnerability_type,
+            "impact": impact,
+            "confidence": confidence,
+            "fingerprint": result.fingerprint,
+            **result_info(result),
+        }
+        for result, vulnerability_type, impact, confidence in rows
+    ]
+
+# Function to compare a report with a later report of the same contract: the findings that are new in the later report,
+# the findings of the first report that are resolved in it and the number of findings found in both
+# the findings are compared by fingerprint with indexed set operations, without loading the reports
+# (the results stored before results had a fingerprint are given one at startup, see migrations.backfill_fingerprints)
+@db_handler # use the decorator  defined above for error handling
+def get_report_diff(db: Session, report_id: int, other_report_id: int):
+    # check if both reports exist
+    found = db.query(func.count(Report.report_id)).filter(Report.report_id.in_({report_id, other_report_id})).scalar()
+    if found < len({report_id, other_report_id}):
+        raise HTTPException(status_code=404, detail="Report not found. Please upload a report to view details.")
+
+    fingerprints = db.query(Result.fingerprint).filter(Result.report_id == report_id)
+    unchanged = (
+        db.query(func.count(distinct(Result.fingerprint)))
+        .filter(Result.report_id == other_report_id, Result.fingerprint.in_(fingerprints))
+        .scalar()
+    )
+
+    return {
+        "report_id": report_id,
+        "other_report_id": other_report_id,
+        "new": findings_not_in(db, other_report_id, report_id),
+        "resolved": findings_not_in(db, report_id, other_report_id),
+        "unchanged": unchanged,
+    }
+
+
+# Function to search the findings of all reports with the full-text index (see search.py), the most relevant first
+# every term of the query must be found in the contract name, location, element, source file or description
+@db_handler # use the decorator  defined above for error handling
+def search_findings(db: Session, query: str, vulnerability_type: str = None, impact: str = None,
+                    limit: int = 20, offset: int = 0):
+    terms = search.query_terms(query)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Please enter at least one search term.")
+
+    # get one more result than requested to know if there is a next page
+    matches = search.find(db, query, vulnerability_type, impact, limit + 1, offset)
+    page = matches[:limit]
+
+    # the details of the results of the page only
+    rows = (
+        db.query(Result, Report.contract_name, Vulnerability.vulnerability_type, Vulnerability.impact, Vulnerability.confidence)
+        .join(Report, Result.report_id == Report.report_id)
+        .join(Vulnerability, Result.vulnerability_id == Vulnerability.vulnerability_id)
+        .filter(Result.result_id.in_([result_id for result_id, _ in page]))
+    )
+    details = {row.Result.result_id: row for row in rows}
+
+    results = []
+    for result_id, snippet in page:
+        row = details.get(result_id)
+        if row is None: # deleted since it was found
+            continue
+        results.append({
+            "result_id": result_id,
+            "report_id": row.Result.report_id,
+            "contract_name": row.contract_name,
+            "vulnerability_type": row.vulnerability_type,
+            "impact": row.impact,
+            "confidence": row.confidence,
+            **result_info(row.Result),
+            "snippet": snippet if snippet is not None else search.highlight(row.Result.description, terms),
+        })
+
+    # the offset of the next page, None on the last page
+    next_offset = offset + limit if len(matches) > limit else None
+    return {"results": results, "next_offset": next_offset}
+
+
+# functions reading the analytics summary tables (see analytics.py), they read one row per day and vulnerability
+# type, or per contract, so their cost does not grow with the number of reports
+
+# filter a query of the vulnerability_stats table on a range of days
+def filter_days(query, date_from: date = None, date_to: date = None):
+    if date_from:
+        query = query.filter(VulnerabilityStat.day >= date_from)
+    if date_to:
+        query = query.filter(VulnerabilityStat.day <= date_to)
+    return query
+
+# function to retrieve the vulnerability types found most often, with their impact and confidence
+@db_handler # use the decorator  defined above for error handling
+def get_top_vulnerabilities(db: Session, limit: int = 20, date_from: date = None, date_to: date = None):
+    findings = func.sum(VulnerabilityStat.findings).label("findings")
+    query = db.query(
+        Vulnerability.vulnerability_type,
+        Vulnerability.impact,
+        Vulnerability.confidence,
+        findings,
+        func.sum(VulnerabilityStat.reports).label("reports"),
+    ).join(Vulnerability, VulnerabilityStat.vulnerability_id == Vulnerability.vulnerability_id)
+    rows = (
+        filter_days(query, date_from, date_to)
+        .group_by(Vulnerability.vulnerability_id, Vulnerability.vulnerability_type, Vulnerability.impact, Vulnerability.confidence)
+        .order_by(findings.desc(), Vulnerability.vulnerability_type)
+        .limit(limit)
+    )
+    return [
+        {
+            "vulnerability_type": row.vulnerability_type,
+            "impact": row.impact,
+            "confidence": row.confidence,
+            "findings": int(row.findings),
+            "reports": int(row.reports), # reports with at least one finding of the type
+        }
+        for row in rows
+    ]
+
+# function to retrieve the number of findings by impact and by confidence, bucketed by day or by week (from Monday)
+@db_handler # use the decorator  defined above for error handling
+def get_findings_over_time(db: Session, interval: str = "week", date_from: date = None, date_to: date = None):
+    query = db.query(
+        VulnerabilityStat.day,
+        Vulnerability.impact,
+        Vulnerability.confidence,
+        func.sum(VulnerabilityStat.findings).label("findings"),
+    ).join(Vulnerability, VulnerabilityStat.vulnerability_id == Vulnerability.vulnerability_id)
+    rows = filter_days(query, date_from, date_to).group_by(VulnerabilityStat.day, Vulnerability.impact, Vulnerability.confidence)
+
+    periods = {}
+    for row in rows:
+        start = row.day if interval == "day" else row.day - timedelta(days=row.day.weekday())
+        period = periods.setdefault(start, {"period_start": start.isoformat(), "findings": 0, "impact": {}, "confidence": {}})
+        period["findings"] += int(row.findings)
+        period["impact"][row.impact] = period["impact"].get(row.impact, 0) + int(row.findings)
+        period["confidence"][row.confidence] = period["confidence"].get(row.confidence, 0) + int(row.findings)
+
+    # the periods in chronological order, periods without findings are omitted
+    return [periods[start] for start in sorted(periods)]
+
+# function to retrieve the contracts with the most high impact findings
+@db_handler # use the decorator  defined above for error handling
+def get_top_contracts(db: Session, limit: int = 20):
+    rows = (
+        db.query(ContractStat)
+        .filter(ContractStat.high_impact_findings > 0)
+        .order_by(ContractStat.high_impact_findings.desc(), ContractStat.contract_name)
+        .limit(limit)
+    )
+    return [
+        {
+            "contract_name": row.contract_name,
+            "reports": row.reports,
+            "findings": row.findings,
+            "high_impact_findings": row.high_impact_findings,
+        }
+        for row in rows
+    ]
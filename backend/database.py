@@ -1,43 +1,69 @@
 # this file defines the database connection and session management
+# the database is configured from the environment (see config.py), nothing is created at import time:
+# the server creates the database and its tables at startup with init_db().
 
-import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-# from dotenv import load_dotenv
 from models import Base
 from sqlalchemy_utils import database_exists, create_database
+import config
+import migrations
+import search
 
-#! if use environment in docker compose then no need to load from dotenv
-# # Option 1: Load environment variables from the .env file
-# load_dotenv()
+# async drivers of the supported databases, used by the read endpoints so that database waits do not block the event loop
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
 
-# Access environment variables
-# MYSQL_HOST = os.environ.get("MYSQL_HOST")
-# MYSQL_USER = os.environ.get("MYSQL_USER")
-# # MYSQL_PORT = int(os.environ.get("MYSQL_PORT"))
-# MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD")
-# MYSQL_DB = os.environ.get("MYSQL_DB")
 
-# Option 2: Define your database configuration directly
-MYSQL_HOST = "mysql_db"
-MYSQL_USER = "bong"
-MYSQL_PASSWORD = "bong"
-MYSQL_DB = "audit"
+# connection pool settings of an engine, SQLite (local tests and benchmarks) keeps the default pool of SQLAlchemy
+def engine_options(url: str, is_async: bool = False):
+    if make_url(url).get_backend_name() == "sqlite":
+        # sync SQLite connections are used from the threads of the FastAPI thread pool
+        return {} if is_async else {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE, # MySQL closes idle connections after wait_timeout
+        "pool_pre_ping": config.DB_POOL_PRE_PING, # check connections before use, e.g. after a database restart
+    }
 
-MYSQL_DB_URL = f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
 
-engine = create_engine(
-    MYSQL_DB_URL,
-)
+# URL of the async engine, from ASYNC_DATABASE_URL or with the async driver of the database of DATABASE_URL
+def async_database_url(url: str):
+    if config.ASYNC_DATABASE_URL:
+        return config.ASYNC_DATABASE_URL
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
 
-# auto create database if not exists
-if not database_exists(engine.url):
-    create_database(engine.url)
 
+engine = create_engine(config.DATABASE_URL, **engine_options(config.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# create tables if they do not exist in the db
-Base.metadata.create_all(bind=engine)
+ASYNC_DATABASE_URL = async_database_url(config.DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+
+# create the database if it does not exist and the tables that do not exist in it, called once at startup
+def init_db():
+    if not database_exists(engine.url):
+        create_database(engine.url)
+    Base.metadata.create_all(bind=engine)
+    # columns and indexes added to the existing tables since the database was created (see migrations.py)
+    migrations.migrate(engine)
+    # the full-text index is not a model table (see search.py), the existing results are indexed when it is created
+    if search.create_index(engine):
+        db = SessionLocal()
+        try:
+            search.rebuild(db)
+        finally:
+            db.close()
+
 
 # dependency to get the database session
 def get_db():
@@ -47,3 +73,9 @@ def get_db():
     finally:
         db.close()
 
+
+# dependency to get an async database session, for the read endpoints
+# the crud functions run on it with: await db.run_sync(crud.function, *args)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
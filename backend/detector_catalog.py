@@ -0,0 +1,124 @@
+# this file provides an in-memory catalog of the Slither detectors documented in the slither wiki.
+# the wiki is parsed once (lazily on first use) into a dict keyed by check name, and parsed again only when the file changes.
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import config
+
+# "## <title>" starts the documentation of a detector, "### <heading>" starts one of its subsections
+SECTION_PATTERN = re.compile(r"^## ", re.MULTILINE)
+SUBSECTION_PATTERN = re.compile(r"^### ", re.MULTILINE)
+# "* Check: `reentrancy-eth`" lines of the configuration subsection
+CONFIGURATION_PATTERN = re.compile(r"^\* (?P<key>[\w ]+): `(?P<value>[^`]*)`", re.MULTILINE)
+
+# detector profiles selectable per upload: the impacts and confidences of the detectors they run (None for any),
+# and the priority of their jobs in the analysis queue (lower first) so that quick screens do not wait for full audits
+DETECTOR_PROFILES = {
+    "triage": {"impacts": ("High",), "confidences": ("High",), "priority": 0},
+    "full": {"impacts": None, "confidences": None, "priority": 1},
+}
+DEFAULT_PROFILE = "full"
+
+
+# parse the detector documentation into a dict of check name -> detector information
+def parse_detector_documentation(content: str):
+    detectors = {}
+
+    # the text before the first "## " is the page introduction, skip it
+    for section in SECTION_PATTERN.split(content)[1:]:
+        title, _, body = section.partition("\n")
+
+        # map each subsection heading e.g., "Exploit Scenario:" -> "exploit scenario" to its content
+        subsections = {}
+        for subsection in SUBSECTION_PATTERN.split(body)[1:]:
+            heading, _, text = subsection.partition("\n")
+            subsections[heading.strip().rstrip(":").lower()] = text.strip()
+
+        configuration = {
+            match.group("key"): match.group("value")
+            for match in CONFIGURATION_PATTERN.finditer(subsections.get("configuration", ""))
+        }
+
+        # skip sections that do not document a detector
+        check_name = configuration.get("Check")
+        if not check_name:
+            continue
+
+        detectors[check_name] = {
+            "check": check_name,
+            "title": title.strip(),
+            "impact": configuration.get("Severity"),
+            "confidence": configuration.get("Confidence"),
+            "description": subsections.get("description"),
+            "exploit_scenario": subsections.get("exploit scenario"),
+            "recommendation": subsections.get("recommendation"),
+        }
+
+    return detectors
+
+
+class DetectorCatalog:
+    """
+    Detector documentation indexed by check name.
+    The file modification time is checked on every lookup so that an updated wiki is picked up without a restart.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._detectors = {}
+        self._document = None # (etag, gzip compressed JSON) of the catalog, built on first use
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    # (re)load the documentation if it has not been loaded yet or the file has changed since
+    def load(self):
+        mtime = os.stat(self.file_path).st_mtime
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            # another thread may have reloaded the file while waiting for the lock
+            if mtime == self._mtime:
+                return
+            with open(self.file_path, "r") as f:
+                self._detectors = parse_detector_documentation(f.read())
+            self._document = None
+            self._mtime = mtime
+
+    # get the information of a detector, or None if the check is not documented
+    def get(self, check_name: str):
+        self.load()
+        return self._detectors.get(check_name)
+
+    # get the information of every documented detector
+    def all(self):
+        self.load()
+        return list(self._detectors.values())
+
+    # the whole catalog as served by GET /detectors: its strong ETag (hash of the JSON) and its gzip compressed JSON
+    # computed once per version of the documentation, so the endpoint never serialises the catalog again
+    def document(self):
+        self.load()
+        document = self._document
+        if document is None:
+            content = json.dumps(sorted(self._detectors.values(), key=lambda d: d["check"]), separators=(",", ":")).encode()
+            document = self._document = (hashlib.sha256(content).hexdigest(), gzip.compress(content, mtime=0))
+        return document
+
+    # get the check names of the detectors run by a profile, or None if the profile runs every detector
+    def profile_checks(self, profile: str):
+        impacts, confidences = DETECTOR_PROFILES[profile]["impacts"], DETECTOR_PROFILES[profile]["confidences"]
+        if impacts is None and confidences is None:
+            return None
+        return sorted(
+            detector["check"] for detector in self.all()
+            if (impacts is None or detector["impact"] in impacts)
+            and (confidences is None or detector["confidence"] in confidences)
+        )
+
+
+# catalog of the detector wiki shared by the services of this process
+catalog = DetectorCatalog(config.DETECTOR_DOCUMENT_PATH)
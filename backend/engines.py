@@ -0,0 +1,241 @@
+# this file contains the engines that run Slither on a contract and return the filtered report.
+# the "api" engine keeps Slither loaded in the long-lived analysis worker processes (see jobs.py): the imports of
+# slither, crytic-compile and the detector registry are paid once per worker instead of once per upload like with
+# the "cli" engine, which starts a new slither process for every analysis.
+# engines report the filtering stage and the findings parsed so far to the optional progress callback (see pipeline.py)
+# and run only the given detectors (check names) when a detector profile restricts them, every detector otherwise.
+# every engine leaves the Slither JSON report of the analysis next to the contract, kept as its raw output (see retention.py)
+# the cli and api engines compile the contract through the compilation cache (see cache.py): given the source_hash of
+# the job, the crytic-compile artifacts of a previous compilation of the same sources are loaded instead of running solc
+
+import contextlib
+import hashlib
+import inspect
+import os
+import subprocess
+import time
+from fastapi import HTTPException, status
+import cache
+import compilers
+import config
+import metrics
+import services
+import synthetic
+
+
+class CliEngine:
+    """Runs the slither command line for every analysis and streams its JSON report."""
+
+    name = "cli"
+
+    def load(self):
+        pass
+
+    def analyze(self, file_path: str, solidity_version: str, source_root: str, progress=None, detectors=None, source_hash=None):
+        artifacts = self._compile(os.path.relpath(file_path, source_root), solidity_version, source_root, source_hash)
+        json_path = services.analyze_contract(file_path, solidity_version, source_root, detectors, artifacts)
+        if progress:
+            progress("filtering", findings=0)
+        return services.filter_report(json_path, source_root, progress)
+
+    # export the artifacts of the compilation of a target with the crytic-compile command, or load them from the
+    # compilation cache, returns the path of the zip file for Slither to analyse, or None to let Slither compile the
+    # target itself (compilation cache disabled, or compilation errors which Slither then reports)
+    def _compile(self, target: str, solidity_version: str, source_root: str, source_hash: str = None):
+        cache_key = compilation_cache_key(source_hash, target, solidity_version)
+        if cache_key is None:
+            return None
+        zip_path = os.path.join(os.path.abspath(source_root), f"{target}.zip")
+        if _load_cached_compilation(cache_key, zip_path):
+            return zip_path
+
+        try:
+            solc_path = compilers.compiler_manager.solc_path(solidity_version)
+            start = time.perf_counter()
+            with metrics.time_stage("compiling"):
+                completed = subprocess.run(
+                    ["crytic-compile", target, "--solc", solc_path, "--export-zip", zip_path],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=source_root,
+                )
+        except Exception as e:
+            print(e)
+            return None
+        if completed.returncode != 0 or not os.path.exists(zip_path):
+            return None
+        _cache_compilation(cache_key, zip_path, time.perf_counter() - start)
+        return zip_path
+
+
+class SlitherApiEngine:
+    """
+    Runs Slither through its Python API inside the worker process.
+    Slither and the detector classes are imported once by load(), each analysis then only compiles the contract
+    and runs the detectors, which Slither instantiates for the compilation units of the contract.
+    """
+
+    name = "api"
+
+    def __init__(self):
+        self._slither_class = None
+        self._crytic_compile_class = None
+        self._detectors = []
+
+    # import Slither and collect its detectors, raises ImportError if slither-analyzer is not installed
+    def load(self):
+        if self._slither_class is not None:
+            return
+        from crytic_compile import CryticCompile
+        from slither import Slither
+        from slither.detectors import all_detectors
+        from slither.detectors.abstract_detector import AbstractDetector
+
+        # same detectors, in the same order, as the slither command line
+        self._detectors = [
+            detector for _, detector in inspect.getmembers(all_detectors, inspect.isclass)
+            if issubclass(detector, AbstractDetector)
+        ]
+        self._slither_class = Slither
+        self._crytic_compile_class = CryticCompile
+
+    def analyze(self, file_path: str, solidity_version: str, source_root: str, progress=None, detectors=None, source_hash=None):
+        self.load()
+        try:
+            # the binary is given to Slither directly, see compilers.py
+            solc_path = compilers.compiler_manager.solc_path(solidity_version)
+        except subprocess.CalledProcessError as e: # solc-select install failed
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error installing Solidity compiler {solidity_version}. Please try again.")
+
+        try:
+            # Slither reports paths relative to the current folder, run it from the source root like the cli engine
+            with _working_directory(source_root):
+                target = os.path.relpath(file_path, source_root)
+                slither = self._slither_class(self._compile(target, solc_path, solidity_version, source_hash))
+                for detector in self._detectors:
+                    if detectors is None or detector.ARGUMENT in detectors:
+                        slither.register_detector(detector)
+                # one list of findings per detector, each finding is a dict as in the "detectors" of the JSON report
+                findings = [finding for results in slither.run_detectors() for finding in results]
+        except Exception as e: # compilation or analysis errors
+            print(e)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error running Slither. Please check that the contract compiles.")
+
+        if config.RAW_OUTPUTS_ENABLED:
+            services.write_raw_output(findings, file_path)
+        if progress:
+            progress("filtering", findings=0)
+        return services.filter_findings(findings, source_root, progress)
+
+    # compile a target of the current folder, or load the artifacts of a previous compilation of the same sources
+    def _compile(self, target: str, solc_path: str, solidity_version: str, source_hash: str = None):
+        from crytic_compile.utils.zip import load_from_zip, save_to_zip
+
+        cache_key = compilation_cache_key(source_hash, target, solidity_version)
+        zip_path = os.path.abspath(f"{target}.zip") # in the scratch folder of the job, removed with it
+        if cache_key and _load_cached_compilation(cache_key, zip_path):
+            try:
+                return load_from_zip(zip_path)[0]
+            except Exception as e: # artifacts of an incompatible crytic-compile, compile again
+                print(e)
+
+        start = time.perf_counter()
+        with metrics.time_stage("compiling"):
+            compilation = self._crytic_compile_class(target, solc=solc_path)
+        if cache_key:
+            save_to_zip([compilation], zip_path)
+            _cache_compilation(cache_key, zip_path, time.perf_counter() - start)
+        return compilation
+
+
+class StubEngine:
+    """
+    Deterministic stand-in for Slither, for benchmarks and CI without compilers: the findings are generated from the
+    hash of the contract (see synthetic.py) after sleeping STUB_ANALYSIS_MS to emulate the analysis time.
+    """
+
+    name = "stub"
+
+    def load(self):
+        pass
+
+    def analyze(self, file_path: str, solidity_version: str, source_root: str, progress=None, detectors=None, source_hash=None):
+        with open(file_path, "rb") as f:
+            seed = int(hashlib.sha256(f.read()).hexdigest()[:16], 16)
+        time.sleep(config.STUB_ANALYSIS_MS / 1000)
+        findings = synthetic.generate_findings(
+            config.STUB_FINDINGS, config.STUB_DETECTORS, os.path.relpath(file_path, source_root), seed=seed
+        )
+        if detectors is not None:
+            findings = [finding for finding in findings if finding["check"] in detectors]
+
+        if config.RAW_OUTPUTS_ENABLED:
+            services.write_raw_output(findings, file_path)
+        if progress:
+            progress("filtering", findings=0)
+        return services.filter_findings(findings, source_root, progress)
+
+
+# change the current folder of the process for the duration of an analysis, a worker runs one analysis at a time
+@contextlib.contextmanager
+def _working_directory(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+# key of the compilation of a target in the compilation cache, None if the compilation is not to be cached
+def compilation_cache_key(source_hash: str, target: str, solidity_version: str):
+    if not config.COMPILATION_CACHE_ENABLED or not source_hash:
+        return None
+    return cache.compilation_cache_key(source_hash, target, solidity_version)
+
+
+# copy the cached artifacts of a compilation to the given zip file, returns False on a cache miss
+# the compilation cache is only an optimisation, an unavailable cache must never fail the analysis
+def _load_cached_compilation(cache_key: str, zip_path: str):
+    try:
+        artifacts = cache.get_cached_compilation(cache_key)
+    except Exception as e:
+        print(e)
+        artifacts = None
+    metrics.inc(metrics.CACHE_LOOKUPS, cache="compilation", result="miss" if artifacts is None else "hit")
+    if artifacts is None:
+        return False
+    with open(zip_path, "wb") as f:
+        f.write(artifacts)
+    return True
+
+
+# store the artifacts of a compilation exported to a zip file, duration is the number of seconds it took
+def _cache_compilation(cache_key: str, zip_path: str, duration: float):
+    try:
+        with open(zip_path, "rb") as f:
+            cache.cache_compilation(cache_key, f.read(), duration)
+    except Exception as e:
+        print(e)
+
+
+# available engines, selected with the ANALYSIS_ENGINE setting
+ENGINES = {
+    CliEngine.name: CliEngine,
+    SlitherApiEngine.name: SlitherApiEngine,
+    StubEngine.name: StubEngine,
+}
+
+_engine = None # engine of this process, loaded by the first call to get_engine()
+
+
+# get the loaded engine of this process, the api engine falls back to the command line if Slither can not be imported
+def get_engine():
+    global _engine
+    if _engine is None:
+        engine = ENGINES[config.ANALYSIS_ENGINE]()
+        try:
+            engine.load()
+        except ImportError as e:
+            print(f"Slither API not available ({e}), falling back to the slither command line.")
+            engine = CliEngine()
+        _engine = engine
+    return _engine
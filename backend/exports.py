@@ -0,0 +1,175 @@
+# this file streams the findings of every report as NDJSON, CSV or SARIF, behind the GET /export endpoint.
+# the findings are read with a server-side cursor, EXPORT_BATCH_SIZE rows per round trip, and each batch is encoded
+# and handed to the response before the next one is fetched: memory stays flat whatever the size of the export,
+# and the first bytes are sent as soon as the first batch is read.
+# the generators own their session, as a streaming response outlives the request dependencies.
+
+import csv
+import io
+import json
+from datetime import date, time
+from sqlalchemy import select
+from models import Report, Result, Vulnerability
+from database import SessionLocal
+import config
+
+# columns of an exported finding, in the order of the CSV header
+COLUMNS = (
+    "report_id", "contract_name", "submission_date", "submission_time", "detector_profile", "result_id",
+    "vulnerability_type", "impact", "confidence", "source_file", "line_start", "line_end", "element_name",
+    "location", "description", "fingerprint",
+)
+
+# content type and file extension of each format
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "sarif": ("application/sarif+json", "sarif"),
+}
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+# SARIF level of each impact of the Slither detectors
+SARIF_LEVELS = {
+    "High": "error",
+    "Medium": "warning",
+    "Low": "note",
+    "Informational": "note",
+    "Optimization": "note",
+}
+
+
+# the findings matching the filters as batches of rows with the COLUMNS, in result order: the primary key order of
+# the results, so that the database streams them without sorting them first
+def finding_batches(date_from: date = None, date_to: date = None, impact: str = None):
+    query = (
+        select(
+            Report.report_id, Report.contract_name, Report.submission_date, Report.submission_time,
+            Report.detector_profile, Result.result_id, Vulnerability.vulnerability_type, Vulnerability.impact,
+            Vulnerability.confidence, Result.source_file, Result.line_start, Result.line_end, Result.element_name,
+            Result.location, Result.description, Result.fingerprint,
+        )
+        .join(Result, Result.report_id == Report.report_id)
+        .join(Vulnerability, Result.vulnerability_id == Vulnerability.vulnerability_id)
+        .order_by(Result.result_id)
+    )
+    if date_from:
+        query = query.where(Report.submission_date >= date_from)
+    if date_to:
+        query = query.where(Report.submission_date <= date_to)
+    if impact:
+        query = query.where(Vulnerability.impact == impact)
+
+    db = SessionLocal()
+    try:
+        # yield_per streams the rows from a server-side cursor instead of buffering the whole result
+        rows = db.execute(query.execution_options(yield_per=config.EXPORT_BATCH_SIZE))
+        for batch in rows.partitions():
+            yield batch
+    finally:
+        db.close()
+
+
+# JSON-compatible value of a column, dates and times in ISO format
+def _value(value):
+    return value.isoformat() if isinstance(value, (date, time)) else value
+
+
+def _record(row):
+    return {column: _value(value) for column, value in zip(COLUMNS, row)}
+
+
+# one JSON object per line
+def ndjson_export(**filters):
+    for batch in finding_batches(**filters):
+        yield "".join(json.dumps(_record(row), separators=(",", ":")) + "\n" for row in batch).encode()
+
+
+# a header line, then one line per finding
+def csv_export(**filters):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode()
+    for batch in finding_batches(**filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+
+
+# a single SARIF 2.1.0 log with one run, the results are written as they are read and the rules, which are only known
+# once every finding was read, after them
+def sarif_export(**filters):
+    yield f'{{"version":"2.1.0","$schema":"{SARIF_SCHEMA}","runs":[{{"results":['.encode()
+    rule_indexes = {} # vulnerability type -> index of its rule
+    first = True
+    for batch in finding_batches(**filters):
+        results = []
+        for row in batch:
+            record = _record(row)
+            rule_index = rule_indexes.setdefault(record["vulnerability_type"], len(rule_indexes))
+            results.append(json.dumps(sarif_result(record, rule_index), separators=(",", ":")))
+        if results:
+            yield (("" if first else ",") + ",".join(results)).encode()
+            first = False
+    details = _rule_details(list(rule_indexes))
+    rules = [sarif_rule(vulnerability_type, details.get(vulnerability_type)) for vulnerability_type in rule_indexes]
+    driver = {"name": "Slither", "informationUri": "https://github.com/crytic/slither", "rules": rules}
+    yield f'],"tool":{json.dumps({"driver": driver}, separators=(",", ":"))}}}]}}'.encode()
+
+
+def sarif_result(record: dict, rule_index: int):
+    region = {}
+    if record["line_start"] is not None:
+        region["startLine"] = record["line_start"]
+    if record["line_end"] is not None:
+        region["endLine"] = record["line_end"]
+    location = {"physicalLocation": {"artifactLocation": {"uri": record["source_file"] or record["contract_name"]}}}
+    if region:
+        location["physicalLocation"]["region"] = region
+    if record["element_name"]:
+        location["logicalLocations"] = [{"name": record["element_name"]}]
+    result = {
+        "ruleId": record["vulnerability_type"],
+        "ruleIndex": rule_index,
+        "level": SARIF_LEVELS.get(record["impact"], "note"),
+        "message": {"text": record["description"] or record["vulnerability_type"]},
+        "locations": [location],
+        "properties": {
+            name: record[name] for name in ("report_id", "contract_name", "submission_date", "impact", "confidence")
+        },
+    }
+    if record["fingerprint"]:
+        result["partialFingerprints"] = {"findingFingerprint/v1": record["fingerprint"]}
+    return result
+
+
+# rule of a vulnerability type, with its description and recommendation if the type still exists
+def sarif_rule(vulnerability_type: str, vulnerability=None):
+    rule = {"id": vulnerability_type, "shortDescription": {"text": vulnerability_type}}
+    if vulnerability is not None:
+        rule["fullDescription"] = {"text": vulnerability.description or vulnerability_type}
+        rule["help"] = {"text": vulnerability.recommendation or ""}
+        rule["properties"] = {"impact": vulnerability.impact, "confidence": vulnerability.confidence}
+    return rule
+
+
+# vulnerability_type -> vulnerability of the given types, read once the findings are exported
+def _rule_details(vulnerability_types: list):
+    if not vulnerability_types:
+        return {}
+    db = SessionLocal()
+    try:
+        return {
+            vulnerability.vulnerability_type: vulnerability
+            for vulnerability in db.query(Vulnerability).filter(Vulnerability.vulnerability_type.in_(vulnerability_types))
+        }
+    finally:
+        db.close()
+
+
+EXPORTS = {
+    "ndjson": ndjson_export,
+    "csv": csv_export,
+    "sarif": sarif_export,
+}
@@ -0,0 +1,575 @@
+# this file manages the analysis job queue.
+# uploads are queued as jobs and processed by a bounded pool of worker processes, so that the blocking
+# solc-select/Slither commands never run on the FastAPI event loop.
+# each worker has its own task and event pipes: a worker killed for exceeding a limit may leave a partial message
+# or a held lock in them, so they are discarded with the worker and its replacement gets new ones, while the other
+# workers keep delivering their events.
+
+import heapq
+import itertools
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+import psutil
+from fastapi import HTTPException
+import config
+import engines
+import metrics
+import pipeline
+
+# statuses a job goes through, reported by the GET /jobs/{job_id} endpoint
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+TIMED_OUT = "timed_out" # stopped after ANALYSIS_TIMEOUT_SECONDS
+KILLED = "killed" # stopped for using more CPU time or memory than allowed
+FINISHED = (DONE, FAILED, TIMED_OUT, KILLED)
+
+# event sent by a worker when the pipeline of a job enters a new stage or parses more findings (see pipeline.py)
+PROGRESS = "progress"
+
+# event sent by a worker to record a metric in the server process (see metrics.py)
+METRIC = "metric"
+
+# event sent by a worker once its engine is loaded, before it takes its first job
+READY = "ready"
+
+# Retry-After of a rejected upload when no job has finished yet to estimate the wait, in seconds
+RETRY_AFTER_DEFAULT = 10
+
+# use "spawn" so that workers start from a clean interpreter instead of a fork of the threaded server process
+_mp_context = multiprocessing.get_context("spawn")
+
+
+# entry point of each worker process: take jobs from its task pipe and report their progress to the parent
+def _worker_main(tasks, events):
+    # lead a process group, so that the server can kill the worker with every process it started e.g., slither and solc
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+    # a pipe is not thread safe, and the metrics may be recorded from other threads of the worker
+    send_lock = threading.Lock()
+
+    def send(event: str, job_id, data: dict):
+        with send_lock:
+            events.send((event, job_id, data))
+
+    # the metrics recorded by the pipeline are served by the server process
+    metrics.set_forwarder(
+        lambda kind, name, value, labels: send(METRIC, None, {"kind": kind, "name": name, "value": value, "labels": labels})
+    )
+
+    # load the Slither engine before the first job, so that no upload waits for the imports
+    engines.get_engine()
+    send(READY, None, {})
+    jobs_done = 0
+
+    while True:
+        try:
+            task = tasks.recv()
+        except EOFError: # the server is gone
+            break
+
+        # None is the signal to shut down the worker
+        if task is None:
+            break
+
+        job_id, payload = task
+        send(RUNNING, job_id, {"pid": os.getpid(), "at": time.time()})
+
+        # report each stage of the pipeline with its timestamp e.g., progress("filtering", findings=100)
+        def progress(stage: str, **data):
+            send(PROGRESS, job_id, {"stage": stage, "at": time.time(), **data})
+
+        # whether the worker stops after this job to be replaced by a fresh process, sent with the final status so that
+        # the server hands no other job to it
+        jobs_done += 1
+        try:
+            report_id = pipeline.process_contract(payload, progress)
+            event, data = DONE, {"report_id": report_id}
+        except HTTPException as e: # keep the details of expected errors e.g., no Solidity version
+            event, data = FAILED, {"detail": e.detail}
+        except Exception as e: # more generic errors handling
+            event, data = FAILED, {"detail": "Internal server error. Please try again."}
+        recycle = _should_recycle(jobs_done)
+        send(event, job_id, {**data, "recycle": recycle})
+        if recycle:
+            break
+
+
+# whether a worker should stop after its current job to be replaced by a fresh process
+def _should_recycle(jobs_done: int):
+    if config.ANALYSIS_WORKER_MAX_JOBS and jobs_done >= config.ANALYSIS_WORKER_MAX_JOBS:
+        return True
+    if not config.ANALYSIS_WORKER_MAX_RSS_MB:
+        return False
+    return psutil.Process().memory_info().rss > config.ANALYSIS_WORKER_MAX_RSS_MB * 1024 * 1024
+
+
+# CPU time in seconds (including the processes that already exited) and memory (RSS in bytes) used by a worker and
+# every process it started, raises psutil.Error if the worker is gone
+def _process_group_usage(pid: int):
+    worker = psutil.Process(pid)
+    times = worker.cpu_times()
+    cpu = times.user + times.system + times.children_user + times.children_system
+    rss = worker.memory_info().rss
+    for child in worker.children(recursive=True):
+        try:
+            child_times = child.cpu_times()
+            cpu += child_times.user + child_times.system
+            rss += child.memory_info().rss
+        except psutil.Error: # the process exited in between
+            pass
+    return cpu, rss
+
+
+# kill a worker and every process it started (see _worker_main)
+def _kill_process_group(pid: int):
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            worker = psutil.Process(pid)
+            for process in worker.children(recursive=True) + [worker]:
+                process.kill()
+    except (ProcessLookupError, psutil.Error): # already gone
+        pass
+
+
+class Worker:
+    """
+    A worker process with its own task and event pipes, and the id of the job it is running (None when idle).
+    The pipes are never shared with another worker, they are closed when the worker is replaced.
+    """
+
+    def __init__(self):
+        task_reader, self.tasks = _mp_context.Pipe(duplex=False)
+        self.events, event_writer = _mp_context.Pipe(duplex=False)
+        self.process = _mp_context.Process(
+            target=_worker_main, args=(task_reader, event_writer), name="analysis-worker", daemon=True
+        )
+        self.process.start()
+        # the ends of the worker are closed in the server, so that reading the events of a dead worker raises EOFError
+        task_reader.close()
+        event_writer.close()
+        self.pid = self.process.pid
+        self.job_id = None
+        self.ready = False # whether the engine is loaded, see READY
+
+    # close the pipes and wait for the process to exit, it was killed or asked to stop
+    def close(self, timeout: float = 5):
+        self.tasks.close()
+        self.events.close()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class JobQueue:
+    """
+    Queue of analysis jobs processed by a pool of worker processes.
+    Job states are kept in memory of the server process and updated from the events sent by the workers.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = max(1, num_workers)
+        self._jobs = OrderedDict() # job_id -> job record, in submission order
+        self._batches = OrderedDict() # batch_id -> batch record with the job ids of its units
+        self._subscribers = {} # job_id -> callbacks notified of the progress of the job (see subscribe)
+        self._pending = [] # heap of the jobs waiting for a free worker: (priority, submission order, job_id, payload)
+        self._order = itertools.count() # submission order, jobs of the same priority are dispatched first in first out
+        self._work_dirs = {} # job_id -> scratch folder of the job, removed once the job is finished
+        self._work_dir_jobs = {} # scratch folder -> number of unfinished jobs using it (the units of a project share one)
+        self._in_flight = 0 # jobs handed to the workers but not finished yet
+        self._mean_duration = None # moving average of the duration of the audits in seconds, for Retry-After
+        self._last_limits_check = 0
+        self._workers = [] # running workers of the pool
+        self._respawns = [] # monotonic times at which to start the workers replacing the stopped ones
+        self._startup_failures = 0 # workers in a row that stopped before loading the engine, see _replace
+        self._lock = threading.Lock()
+        self._listener = None
+        self._running = False
+
+    # start the worker processes and the thread listening to their events
+    def start(self):
+        if self._running:
+            return
+        self._workers = [Worker() for _ in range(self.num_workers)]
+        self._running = True
+        self._listener = threading.Thread(target=self._listen, name="job-events", daemon=True)
+        self._listener.start()
+
+    # ask every worker to finish its current job and stop
+    def stop(self, timeout: float = 30):
+        if not self._running:
+            return
+        self._running = False
+        self._listener.join(timeout)
+        for worker in self._workers:
+            try:
+                worker.tasks.send(None)
+            except OSError: # the worker is gone
+                pass
+        for worker in self._workers:
+            worker.close(timeout)
+
+    # add a job to the queue and return its id, jobs with a lower priority value are handed to the workers first
+    # raises HTTPException 429 (TOO_MANY_REQUESTS) with a Retry-After header if MAX_QUEUED_JOBS jobs are already waiting
+    def submit(self, payload: dict, priority: int = 0):
+        with self._lock:
+            self._admit(1)
+            return self._add(payload, priority)
+
+    # check that this number of jobs can be queued, to reject an upload before reading it
+    def admit(self, count: int = 1):
+        with self._lock:
+            self._admit(count)
+
+    # raise HTTPException 429 if queueing this number of jobs would exceed MAX_QUEUED_JOBS (must hold the lock)
+    # a project with more units than MAX_QUEUED_JOBS is still accepted once nothing else waits
+    def _admit(self, count: int):
+        if not config.MAX_QUEUED_JOBS or not self._pending or len(self._pending) + count <= config.MAX_QUEUED_JOBS:
+            return
+        # estimated time for the workers to take the waiting jobs
+        retry_after = math.ceil(len(self._pending) / self.num_workers * (self._mean_duration or RETRY_AFTER_DEFAULT))
+        raise HTTPException(
+            status_code=429,
+            detail="Too many audits are waiting. Please try again later.",
+            headers={"Retry-After": str(max(1, retry_after))},
+        )
+
+    # add a job to the queue and return its id (must hold the lock)
+    def _add(self, payload: dict, priority: int):
+        job_id = uuid.uuid4().hex
+        submitted_at = datetime.now()
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "contract_name": payload.get("contract_name"),
+            "detector_profile": payload.get("detector_profile"),
+            "submitted_at": submitted_at,
+            "started_at": None,
+            "finished_at": None,
+            "report_id": None,
+            "detail": None,
+            "stage": QUEUED, # current stage of the pipeline
+            "stages": [{"stage": QUEUED, "at": submitted_at}], # stage transitions with their timestamp
+            "findings": 0, # findings parsed so far
+        }
+        if payload.get("work_dir"):
+            self._work_dirs[job_id] = payload["work_dir"]
+            self._work_dir_jobs[payload["work_dir"]] = self._work_dir_jobs.get(payload["work_dir"], 0) + 1
+        heapq.heappush(self._pending, (priority, next(self._order), job_id, payload))
+        self._dispatch()
+        return job_id
+
+    # return a copy of the job record, or None if the job id is unknown
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._copy(job) if job else None
+
+    # the scratch folders of the unfinished jobs, which the retention task must not remove (see retention.py)
+    def work_dirs_in_use(self):
+        with self._lock:
+            return set(self._work_dir_jobs)
+
+    # call callback(event, data) from the listener thread on every stage, findings count and final status of a job
+    # returns a copy of the job record taken at the same time, so that no event is missed in between,
+    # or None if the job id is unknown. Callbacks must be quick e.g., hand the event to an event loop.
+    def subscribe(self, job_id: str, callback):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._subscribers.setdefault(job_id, []).append(callback)
+            return self._copy(job)
+
+    def unsubscribe(self, job_id: str, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(job_id, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(job_id, None)
+
+    @staticmethod
+    def _copy(job: dict):
+        return dict(job, stages=list(job["stages"]))
+
+    # notify the subscribers of a job (must hold the lock)
+    def _publish(self, job_id: str, event: str, data: dict):
+        for callback in self._subscribers.get(job_id, []):
+            callback(event, data)
+
+    # record a new stage of a job, or only its findings count when the stage did not change (must hold the lock)
+    def _progress(self, job: dict, stage: str, at: datetime, findings=None):
+        if stage != job["stage"]:
+            # the previous stage ends when this one starts
+            metrics.observe(metrics.STAGE_DURATION, (at - job["stages"][-1]["at"]).total_seconds(), stage=job["stage"])
+            job["stage"] = stage
+            job["stages"].append({"stage": stage, "at": at})
+            self._publish(job["job_id"], "stage", {"stage": stage, "at": at})
+        if findings is not None and findings != job["findings"]:
+            job["findings"] = findings
+            self._publish(job["job_id"], "findings", {"findings": findings})
+
+    # add one job per compilation unit of a project, they are processed in parallel by the workers
+    # units is a list of {"name", "files", "payload"}, returns the batch id and the job id of each unit
+    # the whole batch is rejected with 429 if its units do not fit in the queue (see submit)
+    def submit_batch(self, units: list, priority: int = 0):
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._admit(len(units))
+            batch_units = [
+                {"name": unit["name"], "files": unit["files"], "job_id": self._add(unit["payload"], priority)} for unit in units
+            ]
+            self._batches[batch_id] = {"batch_id": batch_id, "submitted_at": datetime.now(), "units": batch_units}
+            # keep as many batches as finished jobs, a batch has at least one job
+            while len(self._batches) > config.MAX_FINISHED_JOBS:
+                self._batches.popitem(last=False)
+        return batch_id, batch_units
+
+    # return the batch with the current state of each unit and an overall status, or None if the batch id is unknown
+    # the overall status is queued or running while a unit is not finished, then done, or failed if a unit failed
+    def get_batch(self, batch_id: str):
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            units = []
+            for unit in batch["units"]:
+                # the job of a unit may have been pruned long after it finished
+                job = self._jobs.get(unit["job_id"], {"status": None, "report_id": None, "detail": "Job expired."})
+                units.append({**unit, "status": job["status"], "report_id": job["report_id"], "detail": job["detail"]})
+
+        statuses = {unit["status"] for unit in units}
+        if statuses == {QUEUED}:
+            batch_status = QUEUED
+        elif statuses & {QUEUED, RUNNING}:
+            batch_status = RUNNING
+        elif statuses == {DONE}:
+            batch_status = DONE
+        else:
+            batch_status = FAILED
+        return {"batch_id": batch_id, "status": batch_status, "submitted_at": batch["submitted_at"], "units": units}
+
+    # hand pending jobs to the idle workers, one job per worker (must hold the lock)
+    def _dispatch(self):
+        for worker in self._workers:
+            if not self._pending:
+                return
+            if worker.job_id is not None:
+                continue
+            task = heapq.heappop(self._pending)
+            _, _, job_id, payload = task
+            try:
+                worker.tasks.send((job_id, payload))
+            except OSError: # the worker died, the job waits for its replacement (see _replace_dead_workers)
+                heapq.heappush(self._pending, task)
+                continue
+            worker.job_id = job_id
+            self._in_flight += 1
+
+    # consume the events sent by the workers and keep an eye on crashed workers and on the limits of the jobs
+    # an error handling an event is logged and the listener goes on, as no job could finish without it
+    def _listen(self):
+        while self._running:
+            try:
+                self._enforce_limits()
+                self._respawn_workers()
+                with self._lock:
+                    connections = {worker.events: worker for worker in self._workers}
+                for connection in multiprocessing.connection.wait(list(connections), timeout=config.LIMITS_CHECK_INTERVAL or 1):
+                    self._receive(connections[connection])
+            except Exception as e:
+                print(f"Failed to handle the events of the analysis workers: {e}")
+
+    # handle the next event sent by a worker
+    def _receive(self, worker: Worker):
+        try:
+            event, job_id, data = worker.events.recv()
+        except (EOFError, OSError): # the worker died, or was replaced since the pipes were polled
+            with self._lock:
+                if worker in self._workers:
+                    self._replace(worker, "Analysis worker stopped unexpectedly. Please try again.")
+            return
+
+        if event == METRIC:
+            metrics.record(data["kind"], data["name"], data["value"], data["labels"])
+            return
+
+        if event == READY:
+            with self._lock:
+                worker.ready = True
+                self._startup_failures = 0
+            return
+
+        with self._lock:
+            if event not in (RUNNING, PROGRESS) and worker.job_id == job_id:
+                worker.job_id = None
+                # the worker stops after this job, it is replaced before the next job is dispatched
+                if data.get("recycle"):
+                    self._replace(worker)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if event == RUNNING:
+                job["status"] = RUNNING
+                job["started_at"] = datetime.fromtimestamp(data["at"])
+                job["pid"] = data["pid"]
+                # CPU time used by the worker before this job, see _exceeded_limit
+                try:
+                    job["cpu_start"] = _process_group_usage(data["pid"])[0]
+                except psutil.Error:
+                    job["cpu_start"] = 0
+                self._progress(job, RUNNING, job["started_at"])
+            elif event == PROGRESS:
+                self._progress(job, data["stage"], datetime.fromtimestamp(data["at"]), data.get("findings"))
+            else:
+                self._finish(job, event, report_id=data.get("report_id"), detail=data.get("detail"))
+
+    # mark a job as done, failed, timed out or killed and free its worker slot (must hold the lock)
+    def _finish(self, job: dict, job_status: str, report_id=None, detail=None):
+        # the worker of a stopped job may still have sent its result before being killed
+        if job["status"] in FINISHED:
+            return
+        if job_status != DONE:
+            metrics.inc(metrics.AUDIT_FAILURES, stage=job["stage"])
+        elif job["started_at"] is not None:
+            duration = (datetime.now() - job["started_at"]).total_seconds()
+            self._mean_duration = duration if self._mean_duration is None else 0.8 * self._mean_duration + 0.2 * duration
+        job["status"] = job_status
+        job["finished_at"] = datetime.now()
+        job["report_id"] = report_id
+        job["detail"] = detail
+        job.pop("pid", None)
+        job.pop("cpu_start", None)
+        self._progress(job, job_status, job["finished_at"])
+        self._publish(job["job_id"], job_status, {"report_id": report_id, "detail": detail})
+        self._in_flight -= 1
+        self._release_work_dir(job["job_id"])
+        self._prune()
+        self._dispatch()
+
+    # every LIMITS_CHECK_INTERVAL seconds, stop the jobs over their limits and replace the workers that died
+    def _enforce_limits(self):
+        now = time.monotonic()
+        if now - self._last_limits_check < config.LIMITS_CHECK_INTERVAL:
+            return
+        self._last_limits_check = now
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if job["status"] != RUNNING or not job.get("pid"):
+                    continue
+                reason = self._exceeded_limit(job)
+                if reason:
+                    self._stop_job(job, reason)
+            self._replace_dead_workers()
+
+    # the limit exceeded by a running job: "timeout", "cpu" or "memory", or None
+    @staticmethod
+    def _exceeded_limit(job: dict):
+        elapsed = (datetime.now() - job["started_at"]).total_seconds()
+        if config.ANALYSIS_TIMEOUT_SECONDS and elapsed > config.ANALYSIS_TIMEOUT_SECONDS:
+            return "timeout"
+        if not config.ANALYSIS_MAX_CPU_SECONDS and not config.ANALYSIS_MAX_RSS_MB:
+            return None
+        try:
+            cpu, rss = _process_group_usage(job["pid"])
+        except psutil.Error: # the worker died, see _replace_dead_workers
+            return None
+        if config.ANALYSIS_MAX_CPU_SECONDS and cpu - job["cpu_start"] > config.ANALYSIS_MAX_CPU_SECONDS:
+            return "cpu"
+        if config.ANALYSIS_MAX_RSS_MB and rss > config.ANALYSIS_MAX_RSS_MB * 1024 * 1024:
+            return "memory"
+        return None
+
+    # kill the worker of a job over its limits with every process it started, and replace it with a fresh worker
+    # with new pipes (must hold the lock)
+    def _stop_job(self, job: dict, reason: str):
+        _kill_process_group(job["pid"])
+        for worker in list(self._workers):
+            if worker.pid == job["pid"]:
+                worker.job_id = None
+                self._replace(worker)
+        metrics.inc(metrics.ANALYSES_STOPPED, reason=reason)
+        if reason == "timeout":
+            self._finish(job, TIMED_OUT, detail=f"The analysis took longer than {config.ANALYSIS_TIMEOUT_SECONDS} seconds and was stopped.")
+        else:
+            limit = "CPU time" if reason == "cpu" else "memory"
+            self._finish(job, KILLED, detail=f"The analysis used more {limit} than allowed and was stopped.")
+
+    # replace a worker that stopped, was killed or died with a fresh worker with new pipes, and fail the job it was
+    # running with the given detail (must hold the lock)
+    # the fresh worker is started by the listener outside the lock (see _respawn_workers), right away unless the
+    # worker stopped before loading the engine, which would likely happen again: the delay then doubles each time
+    def _replace(self, worker: Worker, detail: str = None):
+        if not self._running:
+            return
+        self._workers.remove(worker)
+        delay = 0
+        if not worker.ready:
+            self._startup_failures += 1
+            delay = min(config.WORKER_RESPAWN_DELAY * 2 ** (self._startup_failures - 1), config.WORKER_RESPAWN_MAX_DELAY)
+            print(f"Analysis worker stopped before loading the engine, starting another one in {delay:g} seconds")
+        self._respawns.append(time.monotonic() + delay)
+        # waiting for the process to exit can take seconds, which must not block the requests waiting for the lock
+        threading.Thread(target=worker.close, name="worker-reaper", daemon=True).start()
+        job = self._jobs.get(worker.job_id)
+        if job is not None:
+            self._finish(job, FAILED, detail=detail) # frees the slot of the job and dispatches the next one
+        else:
+            self._dispatch()
+
+    # start the workers replacing the stopped ones once their delay is over (see _replace), without holding the lock
+    # while the processes start
+    def _respawn_workers(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [at for at in self._respawns if at <= now]
+            self._respawns = [at for at in self._respawns if at > now]
+        if not due:
+            return
+        workers = [Worker() for _ in due]
+        with self._lock:
+            self._workers.extend(workers)
+            self._dispatch()
+
+    # restart workers that died e.g., killed by the OS, and fail the job they were running (must hold the lock)
+    def _replace_dead_workers(self):
+        for worker in list(self._workers):
+            if not worker.process.is_alive():
+                self._replace(worker, "Analysis worker stopped unexpectedly. Please try again.")
+
+    # remove the scratch folder of a finished job once no other job uses it (must hold the lock)
+    def _release_work_dir(self, job_id: str):
+        work_dir = self._work_dirs.pop(job_id, None)
+        if work_dir is None:
+            return
+        self._work_dir_jobs[work_dir] -= 1
+        if self._work_dir_jobs[work_dir] == 0:
+            del self._work_dir_jobs[work_dir]
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # forget the oldest finished jobs so that the job table does not grow forever (must hold the lock)
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED]
+        for job_id in finished[:max(0, len(finished) - config.MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            self._subscribers.pop(job_id, None)
+
+
+# job queue shared by the endpoints, started and stopped with the FastAPI app
+job_queue = JobQueue(config.ANALYSIS_WORKERS)
+metrics.ANALYSES_IN_FLIGHT.set_function(lambda: job_queue._in_flight)
+metrics.ANALYSES_QUEUED.set_function(lambda: len(job_queue._pending))
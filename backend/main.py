@@ -1,11 +1,114 @@
-from fastapi import FastAPI, UploadFile, HTTPException, status, Depends, File
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Literal, Optional
+from fastapi import FastAPI, UploadFile, HTTPException, status, Depends, File, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_async_db
+from detector_catalog import DEFAULT_PROFILE, DETECTOR_PROFILES, catalog
+import database
+import exports
 import services
 import crud
+import jobs
+import projects
+import cache
+import compilers
+import config
+import metrics
+import profiler
+from profiler import run_in_threadpool # run_in_threadpool of FastAPI, sampled with the request when it is profiled
+import retention
 
-app = FastAPI() # initialise FastAPI app
+# start the analysis worker pool with the app and stop it on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # install the configured compilers in the background, the app does not wait for the downloads
+    threading.Thread(target=compilers.compiler_manager.prewarm, args=(config.SOLC_PREWARM_VERSIONS,), daemon=True).start()
+    # create the database and its tables before the workers may write to them
+    await run_in_threadpool(database.init_db)
+    metrics.track_pool(database.engine.pool, "sync")
+    metrics.track_pool(database.async_engine.pool, "async")
+    jobs.job_queue.start()
+    # apply the retention policies in the background (see retention.py)
+    retention_task = retention.RetentionTask(jobs.job_queue.work_dirs_in_use)
+    retention_task.start()
+    yield
+    retention_task.stop()
+    jobs.job_queue.stop()
+    await database.async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan) # initialise FastAPI app
+
+# largest request body accepted by the upload endpoints, the multipart encoding adds a little to the file sizes
+UPLOAD_LIMITS = {
+    "/upload_contract": config.MAX_UPLOAD_BYTES + config.UPLOAD_CHUNK_SIZE,
+    "/upload_batch": config.MAX_PROJECT_BYTES + config.UPLOAD_CHUNK_SIZE,
+}
+
+# reject uploads announcing a too large body before reading it, the limits are enforced again while streaming the files
+# defined before the CORS middleware so that the browser can read the 413 response
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    limit = UPLOAD_LIMITS.get(request.url.path)
+    content_length = request.headers.get("content-length", "")
+    if limit is not None and content_length.isdigit() and int(content_length) > limit:
+        return JSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            content={"detail": f"The upload is too large, at most {(limit - config.UPLOAD_CHUNK_SIZE) // 1024} KiB are accepted."},
+        )
+    return await call_next(request)
+
+# record the duration of every request, and on demand add a Server-Timing header or profile the request
+# the Server-Timing header lists the database operations of the request (see crud.db_handler) and its total duration
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    timings = [] if config.TIMING_HEADER_ENABLED or request.headers.get("x-request-timing") == "1" else None
+    timings_token = metrics.request_timings.set(timings)
+    profiling = bool(config.PROFILER_TOKEN) and request.headers.get("x-profile") == config.PROFILER_TOKEN
+
+    # sample the event loop thread and the threads of the pool working on the request (see profiler.py)
+    sampler = profiler.SamplingProfiler(threading.get_ident()) if profiling else None
+    profiler_token = profiler.current_profiler.set(sampler)
+
+    start = time.perf_counter()
+    try:
+        if sampler:
+            sampler.start()
+        response = await call_next(request)
+    except BaseException:
+        if sampler:
+            sampler.stop()
+        raise
+    finally:
+        metrics.request_timings.reset(timings_token)
+        profiler.current_profiler.reset(profiler_token)
+    elapsed = time.perf_counter() - start
+
+    # label by route template e.g., /reports/{report_id}, so that the number of label values stays bounded
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_DURATION.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(elapsed)
+
+    if timings is not None:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings]
+        response.headers["Server-Timing"] = ", ".join(entries + [f"total;dur={elapsed * 1000:.2f}"])
+    if profiling:
+        profile_id = uuid.uuid4().hex
+        response.headers["X-Profile-Id"] = profile_id
+        # the sampling goes on until the body is sent, the profile is saved then
+        response.body_iterator = profiler.profiled_body(response.body_iterator, sampler, profile_id)
+    return response
 
 # CORS configuration to allow React app to access the API
 origins = [
@@ -20,17 +123,25 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-# uploading a contract file and creating audit report endpoint
-# status code of 201 (CREATED) indicates a successful upload
-@app.post("/upload_contract", status_code=status.HTTP_201_CREATED)
-async def create_report(contract: UploadFile, db: Session = Depends(get_db)):
-    """
-    Create report involving:
-        (1) Save the uploaded file to the 'uploads' directory
-        (2) Extract the solidity version - to solc-select cmd
-        (3) Create the report using analyze_contract(contract), return .md file path
-        (4) Filter_report(result.md), return the filtered report (parse audit report using regexp)
-        (5) Upload_report(report), upload the filtered report to the database and return status code
+# uploading a contract file and queueing its audit endpoint
+# status code of 202 (ACCEPTED) indicates the upload is queued, the audit itself runs in a worker process
+@app.post("/upload_contract", status_code=status.HTTP_202_ACCEPTED)
+async def create_report(contract: UploadFile, incremental: bool = False, profile: str = DEFAULT_PROFILE):
+    """
+    Validate the uploaded file and queue its audit, without waiting for the audit:
+        (1) Reject the upload with 429 (TOO_MANY_REQUESTS) and a Retry-After header if MAX_QUEUED_JOBS audits are waiting
+        (2) Stream the uploaded file in chunks to the scratch folder of the job while hashing it, and stop with
+            413 (REQUEST_ENTITY_TOO_LARGE) as soon as more than MAX_UPLOAD_BYTES were read
+        (3) Resolve the Solidity version from every pragma of the saved file - to select the solc binary,
+            400 (BAD_REQUEST) if no compiler satisfies them
+        (4) Queue the audit job and respond with 202 (ACCEPTED)
+    The worker pool then runs the pipeline in pipeline.py: the Slither analysis (or the cached result of the same
+    sources), the filtering of its findings and their upload to the database.
+    With incremental=true, the report is a new version of the latest report of the same contract name (if any): the
+    findings unchanged since that version are copied from it and only the new or changed findings are written.
+    profile selects the detectors (see DETECTOR_PROFILES): "triage" only runs the high impact, high confidence
+    detectors and is handed to the workers before the "full" audits waiting in the queue.
+    Returns the job_id to follow the progress of the audit with GET /jobs/{job_id}.
     """  
     try:
         # server validation if the file is provided
@@ -40,37 +151,96 @@ async def create_report(contract: UploadFile, db: Session = Depends(get_db)):
         # server validation if the uploaded file is a .sol file
         if not contract.filename.endswith(".sol"):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file extension. Please upload only .sol files for auditing.")
-        
-        # get current date and time of submission
-        submission_date = services.get_current_date()
-        submission_time = services.get_current_time()
-        
-        # Save the uploaded Solidity file to the server
-        file_path = services.save_uploaded_file(contract)
-        
-        # extract Solidity version from the uploaded .sol file content
-        solidity_version = services.extract_solidity_version(file_path)
-
-        # create and analyse the audit report -> get .md file
-        md_path = services.analyze_contract(file_path, solidity_version)
-
-        # filter the .md report to extract relevant info
-        filtered_report = services.filter_report(md_path)
-        
-        # prepare the report data in the required format
-        report_data = {
-            "contract_name": contract.filename,
-            "submission_date": submission_date,
-            "submission_time": submission_time,
-            "number_of_vulnerabilities": None, # initialise the number of vulnerabilities
-            "vulnerabilities_details": filtered_report,
-        }
-        
-        # upload the filtered report to the database
-        report_id = crud.upload_report(db, report_data)
-        
-        # returns a success message if the upload and analysis are completed successfully and report_id to redirect after success
-        return {"message": "Audit has been uploaded successfully.", "report_id": report_id}
+
+        validate_profile(profile)
+        # reject the upload before reading it if too many audits are waiting, 429 (TOO_MANY_REQUESTS)
+        jobs.job_queue.admit()
+
+        # each audit gets its own scratch folder, removed by the job queue once the report is ingested
+        work_dir = services.create_work_dir()
+        try:
+            # stream the upload to disk off the event loop, hashing it on the way
+            with metrics.time_stage("saving"):
+                file_path, source_hash = await run_in_threadpool(services.save_uploaded_file, contract.file, work_dir, contract.filename)
+
+            # resolve the Solidity version from the pragmas of the uploaded .sol file, off the event loop as it reads
+            # the file and may list the installable compilers
+            with metrics.time_stage("version"):
+                solidity_version = await run_in_threadpool(services.extract_solidity_version, [file_path])
+
+            # queue the audit with the current date and time of submission
+            job_id = jobs.job_queue.submit({
+                "contract_name": contract.filename,
+                "work_dir": work_dir,
+                "target": os.path.basename(file_path),
+                "solidity_version": solidity_version,
+                "source_hash": source_hash,
+                "submission_date": services.get_current_date(),
+                "submission_time": services.get_current_time(),
+                "incremental": incremental,
+                "detector_profile": profile,
+            }, DETECTOR_PROFILES[profile]["priority"])
+        except Exception:
+            services.remove_work_dir(work_dir)
+            raise
+
+        # returns the job_id so that the client can poll the job and redirect to the report once it is done
+        return {"message": "Audit has been queued.", "job_id": job_id}
+    except HTTPException as e:
+        # raise HTTPException with specific error details e.g., invalid file type
+        raise e
+    except Exception as e:
+        # 500 status code and generic error details
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error. Please try again.")
+
+# uploading a project (several .sol files and/or .zip/.tar archives) and queueing its audit endpoint
+# status code of 202 (ACCEPTED) indicates the upload is queued, one audit job per compilation unit of the project
+@app.post("/upload_batch", status_code=status.HTTP_202_ACCEPTED)
+async def create_batch(files: List[UploadFile] = File(...), incremental: bool = False, profile: str = DEFAULT_PROFILE):
+    """
+    Extract the uploaded files into a project folder, keeping the directory layout of the archives so that
+    imports resolve, split the project into independent compilation units (files connected by imports) and
+    queue one audit job per unit. The units are analysed in parallel by the worker pool, each one gets its report
+    (with incremental=true, as a new version of the latest report of the unit name, as for /upload_contract).
+    profile selects the detectors of every unit, as for /upload_contract.
+    Returns the batch_id to follow the progress of the audits with GET /batches/{batch_id}.
+    """
+    try:
+        validate_profile(profile)
+        # reject the upload before reading it if too many audits are waiting, 429 (TOO_MANY_REQUESTS)
+        jobs.job_queue.admit()
+
+        # the units of the project share its scratch folder, removed by the job queue once they are all finished
+        work_dir = services.create_work_dir()
+        try:
+            # extracting and reading the files is blocking, keep it off the event loop
+            units = await run_in_threadpool(projects.prepare_project, [(file.filename, file.file) for file in files], work_dir)
+        except Exception:
+            services.remove_work_dir(work_dir)
+            raise
+
+        # queue the audits with the current date and time of submission
+        submission_date, submission_time = services.get_current_date(), services.get_current_time()
+        batch_id, batch_units = jobs.job_queue.submit_batch([
+            {
+                "name": unit["name"],
+                "files": unit["files"],
+                "payload": {
+                    "contract_name": unit["name"],
+                    "work_dir": work_dir,
+                    "target": unit["target"],
+                    "solidity_version": unit["solidity_version"],
+                    "source_hash": unit["source_hash"],
+                    "submission_date": submission_date,
+                    "submission_time": submission_time,
+                    "incremental": incremental,
+                    "detector_profile": profile,
+                },
+            }
+            for unit in units
+        ], DETECTOR_PROFILES[profile]["priority"])
+
+        return {"message": "Audits have been queued.", "batch_id": batch_id, "units": batch_units}
     except HTTPException as e:
         # raise HTTPException with specific error details e.g., invalid file type
         raise e
@@ -78,20 +248,348 @@ async def create_report(contract: UploadFile, db: Session = Depends(get_db)):
         # 500 status code and generic error details
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error. Please try again.")
 
+# server validation of the detector profile of an upload
+def validate_profile(profile: str):
+    if profile not in DETECTOR_PROFILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown detector profile. Please choose one of: {', '.join(DETECTOR_PROFILES)}.",
+        )
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/batches/{batch_id}", status_code=status.HTTP_200_OK)
+async def get_batch(batch_id: str):
+    """Get the overall status of a project upload and the status and report_id of each of its compilation units."""
+    batch = jobs.job_queue.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found.")
+    return batch
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_job(job_id: str):
+    """Get the status of an audit job (queued, running, done or failed) and the report_id once it is done."""
+    job = jobs.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return job
+
+# interval between two comments sent on an idle event stream, so that proxies do not close the connection
+SSE_KEEPALIVE_SECONDS = 15
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/jobs/{job_id}/events", status_code=status.HTTP_200_OK)
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream the progress of an audit job as Server-Sent Events, instead of polling GET /jobs/{job_id}:
+        - "stage": the job entered a stage (queued, running, analysing or cached, filtering, storing) with its timestamp
+        - "findings": number of findings parsed so far
+        - "done" with the report_id, or "failed" with the error details, after which the stream ends
+    The stages the job already went through are sent first, so a client connecting late misses nothing.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    # called by the job queue from its listener thread, hand the event over to this event loop
+    def notify(event: str, data: dict):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    job = jobs.job_queue.subscribe(job_id, notify)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+
+    async def event_stream():
+        try:
+            for stage in job["stages"]:
+                yield sse_message("stage", stage)
+            if job["findings"]:
+                yield sse_message("findings", {"findings": job["findings"]})
+            if job["status"] in jobs.FINISHED:
+                yield sse_message(job["status"], {"report_id": job["report_id"], "detail": job["detail"]})
+                return
+
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_message(event, data)
+                if event in jobs.FINISHED:
+                    return
+        finally:
+            jobs.job_queue.unsubscribe(job_id, notify)
+
+    # no-transform and X-Accel-Buffering prevent proxies from buffering the stream
+    headers = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+# format one Server-Sent Event, the data is JSON with the timestamps in ISO 8601
+def sse_message(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data, default=lambda value: value.isoformat())}\n\n"
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/metrics", status_code=status.HTTP_200_OK)
+async def get_metrics():
+    """
+    Get the metrics of the backend in the Prometheus text format: duration of each audit stage, of the database
+    operations and of the HTTP requests, compiler installs, cache hits and misses, failures by stage,
+    analyses in flight or queued and database pool usage.
+    """
+    content, content_type = metrics.export()
+    return Response(content, media_type=content_type)
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/debug/profiles/{profile_id}", status_code=status.HTTP_200_OK)
+async def get_profile(profile_id: str, request: Request):
+    """
+    Get the profile of a request sent with the "X-Profile: <PROFILER_TOKEN>" header, by the X-Profile-Id of its response.
+    The profile lists the sampled stacks in the collapsed format of flame graph tools. Requires the same header.
+    """
+    if not config.PROFILER_TOKEN or request.headers.get("x-profile") != config.PROFILER_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found.")
+    file_path = os.path.join(config.PROFILES_DIR, f"{profile_id}.txt")
+    if not profile_id.isalnum() or not os.path.exists(file_path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found.")
+    with open(file_path) as f:
+        return PlainTextResponse(f.read())
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/cache/stats", status_code=status.HTTP_200_OK)
+async def get_cache_stats(name: Literal["analysis", "compilation"] = "analysis"):
+    """
+    Get the size, hit/miss counters and hit rate of the analysis result cache, or of the compilation artifact cache
+    with ?name=compilation, with the bytes and seconds of analysis or compilation saved by the hits.
+    """
+    return await run_in_threadpool(cache.DISK_CACHES[name].stats)
+
 # status code of 200 (OK) indicates a successful retrieval
 @app.get("/reports/", status_code=status.HTTP_200_OK)
-async def get_all_reports(db: Session = Depends(get_db)):
-    """Get all reports endpoint, returns a list of all reports."""
-    return crud.get_all_reports(db)
+async def get_all_reports(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    contract_name: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    min_vulnerabilities: Optional[int] = Query(None, ge=0),
+    sort_by: Literal["submission_date", "contract_name", "number_of_vulnerabilities"] = "submission_date",
+    order: Literal["asc", "desc"] = "desc",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get a page of reports, the most recent first, optionally filtered by contract name prefix,
+    submission date range and minimum number of vulnerabilities, and sorted by sort_by in the given order
+    (ties by submission date and time).
+    Returns the reports and the next_cursor to pass as cursor to get the next page (None on the last page),
+    with the same filters and sort.
+    The query runs on the async session, the event loop keeps serving other requests while waiting for the database.
+    """
+    return await db.run_sync(
+        crud.get_all_reports, limit, cursor, contract_name, date_from, date_to, min_vulnerabilities, sort_by, order
+    )
 
 # status code of 200 (OK) indicates a successful retrieval
 @app.get("/reports/{report_id}", status_code=status.HTTP_200_OK)
-async def get_report(report_id: int, db: Session = Depends(get_db)):
-    """Get a specific report by ID."""
-    return crud.get_report(db, report_id)
+async def get_report(
+    report_id: int,
+    request: Request,
+    view: Literal["full", "summary"] = "full",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get a specific report by ID.
+    The report is served from its precomputed document with a strong ETag: a request with a matching
+    If-None-Match header gets 304 (NOT_MODIFIED) without the body.
+    With ?view=summary, only the report fields and the impact, confidence and number of results of each vulnerability
+    type are returned, counted by the database: the results of a type are then read page by page with
+    GET /reports/{report_id}/vulnerabilities/{vulnerability_type}/results, and the detector documentation from GET /detectors.
+    """
+    if view == "summary":
+        return await db.run_sync(crud.get_report_summary, report_id)
+
+    etag, content = await db.run_sync(crud.get_report_document, report_id)
+    headers = {
+        "ETag": f'"{etag}"',
+        # clients may keep the report but must revalidate it, as it can be deleted
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+    # the client already has this version of the report
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # send the stored gzip content as is to clients accepting it, decompress it for the others
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(content, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(gzip.decompress(content), media_type="application/json", headers=headers)
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/reports/{report_id}/vulnerabilities/{vulnerability_type}/results", status_code=status.HTTP_200_OK)
+async def get_vulnerability_results(
+    report_id: int,
+    vulnerability_type: str,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get a page of the results of one vulnerability type within a report, in result order.
+    Returns the results and the next_offset to pass as offset to get the next page (None on the last page).
+    """
+    return await db.run_sync(crud.get_vulnerability_results, report_id, vulnerability_type, limit, offset)
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/detectors", status_code=status.HTTP_200_OK)
+async def get_detectors(request: Request):
+    """
+    Get the documentation of every Slither detector: title, impact, confidence, description, exploit scenario and
+    recommendation by check name, as used by the report summaries.
+    The catalog only changes with the detector documentation, it is sent with a strong ETag and may be cached
+    by clients and proxies for DETECTOR_CATALOG_MAX_AGE seconds.
+    """
+    etag, content = await run_in_threadpool(catalog.document)
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={config.DETECTOR_CATALOG_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(content, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(gzip.decompress(content), media_type="application/json", headers=headers)
+
+# check if an If-None-Match header matches the ETag of a resource
+def etag_matches(if_none_match: Optional[str], etag: str):
+    if not if_none_match:
+        return False
+    # the header is either "*" or a list of ETags, possibly weak e.g., W/"abc", "def"
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        (candidate[2:] if candidate.startswith("W/") else candidate).strip('"') == etag for candidate in candidates
+    )
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/reports/{report_id}/diff/{other_report_id}", status_code=status.HTTP_200_OK)
+async def get_report_diff(report_id: int, other_report_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Compare a report with another report, typically a re-audit of the same contract after a fix.
+    Returns the findings that are new in the other report, the findings resolved in it (only in the first report)
+    and the number of unchanged findings. Findings are matched by their fingerprint, which does not depend on line numbers.
+    """
+    return await db.run_sync(crud.get_report_diff, report_id, other_report_id)
 
 # status code of 204 (NO_CONTENT) indicates a successful deletion
+# a sync endpoint, FastAPI runs it in its thread pool so that the sync session does not block the event loop
 @app.delete("/reports/{report_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_report(report_id: int, db: Session = Depends(get_db)):
+@profiler.traced # sampled when the request is profiled, as it runs in the thread pool
+def delete_report(report_id: int, db: Session = Depends(get_db)):
     """Delete a specific audit report by ID endpoint, returns a response with a status code of 204 (NO_CONTENT), indicating a successful deletion."""
-    return crud.delete_report(db, report_id)
+    response = crud.delete_report(db, report_id)
+    # the files of the report go with it, once its rows are deleted
+    retention.remove_artifacts(report_id)
+    return response
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/reports/{report_id}/raw", status_code=status.HTTP_200_OK)
+@profiler.traced # sampled when the request is profiled, as it runs in the thread pool
+def get_raw_output(report_id: int, request: Request):
+    """
+    Get the raw Slither JSON output of a report, as produced by the analysis before filtering.
+    Raw outputs are kept compressed for RAW_OUTPUT_MAX_AGE_DAYS (see retention.py), 404 (NOT_FOUND) once removed
+    or for reports served from the analysis cache.
+    """
+    file_path = retention.raw_output_path(report_id)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Raw output not found")
+    headers = {"Vary": "Accept-Encoding"}
+
+    # send the stored gzip file as is to clients accepting it, decompress it on the fly for the others
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return FileResponse(file_path, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return StreamingResponse(
+        profiler.traced_iterator(_decompressed(file_path)), media_type="application/json", headers=headers
+    )
+
+# the content of a gzip file in chunks
+def _decompressed(file_path: str):
+    with gzip.open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/search", status_code=status.HTTP_200_OK)
+async def search_findings(
+    q: str = Query(..., min_length=1, max_length=255),
+    vulnerability_type: Optional[str] = None,
+    impact: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Search the findings of all reports for every term of q, e.g. a function, state variable or file path, in their
+    contract name, location, element, source file and description, optionally filtered by vulnerability type and impact.
+    Returns a page of the matching findings, the most relevant first, each with its report_id and a snippet of its
+    description as escaped HTML with the terms between <mark> tags, and the next_offset to get the next page (None on the last page).
+    """
+    return await db.run_sync(crud.search_findings, q, vulnerability_type, impact, limit, offset)
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/analytics/vulnerabilities", status_code=status.HTTP_200_OK)
+async def get_top_vulnerabilities(
+    limit: int = Query(20, ge=1, le=500),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get the vulnerability types found most often across all reports, optionally within a submission date range,
+    with their impact, confidence, number of findings and number of reports they were found in.
+    """
+    return await db.run_sync(crud.get_top_vulnerabilities, limit, date_from, date_to)
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/analytics/trends", status_code=status.HTTP_200_OK)
+async def get_findings_over_time(
+    interval: Literal["day", "week"] = "week",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get the number of findings by impact and by confidence for each day or week (starting on Monday)
+    of the submission dates, in chronological order.
+    """
+    return await db.run_sync(crud.get_findings_over_time, interval, date_from, date_to)
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/analytics/contracts", status_code=status.HTTP_200_OK)
+async def get_top_contracts(limit: int = Query(20, ge=1, le=500), db: AsyncSession = Depends(get_async_db)):
+    """Get the contracts with the most high impact findings, with their number of reports and findings."""
+    return await db.run_sync(crud.get_top_contracts, limit)
+
+# status code of 200 (OK) indicates a successful retrieval
+@app.get("/export", status_code=status.HTTP_200_OK)
+@profiler.traced # sampled when the request is profiled, as it runs in the thread pool
+def export_findings(
+    format: Literal["ndjson", "csv", "sarif"] = "ndjson",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    impact: Optional[str] = None,
+):
+    """
+    Export every finding of every report, optionally filtered by submission date range and impact, as NDJSON
+    (one JSON object per line), CSV or a SARIF 2.1.0 log. The export is streamed as it is read from the database,
+    so it starts immediately and its size is not limited by the memory of the server.
+    """
+    media_type, extension = exports.FORMATS[format]
+    content = exports.EXPORTS[format](date_from=date_from, date_to=date_to, impact=impact)
+    headers = {"Content-Disposition": f'attachment; filename="findings.{extension}"'}
+    return StreamingResponse(profiler.traced_iterator(content), media_type=media_type, headers=headers)
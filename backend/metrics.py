@@ -0,0 +1,108 @@
+# this file defines the Prometheus metrics of the backend, exposed by the GET /metrics endpoint.
+# the metrics live in the server process: the analysis workers (see jobs.py) forward what they record to the server
+# through their event pipe, so that a single /metrics endpoint covers the whole pipeline.
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# buckets from 5 ms to 5 minutes, Slither analyses and compiler downloads take seconds to minutes
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_DURATION = Histogram(
+    "audit_stage_duration_seconds", "Duration of each stage of the audit pipeline.", ["stage"], buckets=DURATION_BUCKETS
+)
+CRUD_DURATION = Histogram(
+    "crud_duration_seconds", "Duration of the database operations of crud.py.", ["function"], buckets=DURATION_BUCKETS
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Duration of the HTTP requests.", ["method", "route", "status"], buckets=DURATION_BUCKETS
+)
+SOLC_INSTALLS = Counter("solc_installs_total", "Solidity compilers installed with solc-select.", ["result"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Lookups in the analysis and report caches.", ["cache", "result"])
+AUDIT_FAILURES = Counter("audit_failures_total", "Failed audits by the stage they failed in.", ["stage"])
+ANALYSES_STOPPED = Counter("analyses_stopped_total", "Analyses stopped for exceeding a limit, by limit.", ["reason"])
+RETENTION_BYTES_RECLAIMED = Counter(
+    "retention_bytes_reclaimed_total", "Bytes of files removed by the retention policies, by kind of file.", ["kind"]
+)
+RETENTION_ROWS_DELETED = Counter("retention_rows_deleted_total", "Rows deleted by the retention task, by table.", ["table"])
+ANALYSES_IN_FLIGHT = Gauge("analyses_in_flight", "Audit jobs handed to the analysis workers and not finished yet.")
+ANALYSES_QUEUED = Gauge("analyses_queued", "Audit jobs waiting for a free analysis worker.")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections of the server in use.", ["engine"])
+DB_POOL_SIZE = Gauge("db_pool_size", "Database connections of the server kept in the pool.", ["engine"])
+
+# metrics that the workers can record, by the name they are forwarded with
+_METRICS = {
+    "stage_duration": STAGE_DURATION,
+    "crud_duration": CRUD_DURATION,
+    "solc_installs": SOLC_INSTALLS,
+    "cache_lookups": CACHE_LOOKUPS,
+    "audit_failures": AUDIT_FAILURES,
+}
+_NAMES = {metric: name for name, metric in _METRICS.items()}
+
+# in a worker process, function sending (kind, name, value, labels) to the server instead of recording it here
+_forwarder = None
+
+# durations of the crud operations of the current request, for the Server-Timing header (see main.py)
+request_timings = ContextVar("request_timings", default=None)
+
+
+def set_forwarder(forwarder):
+    global _forwarder
+    _forwarder = forwarder
+
+
+# record a value forwarded by a worker: "inc" for counters, "observe" for histograms
+def record(kind: str, name: str, value: float, labels: dict):
+    metric = _METRICS[name].labels(**labels)
+    if kind == "inc":
+        metric.inc(value)
+    else:
+        metric.observe(value)
+
+
+def inc(metric, amount: float = 1, **labels):
+    if _forwarder is not None:
+        _forwarder("inc", _NAMES[metric], amount, labels)
+    else:
+        metric.labels(**labels).inc(amount)
+
+
+def observe(metric, value: float, **labels):
+    if _forwarder is not None:
+        _forwarder("observe", _NAMES[metric], value, labels)
+    else:
+        metric.labels(**labels).observe(value)
+
+
+# time the enclosed block as a stage of the audit pipeline
+@contextmanager
+def time_stage(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(STAGE_DURATION, time.perf_counter() - start, stage=stage)
+
+
+# time a crud operation, adding it to the timings of the current request if they are collected
+def observe_crud(function: str, elapsed: float):
+    observe(CRUD_DURATION, elapsed, function=function)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((function, elapsed))
+
+
+# report the usage of a SQLAlchemy connection pool under the given engine name, pools without counters are skipped
+def track_pool(pool, engine: str):
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CHECKED_OUT.labels(engine=engine).set_function(pool.checkedout)
+    if hasattr(pool, "size"):
+        DB_POOL_SIZE.labels(engine=engine).set_function(pool.size)
+
+
+# body and content type of the GET /metrics response
+def export():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,205 @@
+# this file brings the schema of an existing database up to date with models.py, run by database.init_db at startup.
+# create_all only creates the missing tables: the columns and indexes added to the existing tables since the database
+# was created are added here with ALTER TABLE / CREATE INDEX, and the new columns are backfilled for the existing rows.
+# every step checks the current schema first, so the migration is idempotent and a no-op on an up to date database.
+
+from sqlalchemy import bindparam, func, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Base, Report, ReportDocument, Result, Vulnerability, VulnerabilityStat
+import analytics
+import crud
+
+# number of results given a fingerprint per transaction by the backfill
+FINGERPRINT_BATCH_SIZE = 1000
+# number of reports given a document per transaction by the backfill
+DOCUMENT_BATCH_SIZE = 100
+
+# indexes created by earlier versions of the models and since removed, by table
+# results.report_id is covered by ix_results_report_fingerprint, whose first column it is
+OBSOLETE_INDEXES = {
+    "results": ["ix_results_report_id"],
+}
+
+
+# add the columns of the models missing from their existing table, returns the added columns as (table, column) pairs
+# columns with a scalar default (e.g., reports.detector_profile) are set to it on the existing rows
+def add_missing_columns(engine):
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue # created by create_all with every column
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+                if column.default is not None and column.default.is_scalar:
+                    connection.execute(table.update().where(column.is_(None)).values({column.name: column.default.arg}))
+            added.append((table.name, column.name))
+    return added
+
+
+# merge the vulnerability types created twice by concurrent uploads before the types were unique, so that the unique
+# index of vulnerabilities.vulnerability_type can be created: the results and the full-text index are repointed to the
+# first row of each type, the other rows are deleted and the analytics summary is recomputed
+# returns the number of rows deleted
+def merge_duplicate_vulnerabilities(engine):
+    inspector = inspect(engine)
+    if not inspector.has_table("vulnerabilities"):
+        return 0
+    if "ix_vulnerabilities_type" in {index["name"] for index in inspector.get_indexes("vulnerabilities")}:
+        return 0 # the types are already unique
+    with engine.begin() as connection:
+        first = (
+            select(Vulnerability.vulnerability_type, func.min(Vulnerability.vulnerability_id).label("first_id"))
+            .where(Vulnerability.vulnerability_type.isnot(None))
+            .group_by(Vulnerability.vulnerability_type)
+            .having(func.count() > 1)
+            .subquery()
+        )
+        duplicates = [
+            {"row_id": row.vulnerability_id, "first_id": row.first_id}
+            for row in connection.execute(
+                select(Vulnerability.vulnerability_id, first.c.first_id)
+                .join(first, Vulnerability.vulnerability_type == first.c.vulnerability_type)
+                .where(Vulnerability.vulnerability_id != first.c.first_id)
+            )
+        ]
+        if not duplicates:
+            return 0
+        connection.execute(
+            Result.__table__.update()
+            .where(Result.vulnerability_id == bindparam("row_id"))
+            .values(vulnerability_id=bindparam("first_id")),
+            duplicates,
+        )
+        if inspector.has_table("result_search"):
+            connection.execute(
+                text("UPDATE result_search SET vulnerability_id = :first_id WHERE vulnerability_id = :row_id"), duplicates
+            )
+        duplicate_ids = [duplicate["row_id"] for duplicate in duplicates]
+        connection.execute(VulnerabilityStat.__table__.delete().where(VulnerabilityStat.vulnerability_id.in_(duplicate_ids)))
+        connection.execute(Vulnerability.__table__.delete().where(Vulnerability.vulnerability_id.in_(duplicate_ids)))
+    # the counts of the deleted rows are recomputed under the first row of their type
+    with Session(engine) as db:
+        analytics.rebuild(db)
+    return len(duplicates)
+
+
+# create the indexes of the models missing from their existing table, returns the names of the created indexes
+def create_missing_indexes(engine):
+    inspector = inspect(engine)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                created.append(index.name)
+    return created
+
+
+# drop the indexes that the models no longer define, once their replacements exist (see create_missing_indexes)
+# returns the names of the dropped indexes
+def drop_obsolete_indexes(engine):
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    dropped = []
+    for table_name, index_names in OBSOLETE_INDEXES.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table_name)}
+        for index_name in index_names:
+            if index_name not in existing:
+                continue
+            # MySQL names the table of the index, SQLite does not accept it
+            on_table = f" ON {quote(table_name)}" if engine.dialect.name == "mysql" else ""
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP INDEX {quote(index_name)}{on_table}"))
+            dropped.append(index_name)
+    return dropped
+
+
+# compute the fingerprint of the results stored before results had one, by batches each in its own transaction
+# (see crud.finding_fingerprint), returns the number of results updated
+def backfill_fingerprints(engine):
+    updated = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                text("""
+                    SELECT results.result_id, results.description, results.location, results.source_file,
+                           results.line_start, results.line_end, results.element_name, vulnerabilities.vulnerability_type
+                    FROM results JOIN vulnerabilities ON vulnerabilities.vulnerability_id = results.vulnerability_id
+                    WHERE results.fingerprint IS NULL
+                    LIMIT :limit
+                """),
+                {"limit": FINGERPRINT_BATCH_SIZE},
+            ).all()
+            if not rows:
+                return updated
+            connection.execute(
+                Result.__table__.update()
+                .where(Result.result_id == bindparam("row_id"))
+                .values(fingerprint=bindparam("row_fingerprint")),
+                [
+                    {
+                        "row_id": row.result_id,
+                        "row_fingerprint": crud.finding_fingerprint(row.vulnerability_type, crud.result_info(row)),
+                    }
+                    for row in rows
+                ],
+            )
+        updated += len(rows)
+
+
+# store the document of the reports uploaded before documents were stored (see crud.get_report_document), by batches
+# each in its own transaction, returns the number of documents stored
+def backfill_report_documents(engine):
+    stored = 0
+    while True:
+        with Session(engine) as db:
+            report_ids = db.scalars(
+                select(Report.report_id)
+                .where(~select(ReportDocument.report_id).where(ReportDocument.report_id == Report.report_id).exists())
+                .order_by(Report.report_id)
+                .limit(DOCUMENT_BATCH_SIZE)
+            ).all()
+            if not report_ids:
+                return stored
+            for report_id in report_ids:
+                etag, content = crud.serialize_report_document(crud.build_report(db, report_id))
+                db.add(ReportDocument(report_id=report_id, etag=etag, content=content))
+            try:
+                db.commit()
+            except IntegrityError:
+                # another process starting at the same time stored some of them, the next batch skips them
+                db.rollback()
+                continue
+        stored += len(report_ids)
+
+
+# bring the schema up to date and backfill the new columns
+def migrate(engine):
+    added = add_missing_columns(engine)
+    merged = merge_duplicate_vulnerabilities(engine)
+    if merged:
+        print(f"Merged {merged} duplicate vulnerability types")
+    created = create_missing_indexes(engine)
+    dropped = drop_obsolete_indexes(engine)
+    if added or created or dropped:
+        print(f"Database migrated: added columns {added}, created indexes {created}, dropped indexes {dropped}")
+    # also resumes a backfill interrupted by a restart
+    updated = backfill_fingerprints(engine)
+    if updated:
+        print(f"Fingerprints computed for {updated} existing results")
+    stored = backfill_report_documents(engine)
+    if stored:
+        print(f"Documents stored for {stored} existing reports")
@@ -1,6 +1,7 @@
 # this file defines the database models/tables using SQLAlchemy's declarative base.
 
-from sqlalchemy import Column, Integer, String, Text, Date, Time, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Date, Time, ForeignKey, Index, LargeBinary
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -11,6 +12,10 @@ class Vulnerability(Base):
     Table to store information about vulnerabilities.
     """
     __tablename__ = 'vulnerabilities'
+    __table_args__ = (
+        # one row per type, so that concurrent uploads of a new type share it (see crud.resolve_vulnerability_ids)
+        Index('ix_vulnerabilities_type', 'vulnerability_type', unique=True),
+    )
 
     vulnerability_id = Column(Integer, primary_key=True, autoincrement=True)
     vulnerability_type = Column(String(255))
@@ -27,12 +32,21 @@ class Report(Base):
     Table to store information about reports.
     """
     __tablename__ = 'reports'
+    __table_args__ = (
+        # keyset pagination of the report list, most recent first
+        Index('ix_reports_submitted', 'submission_date', 'submission_time', 'report_id'),
+        # contract name prefix filter of the report list
+        Index('ix_reports_contract_name', 'contract_name', 'submission_date', 'submission_time', 'report_id'),
+        # minimum number of vulnerabilities filter of the report list
+        Index('ix_reports_vulnerabilities', 'number_of_vulnerabilities', 'submission_date', 'submission_time', 'report_id'),
+    )
 
     report_id = Column(Integer, primary_key=True, autoincrement=True)
     contract_name = Column(String(255))
     submission_date = Column(Date)
     submission_time = Column(Time)
     number_of_vulnerabilities = Column(Integer, default=0)
+    detector_profile = Column(String(32), default='full') # detectors run by the audit e.g., "triage" or "full"
     
     # establish many-to-many relationship between vulnerabilities and reports through Result table
     vulnerabilities = relationship('Result', back_populates='report')
@@ -42,13 +56,66 @@ class Result(Base):
     Table to store information about results and the relationship between reports and vulnerabilities.
     """
     __tablename__ = 'results'
+    __table_args__ = (
+        # diff of two reports and incremental upload: the findings of a report by fingerprint
+        Index('ix_results_report_fingerprint', 'report_id', 'fingerprint'),
+    )
 
     result_id = Column(Integer, primary_key=True, autoincrement=True)
     description = Column(Text) # as description is long so Text data type is used
     location = Column(String(255))
-    report_id = Column(Integer, ForeignKey('reports.report_id')) # foreign key to reports table
+    # structured source mapping of the finding from Slither's JSON output
+    source_file = Column(String(255))
+    line_start = Column(Integer)
+    line_end = Column(Integer)
+    element_name = Column(String(255)) # e.g., the vulnerable function or state variable
+    # stable identity of the finding across versions of a contract: hash of the vulnerability type, source file,
+    # element and description without line numbers (see crud.finding_fingerprint)
+    fingerprint = Column(String(64))
+    # foreign key to reports table, the get/delete report queries use the ix_results_report_fingerprint index
+    report_id = Column(Integer, ForeignKey('reports.report_id'))
     vulnerability_id = Column(Integer, ForeignKey('vulnerabilities.vulnerability_id')) # foreign key to vulnerabilities table
 
     # establish many-to-one relationship between reports/vulnerabilities and result table
     report = relationship('Report', back_populates='vulnerabilities')
     vulnerability = relationship('Vulnerability', back_populates='reports')
+
+class ReportDocument(Base):
+    """
+    Table to store the finished document of each report, as returned by GET /reports/{id}.
+    Reports never change after upload, so the document is serialized once at ingestion and stored gzip compressed.
+    """
+    __tablename__ = 'report_documents'
+
+    report_id = Column(Integer, ForeignKey('reports.report_id'), primary_key=True) # one document per report
+    etag = Column(String(64)) # sha256 of the JSON document, used as strong ETag
+    content = Column(LargeBinary().with_variant(mysql.LONGBLOB(), 'mysql')) # gzip compressed JSON, can exceed 64 KB
+
+class VulnerabilityStat(Base):
+    """
+    Summary table of the findings of each vulnerability type per day, for the analytics endpoints.
+    Maintained incrementally by upload_report and delete_report (see analytics.py), so analytics queries read
+    one row per day and vulnerability type instead of every result.
+    """
+    __tablename__ = 'vulnerability_stats'
+
+    day = Column(Date, primary_key=True) # submission date of the reports
+    vulnerability_id = Column(Integer, ForeignKey('vulnerabilities.vulnerability_id'), primary_key=True)
+    findings = Column(Integer, nullable=False, default=0) # number of results of the type
+    reports = Column(Integer, nullable=False, default=0) # number of reports with at least one result of the type
+
+class ContractStat(Base):
+    """
+    Summary table of the reports and findings of each contract name, for the analytics endpoints.
+    Maintained incrementally by upload_report and delete_report (see analytics.py).
+    """
+    __tablename__ = 'contract_stats'
+    __table_args__ = (
+        # contracts with the most high impact findings
+        Index('ix_contract_stats_high_impact', 'high_impact_findings'),
+    )
+
+    contract_name = Column(String(255), primary_key=True)
+    reports = Column(Integer, nullable=False, default=0)
+    findings = Column(Integer, nullable=False, default=0)
+    high_impact_findings = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,110 @@
+# this file contains the audit pipeline that turns an uploaded contract into a report in the database.
+# it runs inside the analysis worker processes managed by jobs.py, never on the FastAPI event loop.
+
+import os
+import time
+import config
+import crud
+import cache
+import engines
+import metrics
+import retention
+import services
+from database import SessionLocal
+from detector_catalog import DEFAULT_PROFILE, catalog
+
+
+def process_contract(job: dict, progress=None):
+    """
+    Process one queued upload:
+        (1)-(2) Done on upload: the file is saved to the scratch folder of the job and its solidity version extracted
+        (3) Analyse the contract with the Slither engine of the worker (see engines.py)
+        (4) Filter the findings, return the filtered report
+        (5) Upload_report(report), upload the filtered report to the database and return the report_id
+            (with "incremental" in the job, the unchanged findings are copied from the latest report of the contract)
+        (6) Keep the compressed raw Slither output of the report (see retention.py)
+    Steps (3) and (4) are skipped when the same source was already analysed with the same compiler, Slither version
+    and detectors, and the compilation of step (3) when it was already compiled with the same compiler.
+    The detectors are those of the "detector_profile" of the job (see detector_catalog.DETECTOR_PROFILES).
+    progress(stage, **data) is called when the job enters the "analysing", "cached", "filtering" and "storing" stages,
+    and with the number of findings parsed so far while filtering (see jobs.py).
+    """
+    progress = progress or _no_progress
+
+    # the upload was streamed into the scratch folder of the job and its Solidity version read on the way,
+    # for a compilation unit of a project the folder holds the whole project (see projects.prepare_project)
+    source_root = job["work_dir"]
+    file_path = os.path.join(source_root, job["target"])
+    solidity_version = job["solidity_version"]
+    source_hash = job["source_hash"]
+    # the detectors run by the profile chosen on upload, None for every detector
+    detector_profile = job.get("detector_profile", DEFAULT_PROFILE)
+    detectors = catalog.profile_checks(detector_profile)
+
+    # reuse the filtered report of a previous analysis of the same contract with the same detectors if there is one
+    cache_key = cache.analysis_cache_key(source_hash, job["target"], solidity_version, detectors)
+    filtered_report = _get_cached_analysis(cache_key)
+    metrics.inc(metrics.CACHE_LOOKUPS, cache="analysis", result="miss" if filtered_report is None else "hit")
+
+    if filtered_report is None:
+        # analyse the contract and filter the findings to extract relevant info
+        progress("analysing")
+        start = time.perf_counter()
+        filtered_report = engines.get_engine().analyze(
+            file_path, solidity_version, source_root, progress, detectors, source_hash
+        )
+        _cache_analysis(cache_key, filtered_report, time.perf_counter() - start)
+    else:
+        progress("cached", findings=sum(len(v["results"]) for v in filtered_report))
+
+    # prepare the report data in the required format
+    report_data = {
+        "contract_name": job["contract_name"],
+        "submission_date": job["submission_date"],
+        "submission_time": job["submission_time"],
+        "detector_profile": detector_profile,
+        "number_of_vulnerabilities": None, # initialise the number of vulnerabilities
+        "vulnerabilities_details": filtered_report,
+    }
+
+    # upload the filtered report to the database, the worker owns its session as there is no request scope here
+    progress("storing")
+    db = SessionLocal()
+    try:
+        report_id = crud.upload_report(db, report_data, incremental=job.get("incremental", False))
+    finally:
+        db.close()
+
+    # keep the raw Slither output of the analysis, there is none when the analysis was cached
+    raw_output = services.raw_output_path(file_path)
+    if config.RAW_OUTPUTS_ENABLED and os.path.exists(raw_output):
+        _store_raw_output(report_id, raw_output)
+    return report_id
+
+
+def _no_progress(stage: str, **data):
+    pass
+
+
+# the analysis cache is only an optimisation, an unavailable cache must never fail the audit
+def _get_cached_analysis(cache_key: str):
+    try:
+        return cache.get_cached_analysis(cache_key)
+    except Exception as e:
+        print(e)
+        return None
+
+
+def _cache_analysis(cache_key: str, filtered_report: list, duration: float):
+    try:
+        cache.cache_analysis(cache_key, filtered_report, duration)
+    except Exception as e:
+        print(e)
+
+
+# the raw output is only kept for reference, failing to store it must never fail the audit
+def _store_raw_output(report_id: int, raw_output: str):
+    try:
+        retention.store_raw_output(report_id, raw_output)
+    except Exception as e:
+        print(e)
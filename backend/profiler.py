@@ -0,0 +1,134 @@
+# this file contains a small sampling profiler that can be turned on at runtime for a single request (see main.py).
+# while a request is handled, the stacks of the threads working on it are sampled at a fixed interval, and the samples
+# are saved in the "collapsed stacks" format read by flame graph tools (e.g. flamegraph.pl, speedscope).
+# the event loop thread is sampled from the start of the request to the end of its body; the threads of the thread pool
+# are sampled while they run a sync endpoint, a function of run_in_threadpool or the next chunk of a streamed body,
+# which find the profiler of their request in current_profiler.
+
+import functools
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.concurrency import run_in_threadpool as _run_in_threadpool
+import config
+
+# the profiler of the request being handled, None when it is not profiled
+current_profiler = ContextVar("current_profiler", default=None)
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of the threads working on a request from a background thread, as a context manager."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.interval = interval
+        self.samples = Counter() # collapsed stack -> number of samples
+        self._thread_ids = Counter({thread_id: 1}) # sampled thread -> number of nested track() blocks
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._thread_ids)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    # sample the current thread until the end of the block
+    @contextmanager
+    def track(self):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._thread_ids[thread_id] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._thread_ids[thread_id] -= 1
+                if not self._thread_ids[thread_id]:
+                    del self._thread_ids[thread_id]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # one line per stack with its number of samples, the most sampled first
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# wrap a sync function so that the thread running it is sampled when its request is profiled, for the sync endpoints
+def traced(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        sampler = current_profiler.get()
+        if sampler is None:
+            return function(*args, **kwargs)
+        with sampler.track():
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# run_in_threadpool of FastAPI, with the thread sampled when the request is profiled
+async def run_in_threadpool(function, *args, **kwargs):
+    return await _run_in_threadpool(traced(function), *args, **kwargs)
+
+
+# wrap the sync iterator of a streamed body, each chunk is produced by a thread of the pool that is sampled while
+# it produces it when the request is profiled. Must be called in the endpoint, where the profiler is known
+def traced_iterator(iterator):
+    sampler = current_profiler.get()
+    if sampler is None:
+        return iterator
+
+    def chunks():
+        while True:
+            with sampler.track():
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+            yield chunk
+    return chunks()
+
+
+# wrap the body of a profiled response: the sampling stops and the profile is saved once the body is sent,
+# as streamed bodies are produced after the response starts
+async def profiled_body(body_iterator, sampler: SamplingProfiler, profile_id: str):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        sampler.stop()
+        save_profile(profile_id, sampler)
+
+
+# save the samples of a request under its id in PROFILES_DIR, returns the file path
+def save_profile(profile_id: str, profiler: SamplingProfiler):
+    os.makedirs(config.PROFILES_DIR, exist_ok=True)
+    file_path = os.path.join(config.PROFILES_DIR, f"{profile_id}.txt")
+    with open(file_path, "w") as f:
+        f.write(profiler.collapsed())
+    return file_path
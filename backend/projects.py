@@ -0,0 +1,162 @@
+# this file handles multi-file project uploads: extracting archives while keeping their directory layout,
+# and splitting the Solidity files into independent compilation units that can be analysed in parallel.
+
+import hashlib
+import os
+import posixpath
+import re
+import tarfile
+import zipfile
+from fastapi import HTTPException, status
+import config
+import services
+
+# file extensions accepted by the batch upload, archives are extracted with their directory layout
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+# import "./A.sol"; import {B} from "../B.sol"; import * as C from "C.sol"; import "D.sol" as D;
+IMPORT_PATTERN = re.compile(r"""^\s*import\s+(?:[^;'"]*?\s+from\s+)?["'](?P<path>[^"']+)["']""", re.MULTILINE)
+
+# name of the generated file importing every root of a unit, so that one Slither run covers the whole unit
+UNIT_ENTRY_FILENAME = "__unit_entry_{index}.sol"
+
+
+# normalise a path of an uploaded file or archive member, rejecting paths escaping the project folder
+def safe_relative_path(name: str):
+    path = posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+    if path in ("", ".") or path == ".." or path.startswith("../"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid file path in upload: {name}")
+    return path
+
+
+# stream the uploaded files into the project folder, archives are extracted and only their .sol files are kept
+# files is a list of (filename, file object) tuples, returns the sha256 of each Solidity file written by relative path
+def extract_project(files: list, project_dir: str):
+    sources = {} # relative path -> (size, sha256)
+
+    for filename, file in files:
+        lowered = filename.lower()
+        if lowered.endswith(".sol"):
+            _write_source(project_dir, sources, filename, file)
+        elif lowered.endswith(".zip"):
+            with zipfile.ZipFile(file) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir() and member.filename.endswith(".sol"):
+                        with archive.open(member) as f:
+                            _write_source(project_dir, sources, member.filename, f)
+        elif lowered.endswith(ARCHIVE_EXTENSIONS):
+            with tarfile.open(fileobj=file, mode="r:*") as archive:
+                # only regular files are kept (no links)
+                for member in archive:
+                    if member.isfile() and member.name.endswith(".sol"):
+                        _write_source(project_dir, sources, member.name, archive.extractfile(member))
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid file extension: {filename}. Please upload .sol files or a .zip/.tar archive of them.",
+            )
+
+    if not sources:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No .sol file found in the upload.")
+
+    return {path: digest for path, (_, digest) in sources.items()}
+
+
+# stream one Solidity file into the project folder, within the limits of the whole project
+# the size limit is enforced while copying, so that a compressed archive can not expand past it (zip bomb)
+def _write_source(project_dir: str, sources: dict, name: str, file):
+    path = safe_relative_path(name)
+    if path not in sources and len(sources) >= config.MAX_PROJECT_FILES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Too many .sol files, at most {config.MAX_PROJECT_FILES} are accepted.")
+
+    remaining = config.MAX_PROJECT_BYTES - sum(size for size, _ in sources.values())
+    size, digest = services.stream_to_file(file, os.path.join(project_dir, path), remaining)
+    sources[path] = (size, digest)
+
+
+# resolve the import paths of a Solidity file to the uploaded files they refer to
+def _resolve_imports(path: str, content: str, known_paths: set):
+    imports = set()
+    for match in IMPORT_PATTERN.finditer(content):
+        imported = match.group("path")
+        # "./A.sol" and "../A.sol" are relative to the importing file, other paths to the project root
+        if imported.startswith("."):
+            imported = posixpath.normpath(posixpath.join(posixpath.dirname(path), imported))
+        else:
+            imported = posixpath.normpath(imported)
+        if imported in known_paths:
+            imports.add(imported)
+    return imports
+
+
+# split the Solidity files of a project into independent compilation units
+# files connected by imports (directly or through shared dependencies) belong to the same unit, so that their
+# shared dependencies are compiled once. The roots of a unit are its files that no other file imports.
+def find_compilation_units(project_dir: str, paths: list):
+    known_paths = set(paths)
+    imports = {}
+    for path in paths:
+        with open(os.path.join(project_dir, path), "r", errors="replace") as f:
+            imports[path] = _resolve_imports(path, f.read(), known_paths)
+
+    # connected components of the import graph, with a union-find over the files
+    parents = {path: path for path in paths}
+
+    def find(path):
+        while parents[path] != path:
+            parents[path] = parents[parents[path]]
+            path = parents[path]
+        return path
+
+    for path, imported_paths in imports.items():
+        for imported in imported_paths:
+            parents[find(imported)] = find(path)
+
+    components = {}
+    for path in paths:
+        components.setdefault(find(path), []).append(path)
+
+    imported_anywhere = set().union(*imports.values()) if imports else set()
+    units = []
+    for files in components.values():
+        # files of an import cycle are all imported by another one, fall back to every file of the unit then
+        roots = [path for path in files if path not in imported_anywhere] or files
+        units.append({"files": sorted(files), "roots": sorted(roots)})
+
+    return sorted(units, key=lambda unit: unit["roots"][0])
+
+
+# get the file Slither should analyse for a unit: its root, or a generated file importing all its roots
+def prepare_unit_target(project_dir: str, unit: dict, index: int):
+    if len(unit["roots"]) == 1:
+        return unit["roots"][0]
+
+    entry = UNIT_ENTRY_FILENAME.format(index=index)
+    with open(os.path.join(project_dir, entry), "w") as f:
+        f.write("// generated to analyse every root of the compilation unit in one Slither run\n")
+        for root in unit["roots"]:
+            f.write(f'import "./{root}";\n')
+    return entry
+
+
+# hash of every file of a unit with its path, from the sha256 of each file computed while extracting them
+# used as analysis cache key
+def hash_unit(unit: dict, digests: dict):
+    digest = hashlib.sha256()
+    for path in unit["files"]:
+        digest.update(f"{path}\0{digests[path]}\n".encode())
+    return digest.hexdigest()
+
+
+# extract an upload into the project folder and split it into compilation units ready to be queued
+# returns, for each unit, its name, files, Slither target, Solidity version and source hash
+def prepare_project(files: list, project_dir: str):
+    digests = extract_project(files, project_dir)
+    units = find_compilation_units(project_dir, sorted(digests))
+    for index, unit in enumerate(units):
+        unit["name"] = ", ".join(unit["roots"])[:255] # used as contract name of the unit report
+        unit["target"] = prepare_unit_target(project_dir, unit, index)
+        # a version satisfying the pragmas of every file of the unit
+        unit["solidity_version"] = services.extract_solidity_version([os.path.join(project_dir, path) for path in unit["files"]])
+        unit["source_hash"] = hash_unit(unit, digests)
+    return units
@@ -0,0 +1,228 @@
+# this file contains the retention policies of the backend and the background task applying them.
+# files: the raw Slither output of each report is kept gzip compressed in RAW_OUTPUTS_DIR and removed with its report,
+# after RAW_OUTPUT_MAX_AGE_DAYS or oldest first above RAW_OUTPUTS_MAX_BYTES; saved request profiles, scratch folders
+# of jobs left behind (e.g. by a crash of the server) and loose files of the uploads folder are removed by age.
+# rows: reports older than REPORT_MAX_AGE_DAYS are deleted if configured, and the rows no longer referenced by any
+# report (vulnerability types without results, results and documents of missing reports) are deleted by batches of
+# RETENTION_BATCH_SIZE, each in its own short transaction, so that the compaction never holds long table locks.
+# the bytes reclaimed and rows deleted are exported as metrics (see metrics.py).
+
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from sqlalchemy import exists
+from fastapi import HTTPException
+from models import Report, Result, ReportDocument, Vulnerability, VulnerabilityStat
+import config
+import crud
+import metrics
+import search
+from database import SessionLocal
+
+# size of the chunks copied while compressing a raw output
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+# path of the compressed raw output of a report
+def raw_output_path(report_id: int):
+    return os.path.join(config.RAW_OUTPUTS_DIR, f"{report_id}.json.gz")
+
+
+# store the raw Slither output of a report, compressed. The file is written under a temporary name and renamed,
+# so that a partial file is never served and a new version of the report replaces the previous one atomically
+def store_raw_output(report_id: int, source_path: str):
+    os.makedirs(config.RAW_OUTPUTS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=config.RAW_OUTPUTS_DIR, suffix=".tmp")
+    try:
+        with open(source_path, "rb") as source, os.fdopen(fd, "wb") as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode="wb") as compressed:
+                shutil.copyfileobj(source, compressed, COPY_CHUNK_SIZE)
+        os.replace(tmp_path, raw_output_path(report_id))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# remove the files of a deleted report, returns the number of bytes reclaimed
+def remove_artifacts(report_id: int):
+    return _remove_entries([raw_output_path(report_id)], "raw_output")
+
+
+# size of a file or of every file of a folder
+def _size(path: str):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError: # removed in the meantime
+                pass
+    return total
+
+
+# remove files and folders, counting the bytes reclaimed under the given kind of artifact
+def _remove_entries(paths: list, kind: str):
+    reclaimed = 0
+    for path in paths:
+        try:
+            size = _size(path)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        reclaimed += size
+    if reclaimed:
+        metrics.inc(metrics.RETENTION_BYTES_RECLAIMED, reclaimed, kind=kind)
+    return reclaimed
+
+
+# remove the entries of a folder older than max_age_seconds, then the oldest ones while the folder holds more than
+# max_bytes (0 disables a limit). Entries in keep are neither removed nor counted, returns the bytes reclaimed
+def prune_folder(folder: str, kind: str, max_age_seconds: float = 0, max_bytes: int = 0, keep=(), files_only=False):
+    keep = {os.path.abspath(path) for path in keep}
+    entries = []
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        path = os.path.abspath(os.path.join(folder, name))
+        if path in keep or name.endswith(".tmp") or (files_only and not os.path.isfile(path)):
+            continue
+        try:
+            entries.append((os.path.getmtime(path), _size(path), path))
+        except FileNotFoundError:
+            pass
+
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    expired = []
+    for modified_at, size, path in sorted(entries): # oldest first
+        if (max_age_seconds and now - modified_at > max_age_seconds) or (max_bytes and total > max_bytes):
+            expired.append(path)
+            total -= size
+    return _remove_entries(expired, kind)
+
+
+# delete the rows of a model matching a condition by batches of RETENTION_BATCH_SIZE, each in its own transaction
+# before_delete(db, ids) runs in the transaction of each batch, returns the number of rows deleted
+def delete_in_batches(model, condition, before_delete=None):
+    id_column = model.__mapper__.primary_key[0]
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = [row_id for (row_id,) in db.query(id_column).filter(condition).limit(config.RETENTION_BATCH_SIZE)]
+            if not ids:
+                return deleted
+            if before_delete:
+                before_delete(db, ids)
+            # the condition is checked again on delete, for rows referenced again since they were selected
+            count = db.query(model).filter(id_column.in_(ids), condition).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        deleted += count
+        metrics.inc(metrics.RETENTION_ROWS_DELETED, count, table=model.__tablename__)
+        time.sleep(config.RETENTION_BATCH_PAUSE) # let the uploads through between two batches
+
+
+# delete the reports older than REPORT_MAX_AGE_DAYS with their artifacts, one transaction per report
+def delete_expired_reports():
+    if not config.REPORT_MAX_AGE_DAYS:
+        return 0
+    cutoff = date.today() - timedelta(days=config.REPORT_MAX_AGE_DAYS)
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            report_ids = [
+                report_id for (report_id,) in
+                db.query(Report.report_id).filter(Report.submission_date < cutoff).limit(config.RETENTION_BATCH_SIZE)
+            ]
+        finally:
+            db.close()
+        if not report_ids:
+            return deleted
+        for report_id in report_ids:
+            try:
+                crud.delete_report(SessionLocal(), report_id) # closes its session
+            except HTTPException as e: # deleted in the meantime
+                if e.status_code != 404:
+                    raise
+            remove_artifacts(report_id)
+            deleted += 1
+        metrics.inc(metrics.RETENTION_ROWS_DELETED, len(report_ids), table=Report.__tablename__)
+        time.sleep(config.RETENTION_BATCH_PAUSE)
+
+
+# delete the rows that no report references anymore
+def compact():
+    report_exists = exists().where(Report.report_id == Result.report_id)
+    # the full-text index entries of the results are removed in the same transaction (see search.py)
+    delete_in_batches(Result, ~report_exists, before_delete=search.remove_results)
+    delete_in_batches(ReportDocument, ~exists().where(Report.report_id == ReportDocument.report_id))
+    # vulnerability types neither found by a result nor counted in the analytics summary
+    delete_in_batches(Vulnerability, ~exists().where(Result.vulnerability_id == Vulnerability.vulnerability_id)
+                      & ~exists().where(VulnerabilityStat.vulnerability_id == Vulnerability.vulnerability_id))
+
+
+# apply the file policies, keep lists the scratch folders of the jobs that are not finished
+def prune_files(keep=()):
+    day = 24 * 3600
+    prune_folder(
+        config.RAW_OUTPUTS_DIR, "raw_output",
+        max_age_seconds=config.RAW_OUTPUT_MAX_AGE_DAYS * day, max_bytes=config.RAW_OUTPUTS_MAX_BYTES,
+    )
+    prune_folder(config.PROFILES_DIR, "profile", max_age_seconds=config.PROFILE_MAX_AGE_DAYS * day)
+    work_dir_max_age = config.WORK_DIR_MAX_AGE_HOURS * 3600
+    prune_folder(config.WORK_DIR, "work_dir", max_age_seconds=work_dir_max_age, keep=keep)
+    # files saved directly in the uploads folder by older versions of the backend (contracts and Slither reports)
+    prune_folder(config.UPLOADS_DIR, "upload", max_age_seconds=work_dir_max_age, files_only=True)
+
+
+class RetentionTask:
+    """
+    Applies the retention policies every RETENTION_INTERVAL_SECONDS from a background thread of the server.
+    in_use() returns the scratch folders of the unfinished jobs (see jobs.JobQueue.work_dirs_in_use).
+    """
+
+    def __init__(self, in_use, interval: float = None):
+        self.in_use = in_use
+        self.interval = config.RETENTION_INTERVAL_SECONDS if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+
+    def start(self):
+        if self.interval > 0:
+            self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    # one pass of every policy, a failing policy does not prevent the others
+    def run_once(self):
+        for policy in (delete_expired_reports, compact, lambda: prune_files(self.in_use())):
+            if self._stop.is_set():
+                return
+            try:
+                policy()
+            except Exception as e:
+                print(f"Retention failed: {e}")
+
+    # a first pass at startup cleans up after e.g. a crash of the previous server
+    def _run(self):
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
@@ -0,0 +1,189 @@
+# this file maintains the full-text index of the findings behind the GET /search endpoint.
+# each result is indexed with the name of its contract, its location, element, source file and description:
+# a table with a FULLTEXT index on MySQL, an FTS5 virtual table on SQLite (local runs and benchmarks).
+# upload_report and delete_report update the index in their own transaction (see crud.py), and the index can be
+# recomputed from the results when needed (e.g. for results uploaded before it existed):
+# python -m search rebuild (from the backend folder)
+
+import argparse
+import html
+import re
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, Text, inspect, literal_column, text
+from sqlalchemy.orm import Session
+
+# markers around the matched terms in the snippets of the search results
+# the snippets are HTML: the finding text comes from the uploaded contracts, so it is escaped and only these tags are added
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+# control characters marking the matches until the text around them is escaped, see markup
+MATCH_OPEN = "\x02"
+MATCH_CLOSE = "\x03"
+# approximate number of characters of a snippet around the first match (MySQL builds no snippets itself)
+SNIPPET_CHARS = 160
+
+# the indexed text columns, most relevant first
+TEXT_COLUMNS = ("contract_name", "location", "element_name", "source_file", "description")
+
+# the index on MySQL, the table is kept out of models.Base as SQLite needs a virtual table instead
+metadata = MetaData()
+search_table = Table(
+    "result_search", metadata,
+    Column("result_id", Integer, primary_key=True), # same id as the indexed result
+    Column("report_id", Integer),
+    Column("vulnerability_id", Integer),
+    Column("contract_name", String(255)),
+    Column("location", String(255)),
+    Column("element_name", String(255)),
+    Column("source_file", String(255)),
+    Column("description", Text),
+    Index("ix_result_search_text", *TEXT_COLUMNS, mysql_prefix="FULLTEXT"),
+)
+
+# the index on SQLite, the rowid of each row is the id of the indexed result
+SQLITE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS result_search USING fts5(
+    {", ".join(TEXT_COLUMNS)}, report_id UNINDEXED, vulnerability_id UNINDEXED
+)
+"""
+
+# column holding the id of the indexed result
+ID_COLUMNS = {
+    "mysql": "result_id",
+    "sqlite": "rowid",
+}
+
+
+def dialect_name(db: Session):
+    return db.get_bind().dialect.name
+
+
+# create the index if it does not exist yet, returns True if it was created
+def create_index(engine):
+    if inspect(engine).has_table("result_search"):
+        return False
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as connection:
+            connection.execute(text(SQLITE_TABLE))
+    else:
+        search_table.create(engine)
+    return True
+
+
+# insert the results selected by the given condition into the index
+def insert_results(db: Session, condition: str = "", params: dict = None):
+    db.execute(text(f"""
+        INSERT INTO result_search ({ID_COLUMNS[dialect_name(db)]}, report_id, vulnerability_id, {", ".join(TEXT_COLUMNS)})
+        SELECT results.result_id, results.report_id, results.vulnerability_id, reports.contract_name, results.location,
+               results.element_name, results.source_file, results.description
+        FROM results JOIN reports ON reports.report_id = results.report_id
+        {condition}
+    """), params or {})
+
+
+# index the results of a report, called in the transaction writing them
+def index_report(db: Session, report_id: int):
+    insert_results(db, "WHERE results.report_id = :report_id", {"report_id": report_id})
+
+
+# remove the results of a report from the index, called in the transaction deleting them (before they are deleted)
+def remove_report(db: Session, report_id: int):
+    db.execute(text(f"""
+        DELETE FROM result_search
+        WHERE {ID_COLUMNS[dialect_name(db)]} IN (SELECT result_id FROM results WHERE report_id = :report_id)
+    """), {"report_id": report_id})
+
+
+# remove results from the index by id, called in the transaction deleting them (see retention.py)
+def remove_results(db: Session, result_ids: list):
+    db.execute(
+        search_table.delete().where(literal_column(ID_COLUMNS[dialect_name(db)]).in_(result_ids))
+    )
+
+
+# the terms of a search, quotes are not part of the query syntax
+def query_terms(query: str):
+    return re.findall(r'[^\s"]+', query)
+
+
+# a page of the results matching every term of the query, the most relevant first
+# returns (result_id, snippet) pairs, snippet is None when the database cannot build one (see highlight)
+def find(db: Session, query: str, vulnerability_type: str = None, impact: str = None, limit: int = 20, offset: int = 0):
+    terms = query_terms(query)
+    params = {"vulnerability_type": vulnerability_type, "impact": impact, "limit": limit, "offset": offset}
+    filters = ""
+    if vulnerability_type:
+        filters += " AND vulnerabilities.vulnerability_type = :vulnerability_type"
+    if impact:
+        filters += " AND vulnerabilities.impact = :impact"
+
+    if dialect_name(db) == "sqlite":
+        # each term as an FTS5 string, so that paths and punctuation are matched as phrases
+        params["query"] = " ".join('"' + term + '"' for term in terms)
+        params["open"], params["close"] = MATCH_OPEN, MATCH_CLOSE
+        rows = db.execute(text(f"""
+            SELECT result_search.rowid, snippet(result_search, 4, :open, :close, '...', 24)
+            FROM result_search JOIN vulnerabilities ON vulnerabilities.vulnerability_id = result_search.vulnerability_id
+            WHERE result_search MATCH :query{filters}
+            ORDER BY bm25(result_search, 4.0, 2.0, 2.0, 2.0, 1.0), result_search.rowid
+            LIMIT :limit OFFSET :offset
+        """), params)
+        return [(result_id, markup(snippet)) for result_id, snippet in rows]
+
+    # boolean mode with every term required
+    params["query"] = " ".join('+"' + term + '"' for term in terms)
+    match = f"MATCH ({', '.join(f'result_search.{column}' for column in TEXT_COLUMNS)}) AGAINST (:query IN BOOLEAN MODE)"
+    rows = db.execute(text(f"""
+        SELECT result_search.result_id
+        FROM result_search JOIN vulnerabilities ON vulnerabilities.vulnerability_id = result_search.vulnerability_id
+        WHERE {match}{filters}
+        ORDER BY {match} DESC, result_search.result_id
+        LIMIT :limit OFFSET :offset
+    """), params)
+    return [(result_id, None) for (result_id,) in rows]
+
+
+# HTML of a text with its matches between the match markers: the text is escaped, then the markers replaced by tags
+def markup(content: str):
+    if content is None:
+        return None
+    return html.escape(content).replace(MATCH_OPEN, SNIPPET_OPEN).replace(MATCH_CLOSE, SNIPPET_CLOSE)
+
+
+# snippet of a text around the first of the terms it contains, with every term between the snippet markers
+def highlight(content: str, terms: list):
+    if not content:
+        return content
+    # the text cannot add markers of its own
+    content = content.replace(MATCH_OPEN, "").replace(MATCH_CLOSE, "")
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(content)
+    start = max(0, first.start() - SNIPPET_CHARS // 2) if first else 0
+    end = start + SNIPPET_CHARS
+    snippet = pattern.sub(lambda match: MATCH_OPEN + match.group(0) + MATCH_CLOSE, content[start:end])
+    return markup(("..." if start > 0 else "") + snippet + ("..." if end < len(content) else ""))
+
+
+# recompute the whole index from the results, in a single transaction
+def rebuild(db: Session):
+    db.execute(text("DELETE FROM result_search"))
+    insert_results(db)
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of the full-text index of the findings.")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute the index from the results")
+    parser.parse_args()
+
+    import database # not at the top, database.init_db creates the index with this module
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+    print("search index rebuilt")
+
+
+if __name__ == "__main__":
+    main()
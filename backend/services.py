@@ -1,173 +1,257 @@
 # this file contains utility functions and services that are used by the main application logic such as running Slither commands.
 
-from fastapi import UploadFile, HTTPException, status
+from fastapi import HTTPException, status
+import hashlib
+import json
 import os
-import re
+import shutil
 import subprocess
+import uuid
+import ijson
 from datetime import datetime
+import config
+import compilers
+import detector_catalog
 
 # folder to store the uploaded files of users and to process them using Slither
-UPLOADS_DIR = "uploads"
-# the file path to slither wiki, basically .md file that contains recommendation and description of a given vulnerability
-# this file is clone from Slither github page: https://github.com/crytic/slither/wiki/Detector-Documentation
-DETECTOR_DOCUMENT_PATH = './slither.wiki/Detector-Documentation.md'
-
+UPLOADS_DIR = config.UPLOADS_DIR
+
+# number of findings between two progress updates while filtering a report
+FINDINGS_PROGRESS_INTERVAL = 100
+
+
+# creates a unique scratch folder for one analysis, concurrent uploads of the same file name never collide
+def create_work_dir():
+    work_dir = os.path.join(config.WORK_DIR, uuid.uuid4().hex)
+    os.makedirs(work_dir)
+    return work_dir
+
+
+# removes the scratch folder of an analysis with the uploaded sources and Slither's output
+def remove_work_dir(work_dir: str):
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# copies a file object to the given path in fixed-size chunks, hashing the content on the way
+# raises 413 (REQUEST_ENTITY_TOO_LARGE) as soon as more than max_bytes are read, the partial file is removed
+# returns the size and the sha256 hex digest of the content
+def stream_to_file(source, file_path: str, max_bytes: int):
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as f:
+        while True:
+            chunk = source.read(config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+
+    if size > max_bytes:
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"The upload is too large, at most {max_bytes // 1024} KiB are accepted.",
+        )
+    return size, digest.hexdigest()
 
-# saves the uploaded file to the 'uploads' directory.
-def save_uploaded_file(contract: UploadFile):
-    try: 
-        # create the 'uploads' dir if not exists, exist_ok to True to specify existing dir w/o having error
-        os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-        # file path within the 'uploads' directory
-        file_path = os.path.join(UPLOADS_DIR, contract.filename)
+# saves the uploaded file to the scratch folder of its analysis, streaming it instead of reading it in memory.
+# returns the file path and the sha256 of the content
+def save_uploaded_file(upload, work_dir: str, filename: str):
+    try:
+        # file path within the scratch folder, without any directory part of the client file name
+        file_path = os.path.join(work_dir, os.path.basename(filename))
 
         # write the contents of the uploaded file to the specified file path
-        with open(file_path, "wb") as f:
-            f.write(contract.file.read())
+        _, source_hash = stream_to_file(upload, file_path, config.MAX_UPLOAD_BYTES)
 
         # return the file path where the file is saved
-        return file_path
+        return file_path, source_hash
+    except HTTPException as e: # raise HTTPException with specific error details e.g., file too large
+        raise e
     except Exception as e:
         #  HTTPException with a 500 status code
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error occurred while saving the file. Please try again.")
 
 
-# extracts the Solidity version from the provided file path.
-def extract_solidity_version(file_path: str):
+# resolves the Solidity version of an analysis from the version pragmas of all its files (see compilers.py):
+# the newest compiler satisfying every pragma, preferring the compilers already installed
+def extract_solidity_version(file_paths: list):
     try:
-        with open(file_path, "r") as f:
-            # read the first 500 characters of the uploaded file
-            file_content = f.read(500)
-
-        # regexp match "pragma solidity x.y.z;" or "pragma solidity ^x.y.z;" 
-        version_pattern = re.search(r"pragma solidity \^?(?P<version>\d+\.\d+\.\d+);", file_content)
+        constraints = []
+        for file_path in file_paths:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                constraints += compilers.pragma_constraints(f.read())
 
         # raise an exception if no version is found
-        if not version_pattern:
+        if not constraints:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Solidity version not found in the file. Please upload file with a valid Solidity version for auditing.",
             )
 
-        # return the version if found
-        return version_pattern.group('version')
+        # return the newest compiler version satisfying every pragma
+        return compilers.compiler_manager.resolve_version(constraints)
     except HTTPException as e: # raise HTTPException with specific error details
         raise e
+    except ValueError as e: # invalid pragma or pragmas that no compiler satisfies
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{e}. Please check the version pragmas of the contract.")
     except Exception as e: # more generic errors handling
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error occurred while extracting the Solidity version. Please try again.")
 
-# analyses a contract by running Slither commands with the specified Solidity version.
-def analyze_contract(file_path: str, solidity_version: str):
+# analyses a contract by running Slither with the compiler of the specified Solidity version.
+# Slither runs from the source root (the uploads folder or the folder of a project) so that imports resolve
+# like in the original project and the reported paths are relative to it.
+# detectors limits the analysis to the given check names (see detector_catalog.DETECTOR_PROFILES), None runs them all
+# artifacts is the zip of the compilation artifacts of the contract exported by crytic-compile (see engines.CliEngine),
+# analysed instead of the contract so that Slither does not compile it again
+def analyze_contract(file_path: str, solidity_version: str, source_root: str = UPLOADS_DIR, detectors: list = None, artifacts: str = None):
     try:
-        # 3 commands needed to run Slither with the specified Solidity version using subprocess
-        install_cmd = ['solc-select', 'install', solidity_version]
-        use_cmd = ['solc-select', 'use', solidity_version]
-        slither_cmd = ['slither', file_path, '--checklist']
-        
-        # run each command, check=True to check for errors
-        subprocess.run(install_cmd, check=True)
-        subprocess.run(use_cmd, check=True)
+        # path of the solc binary of the version, installed with solc-select only the first time it is needed
+        # the binary is given to Slither directly instead of switching the global version with "solc-select use"
+        solc_path = compilers.compiler_manager.solc_path(solidity_version)
+
+        # Slither writes its findings as structured JSON, it refuses to overwrite an existing output file
+        json_path = raw_output_path(file_path)
+        if os.path.exists(json_path):
+            os.remove(json_path)
+        target = os.path.relpath(artifacts or file_path, source_root)
+        slither_cmd = ['slither', target, '--solc', solc_path, '--json', json_path]
+        if detectors is not None:
+            slither_cmd += ['--detect', ','.join(detectors)]
+
+        # run slither command, a positive exit code is not an error as Slither exits with a non-zero code when it finds issues
+        # it stays in the process group of the worker, which the job queue kills when the job exceeds its limits (see jobs.py)
+        completed = subprocess.run(slither_cmd, stdout=subprocess.DEVNULL, cwd=source_root)
+
+        # a negative exit code means that Slither was killed by a signal e.g., by the OOM killer
+        if completed.returncode < 0:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Slither was stopped before the end of the analysis. Please try again.")
+
+        # the "success" flag tells whether the contract could be compiled and analysed
+        if not os.path.exists(json_path) or not slither_succeeded(json_path):
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error running Slither. Please check that the contract compiles.")
         
-        # run slither command and redirect the output to the .md file
-        # this is equivalent to "> result.md"   
-        with open(f"{file_path}.md", "w") as output_file:
-            subprocess.run(slither_cmd, stdout=output_file)
-        
-        # return the path to the generated Markdown file
-        return f"{file_path}.md"
-    except subprocess.CalledProcessError as e: # specific subprocess errors handling
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error running Slither. Please try again.")
+        # return the path to the generated JSON file
+        return json_path
+    except HTTPException as e: # raise HTTPException with specific error details
+        raise e
+    except subprocess.CalledProcessError as e: # specific subprocess errors handling e.g., solc-select install failed
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error installing Solidity compiler {solidity_version}. Please try again.")
     except Exception as e: # more generic errors handling
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error analysing contract. Please try again.")
 
-#  filter report file and extract vulnerability information from it
-def filter_report(file_path: str):
+# path of the Slither JSON report of an analysis, next to the analysed file in the scratch folder of the job
+def raw_output_path(file_path: str):
+    return os.path.abspath(f"{file_path}.json")
+
+# write the findings of an analysis run without the command line as a Slither JSON report, so that every engine
+# leaves the same raw output to keep (see retention.py)
+def write_raw_output(findings: list, file_path: str):
+    with open(raw_output_path(file_path), "w") as f:
+        json.dump({"success": True, "error": None, "results": {"detectors": findings}}, f)
+
+# check the "success" flag of a Slither JSON report, printing the error if the analysis failed
+def slither_succeeded(file_path: str):
+    with open(file_path, "rb") as f:
+        # "success" and "error" are written before the results, so only the beginning of the file is parsed
+        success = next(ijson.items(f, "success"), False)
+        if not success:
+            f.seek(0)
+            print(next(ijson.items(f, "error"), None))
+        return success
+
+#  filter the Slither JSON report and extract vulnerability information from it
+def filter_report(file_path: str, source_root: str = UPLOADS_DIR, progress=None):
     try:
-        # open the .md file
-        with open(file_path, "r") as f:
-            md_content = f.read() # read the file
-
-            # patterns to match vulnerability types, impact, confidence, and results. 
-            vulnerability_pattern = re.compile(
-                r"##\s*(?P<vulnerability_type>[\w-]+)\nImpact:\s*(?P<impact>\w+)\nConfidence:\s*(?P<confidence>\w+)(?P<results>[\s\S]+?)(?=\n##|$)"
-            )
+        with open(file_path, "rb") as f:
+            # stream over the detectors array one finding at a time instead of loading the whole report in memory
+            return filter_findings(ijson.items(f, "results.detectors.item", use_float=True), source_root, progress)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        # HTTPException with a 500 status code and the error details
+        print(e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error occurred while filtering the report. Please try again.")
 
-            # one vuln can have many results with different locations within the contract
-            result_pattern = re.compile(r'- \[ \] ID-(?P<id>\d+)\n(?P<description>.*?)(?=\nuploads/(?P<location>\S+)|$)', re.DOTALL)
-
-            # find matches for each vulnerability from the pattern in the md file content
-            matches = re.finditer(vulnerability_pattern, md_content)
-
-            vulnerabilities = [] # initialise the list of vulnerabilities to be returned
-
-            # for each match in the matches list
-            for match in matches:
-                # convert the match to a dictionary with key value pair
-                result_dict = match.groupdict()
-                # prepare the vulnerability format to be returned
-                vulnerability_info = {
-                    "vulnerability_type": result_dict["vulnerability_type"],
-                    "impact": result_dict["impact"],
-                    "confidence": result_dict["confidence"],
-                    "description": None,  # initialise description
-                    "recommendation": None,  # initialise recommendation
+# group Slither findings by vulnerability type, from the JSON report or directly from the Slither API (see engines.py)
+# progress (see pipeline.py) is told the number of findings parsed so far every FINDINGS_PROGRESS_INTERVAL findings
+def filter_findings(findings, source_root: str = UPLOADS_DIR, progress=None):
+    try:
+        # vulnerability type -> vulnerability info, in the order Slither reports the detectors
+        vulnerabilities = {}
+        count = 0
+
+        for finding in findings:
+            count += 1
+            if progress and count % FINDINGS_PROGRESS_INTERVAL == 0:
+                progress("filtering", findings=count)
+
+            vulnerability_type = finding["check"]
+
+            # prepare the vulnerability format to be returned the first time a type is found
+            if vulnerability_type not in vulnerabilities:
+                vulnerabilities[vulnerability_type] = {
+                    "vulnerability_type": vulnerability_type,
+                    "impact": finding["impact"],
+                    "confidence": finding["confidence"],
+                    # find description and recommendation for the vulnerability type
+                    "description": find_description(vulnerability_type),
+                    "recommendation": find_recommendation(vulnerability_type),
                     "results": [] # initialise results list
                 }
 
-                # find matches for each result within the vulnerability
-                results_matches = re.finditer(result_pattern, result_dict["results"])
-                for result_match in results_matches:
-                    # convert the result match to a dictionary with key value pairs
-                    result = result_match.groupdict()
-                    # append the result to the list of results
-                    vulnerability_info["results"].append({
-                        # strip the description to remove surrounding whitespace
-                        "description": result["description"].strip(), 
-                        "location": result["location"]
-                    })
-
-                # find description for the vulnerability type
-                vulnerability_info["description"] = find_description(vulnerability_info["vulnerability_type"])
-
-                # find recommendation for the vulnerability type
-                vulnerability_info["recommendation"] = find_recommendation(vulnerability_info["vulnerability_type"])
-
-                # append the vulnerability info to the list
-                vulnerabilities.append(vulnerability_info)
-
-            # return the list of vulnerabilities
-            return vulnerabilities
+            # one vuln can have many results with different locations within the contract
+            vulnerabilities[vulnerability_type]["results"].append(parse_finding(finding, source_root))
+
+        if progress:
+            progress("filtering", findings=count)
+
+        # return the list of vulnerabilities
+        return list(vulnerabilities.values())
     except Exception as e:
         # HTTPException with a 500 status code and the error details
         print(e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error occurred while filtering the report. Please try again.")
 
+# convert one finding of the Slither JSON report to a result, with its source mapping (file, lines and element)
+def parse_finding(finding: dict, source_root: str):
+    # Slither reports paths as given on the command line e.g., "uploads/Token.sol", show them relative to the upload
+    prefix = source_root.rstrip("/") + "/"
+
+    # the first element is the main source location of the finding e.g., the vulnerable function
+    element = finding["elements"][0] if finding.get("elements") else {}
+    source_mapping = element.get("source_mapping") or {}
+    lines = source_mapping.get("lines") # sorted line numbers covered by the element
+
+    return {
+        # the markdown description is rendered by the frontend, strip it to remove surrounding whitespace
+        "description": _relative_to(finding.get("markdown") or finding.get("description", ""), prefix).strip(),
+        "location": _relative_to(finding.get("first_markdown_element"), prefix) or None,
+        "source_file": _relative_to(source_mapping.get("filename_relative"), prefix),
+        "line_start": lines[0] if lines else None,
+        "line_end": lines[-1] if lines else None,
+        "element_name": element.get("name"),
+    }
+
+# remove the given path prefix from every path within a text
+def _relative_to(text, prefix: str):
+    return text.replace(prefix, "") if text else text
+
 
 # Find the recommendation for a given check name (i.e., vulnerability).
 def find_recommendation(check_name: str):
     try:
-        file_path = DETECTOR_DOCUMENT_PATH # the path to the detector document
-        
-        # open the wiki i.e., detector documentation file
-        with open(file_path, 'r') as f:
-            file_content = f.read() # read the file
-
-        # regexp pattern with named group for extracting recommendation based on each check name
-        # DOTALL to also match \n character
-        pattern = re.compile(
-            fr'##\s.*?###\sConfiguration\n\* Check: `{check_name}`.*?###\sRecommendation\n(?P<recommendation>.*?)(?=\n##\s|\Z)',
-            re.DOTALL
-        )
-
-        # search for the pattern in the content
-        match = re.search(pattern, file_content)
+        # look up the check in the parsed detector documentation (wiki)
+        detector = detector_catalog.catalog.get(check_name)
 
-        # return the recommendation if has a match
-        if match:
-            # get the named group recommendation match from the regexp
-            recommendation = match.group('recommendation').strip()
-            return recommendation
+        # return the recommendation if the check is documented
+        if detector and detector["recommendation"]:
+            return detector["recommendation"]
         
         # return this message if no recommendation was found
         return f'Recommendation not found for: {check_name}'
@@ -179,26 +263,12 @@ def find_recommendation(check_name: str):
 # Find description for a given check (i.e., vulnerability) name.
 def find_description(check_name: str):
     try:
-        file_path = DETECTOR_DOCUMENT_PATH # the path to the detector document
-        
-        # open the wiki file
-        with open(file_path, 'r') as f:
-            file_content = f.read() # read the file
-            
-        # regexp pattern with named group for extracting description based on each check name
-        pattern = re.compile(
-            fr'##\s.*?###\sConfiguration\n\* Check: `{check_name}`.*?###\sDescription\n(?P<description>.*?)(?=\n###\sExploit Scenario:|\n##|$)',
-            re.DOTALL
-        )
-        
-        # Search for the pattern in the content
-        match = re.search(pattern, file_content) 
+        # look up the check in the parsed detector documentation (wiki)
+        detector = detector_catalog.catalog.get(check_name)
         
-        # return the description if a match is found
-        if match:
-            # get the description named group from the regexp
-            description = match.group('description').strip()
-            return description
+        # return the description if the check is documented
+        if detector and detector["description"]:
+            return detector["description"]
 
         # return this message if no description was found
         return f'Description not found for check: {check_name}'
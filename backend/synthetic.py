@@ -0,0 +1,86 @@
+# synthetic Slither outputs and contracts, generated deterministically from a seed: used by the "stub" analysis engine
+# (see engines.py) to stand in for Slither where no compiler is available e.g., in CI, and by the benchmarks so that
+# two runs of a benchmark measure exactly the same work.
+
+import json
+import os
+import random
+from detector_catalog import catalog
+
+
+# generate findings as in the "detectors" of Slither's JSON output, spread over number_of_detectors detectors
+# a share of the findings (dependency_ratio) is located in an imported library instead of the analysed file
+def generate_findings(number_of_results: int, number_of_detectors: int = 10, filename: str = "Bench.sol",
+                      dependency_ratio: float = 0.0, seed: int = 0):
+    rng = random.Random(seed)
+    detectors = catalog.all()[:max(1, number_of_detectors)]
+    findings = []
+    for index in range(number_of_results):
+        detector = detectors[index % len(detectors)]
+        in_dependency = rng.random() < dependency_ratio
+        finding_file = "lib/Dependency.sol" if in_dependency else filename
+        line = 10 + rng.randrange(1000)
+        element = f"Bench.function{index}()"
+        findings.append({
+            "elements": [{
+                "type": "function",
+                "name": f"function{index}",
+                "source_mapping": {"filename_relative": finding_file, "lines": [line, line + 1, line + 2]},
+            }],
+            "description": f"{element} ({finding_file}#{line}-{line + 2}) triggers {detector['check']}\n",
+            "markdown": f"[{element}]({finding_file}#L{line}-L{line + 2}) triggers {detector['check']}\n",
+            "first_markdown_element": f"{finding_file}#L{line}-L{line + 2}",
+            "check": detector["check"],
+            "impact": detector["impact"],
+            "confidence": detector["confidence"],
+        })
+
+    # Slither groups the findings by detector in its outputs
+    findings.sort(key=lambda finding: finding["check"])
+    return findings
+
+
+# write the findings as Slither's --json output
+def write_json_report(findings: list, file_path: str):
+    with open(file_path, "w") as f:
+        json.dump({"success": True, "error": None, "results": {"detectors": findings}}, f)
+
+
+# write the findings as Slither's --checklist markdown output, parsed by the previous implementation
+def write_checklist_report(findings: list, file_path: str):
+    with open(file_path, "w") as f:
+        f.write("Summary\n")
+        previous_check = None
+        for index, finding in enumerate(findings):
+            if finding["check"] != previous_check:
+                f.write(f"## {finding['check']}\nImpact: {finding['impact']}\nConfidence: {finding['confidence']}\n")
+                previous_check = finding["check"]
+            f.write(f" - [ ] ID-{index}\n{finding['markdown']}\n{finding['first_markdown_element']}\n\n")
+
+
+# generate the same synthetic findings as Slither's JSON output and as its --checklist markdown, in the given folder
+def generate_reports(number_of_results: int, directory: str, number_of_detectors: int = 40,
+                     dependency_ratio: float = 0.01, seed: int = 0):
+    findings = generate_findings(number_of_results, number_of_detectors, "uploads/Bench.sol", dependency_ratio, seed)
+    json_path = os.path.join(directory, "report.json")
+    md_path = os.path.join(directory, "report.md")
+    write_json_report(findings, json_path)
+    write_checklist_report(findings, md_path)
+    return json_path, md_path
+
+
+# source of a small contract, different for each index so that uploads do not hit the analysis cache
+def generate_contract(index: int, solidity_version: str = "0.8.4"):
+    return (
+        f"// SPDX-License-Identifier: MIT\n"
+        f"pragma solidity {solidity_version};\n\n"
+        f"contract Bench{index} {{\n"
+        f"    mapping(address => uint256) public balances;\n\n"
+        f"    function withdraw(uint256 amount) public {{\n"
+        f"        require(balances[msg.sender] >= amount);\n"
+        f"        (bool sent, ) = msg.sender.call{{value: amount}}(\"\");\n"
+        f"        require(sent);\n"
+        f"        balances[msg.sender] -= amount;\n"
+        f"    }}\n"
+        f"}}\n"
+    ).encode()
@@ -0,0 +1,5 @@
+# the backend modules import each other by name (e.g., "import compilers"), as when run from the backend folder
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
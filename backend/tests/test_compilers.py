@@ -0,0 +1,168 @@
+# tests of the resolution of the Solidity compiler of an analysis from its version pragmas (see compilers.py)
+# the installed compilers are fake binaries in a temporary artifacts folder and the installable versions are set on
+# the manager, so that solc-select is never run
+
+import time
+from pathlib import Path
+import pytest
+import compilers
+
+TEST_SOL_FILES = Path(__file__).resolve().parents[2] / "test_sol_files"
+
+# versions solc-select can install in these tests
+AVAILABLE = ["0.4.24", "0.4.26", "0.5.17", "0.6.2", "0.6.12", "0.7.6", "0.8.0", "0.8.1", "0.8.4", "0.8.19", "0.8.24"]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = compilers.CompilerManager(tmp_path / "artifacts")
+    manager._available = list(AVAILABLE)
+    return manager
+
+
+# install a fake compiler where solc-select >= 1.0 puts it
+def install(manager, version):
+    folder = manager.artifacts_dir / f"solc-{version}"
+    folder.mkdir(parents=True)
+    (folder / f"solc-{version}").write_text("")
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("ActivityPool.sol", "0.8.24"), # ^0.8.1
+    ("Sample.sol", "0.8.4"),
+    ("export.sol", "0.8.1"),
+])
+def test_test_sol_files(manager, name, expected):
+    constraints = compilers.pragma_constraints((TEST_SOL_FILES / name).read_text())
+    assert constraints
+    assert manager.resolve_version(constraints) == expected
+
+
+def test_every_test_sol_file_resolves(manager):
+    for path in TEST_SOL_FILES.glob("*.sol"):
+        constraints = compilers.pragma_constraints(path.read_text())
+        version = compilers.parse_version(manager.resolve_version(constraints))
+        assert all(compilers.satisfies(version, compilers.parse_constraint(c)) for c in constraints), path.name
+
+
+@pytest.mark.parametrize("constraint, expected", [
+    ("^0.8.0", "0.8.24"),
+    ("^0.7.0", "0.7.6"),
+    ("^0.4.24", "0.4.26"),
+    ("~0.8.1", "0.8.24"),
+    ("0.8.4", "0.8.4"),
+    ("=0.8.1", "0.8.1"),
+    ("0.6.x", "0.6.12"),
+    (">=0.6.2 <0.8.0", "0.7.6"),
+    (">=0.6.0 <0.6.12", "0.6.2"),
+    (">= 0.8.1 <= 0.8.4", "0.8.4"),
+    (">0.8.19", "0.8.24"),
+    ("0.8.0 - 0.8.3", "0.8.1"),
+    ("0.5.x || 0.6.x", "0.6.12"),
+    ("^0.4.24 || ^0.5.0", "0.5.17"),
+    ("<0.5.0 || >=0.8.1 <0.8.5", "0.8.4"),
+])
+def test_ranges(manager, constraint, expected):
+    assert manager.resolve_version([constraint]) == expected
+
+
+@pytest.mark.parametrize("constraint", ["^0.9.0", ">=0.8.25", "0.3.x || 0.9.x", ">=0.8.0 <0.7.0"])
+def test_unsatisfiable(manager, constraint):
+    with pytest.raises(ValueError):
+        manager.resolve_version([constraint])
+
+
+@pytest.mark.parametrize("constraint", ["", "^", "0.8.0 ||", "latest", ">=0.8.0 - 0.8.4"])
+def test_invalid_ranges(constraint):
+    with pytest.raises(ValueError):
+        compilers.parse_constraint(constraint)
+
+
+def test_multiple_pragmas(manager):
+    source = """
+        pragma solidity ^0.8.0;
+        import "./A.sol";
+        pragma solidity >=0.8.1 <0.8.20;
+        contract C {}
+    """
+    assert compilers.pragma_constraints(source) == ["^0.8.0", ">=0.8.1 <0.8.20"]
+    assert manager.resolve_version(compilers.pragma_constraints(source)) == "0.8.19"
+    # the pragmas of the files of a project are resolved together
+    assert manager.resolve_version(["^0.8.0", ">=0.8.1 <0.8.20", "<0.8.5"]) == "0.8.4"
+    with pytest.raises(ValueError):
+        manager.resolve_version(["^0.8.0", "^0.7.0"])
+
+
+def test_multiline_pragma():
+    assert compilers.pragma_constraints("pragma   solidity\n    >=0.6.2\n    <0.9.0 ;") == [">=0.6.2 <0.9.0"]
+
+
+def test_long_license_header(manager):
+    header = "\n".join(
+        [" * Copyright (c) 2023, the authors. pragma solidity ^0.4.0; is the old header of this file"] * 200
+    )
+    source = f"""// SPDX-License-Identifier: MIT
+// pragma solidity ^0.5.0;
+/*
+{header}
+ */
+pragma solidity ^0.8.1; // pragma solidity 0.8.0;
+/* pragma solidity 0.6.12; */ contract C {{}}
+"""
+    assert compilers.pragma_constraints(source) == ["^0.8.1"]
+    assert manager.resolve_version(compilers.pragma_constraints(source)) == "0.8.24"
+
+
+def test_prefers_installed_versions(manager):
+    install(manager, "0.8.19")
+    install(manager, "0.7.6")
+    # the newest installed version satisfying the constraints, even if a newer one can be installed
+    assert manager.resolve_version(["^0.8.0"]) == "0.8.19"
+    assert manager.resolve_version([">=0.7.0"]) == "0.8.19"
+    # an installable version when no installed version satisfies them
+    assert manager.resolve_version(["^0.6.0"]) == "0.6.12"
+    assert manager.resolve_version([">=0.8.20"]) == "0.8.24"
+
+
+def test_solc_path_of_installed_version(manager):
+    install(manager, "0.8.4")
+    assert manager.solc_path("0.8.4") == str(manager.artifacts_dir / "solc-0.8.4" / "solc-0.8.4")
+
+
+def test_memoized(manager, monkeypatch):
+    assert manager.resolve_version(["^0.8.0", "<0.8.5"]) == "0.8.4"
+    # the constraints are only parsed on the first resolution, in any order
+    monkeypatch.setattr(compilers, "parse_constraint", lambda constraint: pytest.fail("not memoized"))
+    assert manager.resolve_version(["<0.8.5", "^0.8.0", "^0.8.0"]) == "0.8.4"
+
+
+def test_memo_invalidated_by_install(manager):
+    assert manager.resolve_version(["^0.8.0"]) == "0.8.24"
+    # e.g., by prewarm or another worker
+    install(manager, "0.8.19")
+    assert manager.resolve_version(["^0.8.0"]) == "0.8.19"
+
+
+def test_memo_invalidated_by_installable_versions(manager):
+    manager._available = None
+    manager._available_failed_at = time.monotonic()
+    assert manager.resolve_version(["^0.8.0"]) == compilers.KNOWN_VERSIONS[-1]
+    # solc-select lists the installable versions again
+    manager._available = list(AVAILABLE)
+    assert manager.resolve_version(["^0.8.0"]) == "0.8.24"
+
+
+def test_offline(manager):
+    manager._available = None
+    manager._available_failed_at = time.monotonic() # solc-select could not list the versions, see available_versions
+    assert manager.available_versions() == []
+    # the newest known release, not the lowest version of the range
+    newest = max((v for v in compilers.KNOWN_VERSIONS if v.startswith("0.8.")), key=compilers.parse_version)
+    assert manager.resolve_version(["^0.8.0"]) == newest
+    assert manager.resolve_version(["0.8.4"]) == "0.8.4"
+    assert manager.resolve_version(["0.5.x || 0.6.x"]) == "0.6.12"
+    with pytest.raises(ValueError):
+        manager.resolve_version(["^0.9.0"])
+    # an installed version is still preferred
+    install(manager, "0.8.4")
+    assert manager.resolve_version(["^0.8.0"]) == "0.8.4"
@@ -134,7 +134,7 @@ const Search = ({
       <input
         type="text"
         id="query"
-        placeholder="Search here..."
+        placeholder="Search by contract name..."
         className="px-5 py-1.5 rounded-full border-2 border-blue-400 focus:outline-none focus:border-blue-600 transition-colors duration-300"
         // set the input value the current query
         value={query}
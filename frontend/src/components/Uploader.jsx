@@ -4,15 +4,80 @@ import { BeatLoader } from "react-spinners"; // for spinner component while file
 import api from "../api";
 import { useNavigate } from "react-router-dom";
 
+// interval between two job status requests while the audit is running, when the event stream is not available
+const JOB_POLL_INTERVAL_MS = 2000;
+
+// statuses of a finished audit job, an audit over its time, CPU or memory limit is timed_out or killed
+const FINAL_STATUSES = ["done", "failed", "timed_out", "killed"];
+
+// message shown under the spinner for each stage of the audit job
+const STAGE_MESSAGES = {
+  queued: "Your file is queued for auditing...",
+  running: "Your file is being processed...",
+  analysing: "Running Slither on your contract...",
+  cached: "This contract was already analysed, reusing its findings...",
+  filtering: "Collecting the findings...",
+  storing: "Saving the report...",
+};
+
 // File uploader component allows the user to upload smart contract files
 const Uploader = () => {
   const [selectedFile, selectFile] = useState(null); // store the selected file using useState
   const [error, setError] = useState(null); // for error msg if exists
   const [isLoading, setIsLoading] = useState(false); // for keeping track of the spinner loading state
+  const [progress, setProgress] = useState({ stage: null, findings: 0 }); // live progress of the audit job
 
   // get the navigate function from react-router-dom for redirection
   const navigate = useNavigate();
 
+  // function to follow the audit job with its event stream until it is either done or failed
+  // falls back to polling the job status if the stream is not available
+  const waitForJob = (jobId) =>
+    new Promise((resolve) => {
+      const events = new EventSource(`${api.defaults.baseURL}/jobs/${jobId}/events`);
+      let finished = false;
+
+      const finish = (job) => {
+        finished = true;
+        events.close();
+        resolve(job);
+      };
+
+      events.addEventListener("stage", (e) => {
+        const { stage } = JSON.parse(e.data);
+        setProgress((previous) => ({ ...previous, stage }));
+      });
+      events.addEventListener("findings", (e) => {
+        const { findings } = JSON.parse(e.data);
+        setProgress((previous) => ({ ...previous, findings }));
+      });
+      // the final event of the job, its status: done, failed, timed_out or killed
+      FINAL_STATUSES.forEach((status) =>
+        events.addEventListener(status, (e) => finish({ status, ...JSON.parse(e.data) }))
+      );
+
+      // the stream could not be opened or was interrupted, poll the job status instead
+      events.onerror = () => {
+        if (!finished) {
+          finished = true;
+          events.close();
+          resolve(pollJob(jobId));
+        }
+      };
+    });
+
+  // function to poll the audit job until it is either done or failed
+  const pollJob = async (jobId) => {
+    while (true) {
+      const { data: job } = await api.get(`/jobs/${jobId}`);
+      if (FINAL_STATUSES.includes(job.status)) {
+        return job;
+      }
+      // wait before asking for the job status again
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+  };
+
   // function to handle tasks when file is uploaded
   const handleFileUpload = async (e) => {
     e.preventDefault(); // prevent default behavior of the event
@@ -44,16 +109,25 @@ const Uploader = () => {
 
     try {
       setIsLoading(true); // set loading to true when starting the upload
+      setProgress({ stage: null, findings: 0 });
 
-      // make a POST request to the API endpoint
+      // make a POST request to the API endpoint, the audit is queued and runs in the background
       const response = await api.post("/upload_contract", formData);
 
-      if (response.status === 201) {
-        // show success notification
-        toast.success("Your smart contract has been audited successfully.");
-        // on successful upload (status code 201), navigate to the detailed report page
-        // response.data.report_id refer to the report_id returned by fastapi endpoint
-        navigate(`/reports/${response.data.report_id}`);
+      if (response.status === 202) {
+        // wait for the queued audit job to finish
+        // response.data.job_id refer to the job_id returned by fastapi endpoint
+        const job = await waitForJob(response.data.job_id);
+
+        if (job.status === "done") {
+          // show success notification
+          toast.success("Your smart contract has been audited successfully.");
+          // on successful audit, navigate to the detailed report page
+          navigate(`/reports/${job.report_id}`);
+        } else {
+          // the audit failed in the worker, show the error details of the job
+          setError(job.detail || "An error occurred while processing the file");
+        }
       } else if (response.status === 422) {
         // if has unprocessable entity 422 status code, set the error message
         setError("Invalid input data encoding format. Please try again.");
@@ -157,7 +231,12 @@ const Uploader = () => {
         {isLoading ? (
           <div className="flex flex-col justify-center items-center">
             <BeatLoader color="#1d4ed8" loading={true} />
-            <p>Your file is being processed. Please wait...</p>
+            <p>
+              {STAGE_MESSAGES[progress.stage] ||
+                "Your file is being processed. Please wait..."}
+            </p>
+            {/* number of findings parsed so far, once Slither has reported some */}
+            {progress.findings > 0 && <p>{progress.findings} findings so far</p>}
           </div>
         ) : (
           // submit button
@@ -14,6 +14,8 @@ const DetailReport = () => {
   const [isLoading, setIsLoading] = useState(true); // state for loading spinner
   const [noVulnerabilities, setNoVulnerabilities] = useState(false); // state to track if there are no vulnerabilities
   const [error, setError] = useState(null); // state to handle server connection error msg
+  const [detectors, setDetectors] = useState({}); // state to store the detector documentation by check name
+  const [results, setResults] = useState({}); // state to store the loaded results and next offset by vulnerability type
 
   const navigate = useNavigate(); // useNavigate hook from react-router-dom
 
@@ -22,8 +24,17 @@ const DetailReport = () => {
     // async function to fetch report data from the api
     const getReport = async () => {
       try {
-        // make a GET request to API endpoint for each specific report
-        const { data } = await api.get(`/reports/${id}`);
+        // fetch the summary of the report (result counts only) and the detector documentation in parallel
+        // the documentation is the same for every report, so the browser caches it instead of fetching it again
+        const [{ data }, catalog] = await Promise.all([
+          api.get(`/reports/${id}`, { params: { view: "summary" } }),
+          api.get("/detectors").catch(() => ({ data: [] })), // the report can still be displayed without it
+        ]);
+        // index the detector documentation by check name
+        setDetectors(
+          Object.fromEntries(catalog.data.map((detector) => [detector.check, detector]))
+        );
+        setResults({}); // clear the results loaded for a previous report
         setReport(data); // update the report state with the fetched data
         setIsLoading(false); // make loading spinner disappear after has done fetching
         // set state based on the presence of vulnerabilities in the report, if true then display no vulnerabilities found msg
@@ -50,6 +61,30 @@ const DetailReport = () => {
     // dependency array includes id to ensure useEffect runs when id changes
   }, [id]);
 
+  // fetch the next page of results of a vulnerability type and append it to the loaded ones
+  const loadResults = async (vulnerabilityType) => {
+    const loaded = results[vulnerabilityType] || { results: [], nextOffset: 0 };
+    try {
+      const { data } = await api.get(
+        `/reports/${id}/vulnerabilities/${encodeURIComponent(vulnerabilityType)}/results`,
+        { params: { offset: loaded.nextOffset } }
+      );
+      setResults((previous) => ({
+        ...previous,
+        [vulnerabilityType]: {
+          results: [...loaded.results, ...data.results],
+          nextOffset: data.next_offset, // null on the last page
+        },
+      }));
+    } catch (error) {
+      // error handling
+      console.error("Error fetching results:", error);
+      toast.error(
+        "An error occurred while fetching the results. Please try again later."
+      );
+    }
+  };
+
   // render report details
   const renderReportDetails = () => (
     <section>
@@ -93,58 +128,83 @@ const DetailReport = () => {
   );
 
   // render each vulnerability and its details
-  const renderVulnerability = (v, index) => (
-    <section
-      key={index}
-      className="p-4 mb-4 border-b-2 last-of-type:border-none"
-    >
-      <h3 className="text-lg font-bold mb-2">
-        {/* display the vulnerability number and its result count */}
-        Vulnerability {index + 1} ({v.results.length}
-        {v.results.length === 1 ? " result" : " results"})
-      </h3>
-      {/* display a list of details for the vulnerability */}
-      <ul className="list-disc pl-6 mb-2">
-        {/* display each vulnerability detail as a list item */}
-        <li>
-          <span className="font-bold">Vulnerability type: </span>
-          {/* use react-markdown to convert markdown format stored in the db to html element */}
-          <ReactMarkdown
-            components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
-            children={v.vulnerability_type}
-          />
-        </li>
-        <li>
-          <span className="font-bold">Impact level: </span>
-          <ReactMarkdown components={{ a: MarkdownLink }} children={v.impact} />
-        </li>
-        <li>
-          <span className="font-bold">Confidence level: </span>
-          <ReactMarkdown
-            components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
-            children={v.confidence}
-          />
-        </li>
-        <li>
-          <span className="font-bold">Description: </span>
-          <ReactMarkdown
-            components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
-            children={v.description}
-          />
-        </li>
-        <li>
-          <span className="font-bold">Recommendation: </span>
-          <ReactMarkdown
-            components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
-            children={v.recommendation}
-          />
-        </li>
-      </ul>
-      <h4 className="font-bold text-lg">Results:</h4>
-      {/* render each result and its details  */}
-      <ul className="list-none pl-6">{v.results.map(renderResult)}</ul>
-    </section>
-  );
+  const renderVulnerability = (v, index) => {
+    // the documentation of the detector, from the detector catalog
+    const detector = detectors[v.vulnerability_type];
+    // the results of this vulnerability loaded so far, if any
+    const loaded = results[v.vulnerability_type];
+    return (
+      <section
+        key={index}
+        className="p-4 mb-4 border-b-2 last-of-type:border-none"
+      >
+        <h3 className="text-lg font-bold mb-2">
+          {/* display the vulnerability number and its result count */}
+          Vulnerability {index + 1} ({v.number_of_results}
+          {v.number_of_results === 1 ? " result" : " results"})
+        </h3>
+        {/* display a list of details for the vulnerability */}
+        <ul className="list-disc pl-6 mb-2">
+          {/* display each vulnerability detail as a list item */}
+          <li>
+            <span className="font-bold">Vulnerability type: </span>
+            {/* use react-markdown to convert markdown format stored in the db to html element */}
+            <ReactMarkdown
+              components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
+              children={v.vulnerability_type}
+            />
+          </li>
+          <li>
+            <span className="font-bold">Impact level: </span>
+            <ReactMarkdown components={{ a: MarkdownLink }} children={v.impact} />
+          </li>
+          <li>
+            <span className="font-bold">Confidence level: </span>
+            <ReactMarkdown
+              components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
+              children={v.confidence}
+            />
+          </li>
+          <li>
+            <span className="font-bold">Description: </span>
+            <ReactMarkdown
+              components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
+              children={
+                detector
+                  ? detector.description
+                  : `Description not found for check: ${v.vulnerability_type}`
+              }
+            />
+          </li>
+          <li>
+            <span className="font-bold">Recommendation: </span>
+            <ReactMarkdown
+              components={{ a: MarkdownLink }} // set anchor tag of react-markdown to be clickable
+              children={
+                detector
+                  ? detector.recommendation
+                  : `Recommendation not found for: ${v.vulnerability_type}`
+              }
+            />
+          </li>
+        </ul>
+        <h4 className="font-bold text-lg">Results:</h4>
+        {/* render each result loaded so far and its details  */}
+        {loaded && (
+          <ul className="list-none pl-6">{loaded.results.map(renderResult)}</ul>
+        )}
+        {/* the results are loaded page by page on demand, as a report can have thousands of them */}
+        {(!loaded || loaded.nextOffset !== null) && (
+          <button
+            onClick={() => loadResults(v.vulnerability_type)}
+            className="px-4 py-1 mt-2 ml-6 bg-blue-500 text-white rounded-full hover:bg-blue-600 transition-colors duration-200"
+          >
+            {loaded ? "Load more results" : "Show results"}
+          </button>
+        )}
+      </section>
+    );
+  };
 
   // render each result and its details
   const renderResult = (result, resultIndex) => (
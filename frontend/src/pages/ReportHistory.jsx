@@ -1,79 +1,68 @@
 import { toast } from "react-hot-toast";
 import { TITLE1_CSS_CONFIGURATION } from "../constant";
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import Search from "../components/Search";
 import ReportList from "../components/ReportList";
 import api from "../api";
 import { BeatLoader } from "react-spinners";
 import { Link } from "react-router-dom";
 
+// number of reports fetched per page
+const REPORTS_PAGE_SIZE = 50;
+// delay after the last keystroke before searching, in milliseconds
+const SEARCH_DELAY_MS = 300;
+
 // this component represents a page that displays a list of reports
 const ReportHistory = () => {
   // state variables to manage various aspects of the component's state
   const [reports, setReports] = useState([]); // to manage report data
+  const [nextCursor, setNextCursor] = useState(null); // cursor of the next page of reports, null on the last page
   const [query, setQuery] = useState(""); // to manage search query, by default, the query is empty
   const [sortBy, setSortBy] = useState("submission_date"); // to manage sort field, by default, sort by submission date field
   const [orderBy, setOrderBy] = useState("desc"); // to manage sort order, by default, the report list is displayed in ascending order
   const [error, setError] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
+  // number of the latest request, so that the response of an older search or sort is ignored
+  const latestRequest = useRef(0);
 
-  // trigger after the component is mounted
+  // get the first page of reports after the component is mounted and each time the search or sort changes
+  // the reports are searched and sorted by the server, as only some of their pages are loaded here
   useEffect(() => {
-    getAllReportData();
-  }, []);
-
-  // function to check if a report matches the current query
-  const matchesQuery = (report) => {
-    // filter reports based on various fields using the "query" state variable
-    // convert both report field and query to lower case for case-insensitive search
-    // check if each field e.g. contract name, submission time, etc. contains the query
-    return (
-      report.report_id.toString().includes(query) ||
-      report.contract_name.toLowerCase().includes(query.toLowerCase()) ||
-      report.number_of_vulnerabilities.toString().includes(query) ||
-      report.submission_date.includes(query) ||
-      report.submission_time.toLowerCase().includes(query.toLowerCase())
-    );
-  }
+    // wait for the user to stop typing before searching
+    const timeout = setTimeout(() => getAllReportData(), query ? SEARCH_DELAY_MS : 0);
+    return () => clearTimeout(timeout);
+  }, [query, sortBy, orderBy]);
 
-  const sortReports = (a, b) => {
-    // determine sorting order based on orderBy value
-    const sortingOrder = orderBy === "asc" ? -1 : 1;
-  
-    // if sorting by submission_date field
-    if (sortBy === "submission_date") {
-      // convert submission dates and times to Date objects for comparison
-      const dateA = new Date(`${a.submission_date} ${a.submission_time}`);
-      const dateB = new Date(`${b.submission_date} ${b.submission_time}`);
-  
-      // compare dates
-      if (dateA < dateB) {
-        return 1 * sortingOrder; // return 1 for ascending order, -1 for descending order
-      }
-      if (dateA > dateB) {
-        return -1 * sortingOrder;  // return -1 for ascending order, 1 for descending order
-      }
-  
-      // if dates are the same, sort by report_id to display the latest report on top
-      return (b.report_id - a.report_id) * sortingOrder;
-    } else {
-      // default sorting by other fields if not sorting by submission_date
-      // compare other fields in ascending or descending order based on sortingOrder
-      return a[sortBy].toString().toLowerCase() < b[sortBy].toString().toLowerCase()
-        ? 1 * sortingOrder // sort in ascending order
-        : -1 * sortingOrder; // sort in descending order
-    }
-  };
-  
-
-  // get all the report each time the page is rendered
-  async function getAllReportData() {
+  // get the first page of reports matching the search, or the next page when a cursor is given
+  async function getAllReportData(cursor = null) {
+    const request = ++latestRequest.current;
     try {
       setIsLoading(true); // set loading spinner to true to indicate that the page is loading
-      const reportData = await api.get("/reports/"); // get all reports from the database api
-      setReports(reportData.data); // update the report state with the fetched data
+      // get a page of reports from the database api, with the contract names starting with the query,
+      // in the selected sort field and order
+      const reportData = await api.get("/reports/", {
+        params: {
+          limit: REPORTS_PAGE_SIZE,
+          cursor: cursor || undefined,
+          contract_name: query.trim() || undefined,
+          sort_by: sortBy,
+          order: orderBy,
+        },
+      });
+      // a newer search or sort was requested in the meantime
+      if (request !== latestRequest.current) {
+        return;
+      }
+      // update the report state with the fetched data, appending the next pages to the reports already loaded
+      setReports((previous) =>
+        cursor ? [...previous, ...reportData.data.reports] : reportData.data.reports
+      );
+      setNextCursor(reportData.data.next_cursor);
       setError(null); // reset the error state
     } catch (error) {
+      if (request !== latestRequest.current) {
+        return;
+      }
       // if has 404 status code, meaning no report with given id found
       if (error.response && error.response.status === 404) {
         setError(
@@ -88,7 +77,9 @@ const ReportHistory = () => {
         );
       }
     } finally {
-      setIsLoading(false); // set loading spinner to false to indicate that the page has finished loading
+      if (request === latestRequest.current) {
+        setIsLoading(false); // set loading spinner to false to indicate that the page has finished loading
+      }
     }
   }
 
@@ -97,16 +88,6 @@ const ReportHistory = () => {
     await api.delete("/reports/" + id); // delete the report from the database api
   };
 
-  // filter and sort the reports based on search and sort criteria
-  const filteredReports = () => {
-    if (Array.isArray(reports)) {
-      // check if reports is an array to avoid errors
-      return reports.filter(matchesQuery).sort(sortReports); // filter and sort the reports
-    } else {
-      return []; // return an empty array if reports is not an array
-    }
-  };
-
   // function to handle report deletion
   const handleDelete = async (report_id) => {
     try {
@@ -163,7 +144,23 @@ const ReportHistory = () => {
 
       {/* Display list of reports if there is no error and data is not loading */}
       {!isLoading && !error && (
-        <ReportList reports={filteredReports()} onDelete={handleDelete} />
+        <ReportList
+          // check if reports is an array to avoid errors
+          reports={Array.isArray(reports) ? reports : []}
+          onDelete={handleDelete}
+        />
+      )}
+
+      {/* load the next page of reports if there is one */}
+      {!isLoading && !error && nextCursor && (
+        <div className="flex justify-center mt-4">
+          <button
+            className="items-center inline-block transition-colors duration-200 bg-blue-500 hover:bg-blue-600 text-white hover:text-gray-200 rounded py-2 px-4"
+            onClick={() => getAllReportData(nextCursor)}
+          >
+            Load more
+          </button>
+        </div>
       )}
     </div>
   );